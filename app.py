@@ -3,12 +3,15 @@ from datetime import datetime
 
 from flask import Flask, render_template, request, jsonify, send_file, stream_with_context, Response
 import os
+import queue
 import shutil
+import threading
+import uuid
 from pathlib import Path
+from typing import Optional
 
 from langchain.chains.conversation.base import ConversationChain
 from langchain_core.chat_history import InMemoryChatMessageHistory
-from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnableWithMessageHistory
 import requests
@@ -19,21 +22,29 @@ load_dotenv()
 
 from main import read_website_content
 from youtube_transcript_fetcher import get_youtube_transcript, extract_video_id
-from audio_config import ASR_BACKEND, TTS_BACKEND
+from audio_config import ASR_BACKEND, TTS_BACKEND, INCREMENTAL_TTS
 if ASR_BACKEND == "qwen_omni":
     from qwen_omni_backend import get_transcript_via_qwen as get_transcript_via_whisper
 else:
     from whisper_transcriber import get_transcript_via_whisper
 from system_prompts import news_explainer_system_message, subject_matter_expert_prompt
-from condenser_service import condense_content
+from condenser_service import (
+    condense_content, condense_batch, plan_condense_batches, build_summary_pyramid, FINAL_CONSOLIDATION_THRESHOLD,
+)
 from condensation_cache import (
     compute_cache_key,
     load_checkpoint,
     create_checkpoint,
     save_checkpoint,
     get_progress_summary,
+    get_io_stats,
+    record_stage_metric,
+    aggregate_stage_metrics,
     purge_expired_checkpoints,
+    reset_for_content_update,
 )
+from map_result_cache import get_map_cache_stats
+from summary_pyramid import SUMMARY_PYRAMID_MODE, cached_summary, pyramid_is_current, summary_request_level
 from langchain.memory import ConversationBufferWindowMemory
 from langchain.prompts import PromptTemplate
 from langchain.callbacks import get_openai_callback
@@ -42,8 +53,10 @@ if TTS_BACKEND == "qwen_omni":
     from kokoro_tts import create_audio_file
 else:
     from kokoro_tts import generate_audio, create_audio_file
-from llm_models import get_model
-from utils import remove_thinking_tokens, create_backup_file, parse_backup_file, list_backup_files
+from incremental_tts import IncrementalTTS
+from llm_calls import EARLY_STOP, get_hedge_stats
+from llm_models import get_concurrency_stats, get_limiter, get_model, resolve_stage_models
+from utils import FinalScriptExtractor, remove_thinking_tokens, create_backup_file, parse_backup_file, list_backup_files
 from email_sender import send_email_with_audio, send_email_with_attachments
 from telegram_sender import send_telegram_with_audio, send_telegram_with_attachments
 
@@ -58,6 +71,19 @@ current_mode = None
 session_history = InMemoryChatMessageHistory()
 current_model_key = os.getenv("DEFAULT_MODEL_KEY", "mlx_community_qwen_stream_local_llm")
 current_model = get_model(current_model_key)
+# Condenser model per stage (CONDENSER_MAP_MODEL / _REDUCE_ / _CONSOLIDATION_); part of the checkpoint key
+condenser_stage_models = resolve_stage_models(current_model_key)
+# /load_content_stream sends an SSE comment when no event arrived for this long
+LOAD_STREAM_KEEPALIVE_SECONDS = 15
+# (checkpoint_key, checkpoint) of the document loaded for Q&A; summary requests are served from its pyramid
+current_checkpoint = None
+# One summary pyramid build at a time: a chat request waits for an eager build instead of repeating it
+_pyramid_lock = threading.Lock()
+# /load_content_batch jobs by id: their TTS / Telegram steps run on a background
+# thread and GET /load_content_batch/<job_id> reports them; the oldest are forgotten
+_batch_jobs = {}
+_batch_jobs_lock = threading.Lock()
+BATCH_JOBS_KEPT = 50
 
 def check_llm_server():
     """Check if the local LLM server is running"""
@@ -110,7 +136,10 @@ def create_runnable_chain(mode):
         ("human", "{input}")
     ])
 
-    base_chain = chat_prompt_template | current_model | StrOutputParser()
+    # No StrOutputParser: a parser step drains the model stream when the caller
+    # stops reading, which would defeat /streamChat's early stop.  Callers read
+    # ``.content`` from the returned message (chunks).
+    base_chain = chat_prompt_template | current_model
 
     return RunnableWithMessageHistory(
         runnable=base_chain,  # 'runnable' is the required keyword
@@ -125,23 +154,118 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/load_content', methods=['POST'])
-def load_content():
-    """Load content, condense it using condenser_service, and prepare for Q&A"""
-    global conversation_chain, current_mode, current_model
+def _fetch_news_article(url: str, checkpoint_key: str, checkpoint: dict):
+    """Load a news article into checkpoint["raw_content"] and save it; None if it could not be loaded."""
+    fetch_started = time.time()
+    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Loading news article from: {url}")
+    documents = read_website_content(url)
+    if not documents:
+        print(f"[ERROR] Failed to load article from: {url}")
+        return None
+    raw_content = documents[0].page_content
+    checkpoint["raw_content"] = raw_content
+    checkpoint["source"] = "news_loader"
+    record_stage_metric(checkpoint, "fetch", time.time() - fetch_started, source="news_loader", chars=len(raw_content))
+    save_checkpoint(checkpoint_key, checkpoint)
+    print(f"[SUCCESS] Article loaded: {len(raw_content)} chars")
+    return raw_content
+
+
+def _refresh_news_article(url: str, checkpoint_key: str, checkpoint: dict) -> bool:
+    """Re-fetch a cached news article; True if it changed and the checkpoint was reset for it.
+
+    An edited article keeps its checkpoint: reset_for_content_update() clears
+    everything derived from the old text but keeps finished condenser steps
+    reusable, so only the changed regions are condensed again.
+    """
+    fetch_started = time.time()
+    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Refresh: re-fetching news article from: {url}")
+    documents = read_website_content(url)
+    if not documents:
+        print(f"[WARNING] Refresh failed for {url}, keeping the cached article")
+        return False
+    raw_content = documents[0].page_content
+    if raw_content == checkpoint.get("raw_content"):
+        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Refresh: article unchanged")
+        return False
+    reusable = reset_for_content_update(checkpoint, raw_content)
+    record_stage_metric(checkpoint, "fetch", time.time() - fetch_started, source="news_loader", chars=len(raw_content))
+    save_checkpoint(checkpoint_key, checkpoint)
+    print(
+        f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Refresh: article changed "
+        f"({len(raw_content)} chars), {reusable} condenser step(s) reusable"
+    )
+    return True
+
+
+def _ensure_summary_pyramid(checkpoint_key: str, checkpoint: dict) -> bool:
+    """Build the document's summary pyramid unless a current one is cached; True when available."""
+    with _pyramid_lock:
+        if pyramid_is_current(checkpoint):
+            return True
+        try:
+            return build_summary_pyramid(checkpoint, current_model, checkpoint_key=checkpoint_key) is not None
+        except Exception as e:
+            print(f"[ERROR] Summary pyramid failed: {e}")
+            return False
+
+
+def _cached_summary_answer(user_input: str):
+    """(level, text) when ``user_input`` is a summary request the pyramid can answer, else None.
+
+    The answer is recorded in the chat history like a generated reply, so
+    follow-up questions see it.
+    """
+    if SUMMARY_PYRAMID_MODE == "off" or current_checkpoint is None:
+        return None
+    level = summary_request_level(user_input)
+    if level is None:
+        return None
+    checkpoint_key, checkpoint = current_checkpoint
+    if level != "full" and not _ensure_summary_pyramid(checkpoint_key, checkpoint):
+        return None
+    text = cached_summary(checkpoint, level)
+    if text is None:
+        return None
+    session_history.add_user_message(user_input)
+    session_history.add_ai_message(f"<final_script>\n{text}\n</final_script>")
+    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Answered from summary pyramid: level={level} ({len(text)} chars)")
+    return level, text
+
+
+def _load_document(data: dict, on_progress=None, loaded=None) -> tuple[dict, int, Optional[dict]]:
+    """Fetch, condense, voice and (optionally) send one URL to Telegram.
+
+    Leaves the chat session alone — _process_content() starts Q&A on the result;
+    /load_content_batch uses this directly.
+
+    Args:
+        data:        Request JSON (url, mode, auto_send_telegram, category, fetch_mode,
+                     refresh — re-fetch a cached news article and re-condense what changed).
+        on_progress: Optional callback(event, payload) receiving stage progress and
+                     finished REDUCE batches as they happen.  Called from this thread
+                     and from condenser worker threads.
+        loaded:      (checkpoint_key, checkpoint) the caller already loaded for this
+                     URL (/load_content_batch), used instead of reading it again.
+
+    Returns:
+        (response_payload, http_status, document) — document is None unless the
+        load succeeded, else {mode, checkpoint_key, checkpoint, content,
+        raw_word_count, condensed_word_count} for _start_qa_session().
+    """
 
-    data = request.json
     url = data.get('url')
     mode = data.get('mode', 'news')  # 'news' or 'youtube'
     auto_send_telegram = data.get('auto_send_telegram', False)  # Only true for auto-processor
     category = data.get('category', 'tech')  # 'tech', 'social', or 'science'
     fetch_mode = data.get('fetch_mode', 'transcript')  # 'transcript' or 'audio'
+    refresh = bool(data.get('refresh', False))  # news only: articles are edited after publication
 
     if not url:
-        return jsonify({'error': 'URL is required'}), 400
+        return {'error': 'URL is required'}, 400, None
 
     if mode not in ['news', 'youtube']:
-        return jsonify({'error': 'Invalid mode. Use "news" or "youtube"'}), 400
+        return {'error': 'Invalid mode. Use "news" or "youtube"'}, 400, None
 
     if fetch_mode not in ['transcript', 'audio']:
         print(f"[WARNING] Invalid fetch_mode '{fetch_mode}', defaulting to 'transcript'")
@@ -149,10 +273,10 @@ def load_content():
 
     # Audio queue only makes sense for YouTube — reject non-YouTube URLs early
     if fetch_mode == 'audio' and mode != 'youtube':
-        return jsonify({
+        return {
             'error': 'Audio queue only supports YouTube URLs. Use the Transcript queue for news articles.',
             'success': False
-        }), 400
+        }, 400, None
 
     if category not in ['tech', 'social', 'science']:
         print(f"[WARNING] Invalid category '{category}', defaulting to 'tech'")
@@ -167,7 +291,7 @@ def load_content():
     if mode == 'youtube':
         _vid = extract_video_id(url)
         if not _vid:
-            return jsonify({'error': 'Invalid YouTube URL format.', 'success': False}), 400
+            return {'error': 'Invalid YouTube URL format.', 'success': False}, 400, None
         url = f"https://www.youtube.com/watch?v={_vid}"
         print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Normalised YouTube URL → {url}")
 
@@ -175,10 +299,15 @@ def load_content():
     # Checkpoint setup — compute key before any I/O so every stage can
     # save progress and a retry resumes from where it stopped.
     # ------------------------------------------------------------------
-    checkpoint_key = compute_cache_key(url, mode, current_model_key, fetch_mode)
-    checkpoint = load_checkpoint(checkpoint_key)
+    if loaded is not None:
+        checkpoint_key, checkpoint = loaded
+    else:
+        checkpoint_key = compute_cache_key(url, mode, current_model_key, fetch_mode, condenser_stage_models)
+        checkpoint = load_checkpoint(checkpoint_key)
     if checkpoint is None:
-        checkpoint_key, checkpoint = create_checkpoint(url, mode, current_model_key, fetch_mode)
+        checkpoint_key, checkpoint = create_checkpoint(
+            url, mode, current_model_key, fetch_mode, condenser_stage_models
+        )
     else:
         print(
             f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
@@ -188,10 +317,19 @@ def load_content():
 
     audio_time = None  # declared early so except blocks can reference it
 
+    def _emit(event, **payload):
+        if on_progress is None:
+            return
+        try:
+            on_progress(event, {**payload, 'progress': get_progress_summary(checkpoint)})
+        except Exception as e:
+            print(f"[WARNING] load_content: progress callback failed for '{event}': {e}")
+
+    _emit('stage', stage='start', checkpoint_key=checkpoint_key)
+
     try:
-        # Initialize conversation chain for the selected mode
-        conversation_chain = create_runnable_chain(mode)
-        current_mode = mode
+        if refresh and mode == 'news' and checkpoint.get("raw_content"):
+            _refresh_news_article(url, checkpoint_key, checkpoint)
 
         # --------------------------------------------------------------
         # Full cache hit: audio already generated and file still on disk
@@ -211,6 +349,7 @@ def load_content():
             raw_word_count = len((checkpoint.get("raw_content") or "").split())
             condensed_word_count = len(condensed_content.split())
             _cache_hit = True
+            _emit('stage', stage='cache_hit')
             print(
                 f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
                 f"Full cache hit — video_id={_video_id} audio={audio_file}"
@@ -220,6 +359,8 @@ def load_content():
             # -----------------------------------------------------------
             # Step 1: Fetch raw content (resume if already cached)
             # -----------------------------------------------------------
+            _emit('stage', stage='fetch')
+            fetch_started = time.time()
             if checkpoint.get("raw_content"):
                 raw_content = checkpoint["raw_content"]
                 print(
@@ -228,16 +369,9 @@ def load_content():
                     f"source={checkpoint.get('source')}"
                 )
             elif mode == 'news':
-                print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Loading news article from: {url}")
-                documents = read_website_content(url)
-                if not documents:
-                    print(f"[ERROR] Failed to load article from: {url}")
-                    return jsonify({'error': 'Could not load article from URL'}), 400
-                raw_content = documents[0].page_content
-                checkpoint["raw_content"] = raw_content
-                checkpoint["source"] = "news_loader"
-                save_checkpoint(checkpoint_key, checkpoint)
-                print(f"[SUCCESS] Article loaded: {len(raw_content)} chars")
+                raw_content = _fetch_news_article(url, checkpoint_key, checkpoint)
+                if raw_content is None:
+                    return {'error': 'Could not load article from URL'}, 400, None
 
             elif mode == 'youtube':
                 # url is already normalised to watch?v=ID — extract_video_id always succeeds here
@@ -254,9 +388,10 @@ def load_content():
                     raw_content = get_transcript_via_whisper(url, video_id)
                     if raw_content.startswith("Error:"):
                         print(f"[ERROR] ASR transcription failed: {raw_content}")
-                        return jsonify({'error': raw_content, 'success': False}), 400
+                        return {'error': raw_content, 'success': False}, 400, None
                     checkpoint["raw_content"] = raw_content
                     checkpoint["source"] = ASR_BACKEND
+                    record_stage_metric(checkpoint, "fetch", time.time() - fetch_started, source=ASR_BACKEND, chars=len(raw_content))
                     save_checkpoint(checkpoint_key, checkpoint)
                     print(f"[SUCCESS] {ASR_BACKEND} transcript obtained: {len(raw_content)} chars")
                 else:
@@ -271,14 +406,26 @@ def load_content():
                         or raw_content.startswith("Error:")
                     ):
                         print(f"[ERROR] YouTube transcript fetch failed: {raw_content}")
-                        return jsonify({'error': raw_content, 'success': False}), 400
+                        return {'error': raw_content, 'success': False}, 400, None
                     checkpoint["raw_content"] = raw_content
                     checkpoint["source"] = "youtube_fetcher"
+                    record_stage_metric(checkpoint, "fetch", time.time() - fetch_started, source="youtube_fetcher", chars=len(raw_content))
                     save_checkpoint(checkpoint_key, checkpoint)
                     print(f"[SUCCESS] YouTube transcript fetched: {len(raw_content)} chars")
 
             raw_word_count = len(raw_content.split())
 
+            # Voices each finished REDUCE batch while the next one is condensing
+            incremental_tts = (
+                IncrementalTTS(generate_audio, checkpoint_key, checkpoint, FINAL_CONSOLIDATION_THRESHOLD)
+                if INCREMENTAL_TTS else None
+            )
+
+            def _on_condense_progress(event, payload):
+                if incremental_tts is not None:
+                    incremental_tts.on_progress(event, payload)
+                _emit(event, **payload)
+
             # -----------------------------------------------------------
             # Step 2: Condense (resume if final_output already cached)
             # -----------------------------------------------------------
@@ -291,8 +438,21 @@ def load_content():
                 )
             else:
                 print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Condensing content...")
-                condensed_content = condense_content(
-                    raw_content, current_model, checkpoint_key, checkpoint
+                _emit('stage', stage='condense', raw_chars=len(raw_content))
+                condense_started = time.time()
+                try:
+                    condensed_content = condense_content(
+                        raw_content, current_model, checkpoint_key, checkpoint, current_model_key,
+                        on_progress=_on_condense_progress, stage_models=condenser_stage_models,
+                    )
+                except Exception:
+                    if incremental_tts is not None:
+                        incremental_tts.close()
+                    raise
+                # Persisted with the audio path in Step 3
+                record_stage_metric(
+                    checkpoint, "condense", time.time() - condense_started,
+                    raw_chars=len(raw_content), condensed_chars=len(condensed_content),
                 )
                 print(
                     f"[SUCCESS] Condensed: {len(raw_content)} -> {len(condensed_content)} chars"
@@ -310,28 +470,38 @@ def load_content():
                 f"Generating audio ({len(condensed_content)} chars)..."
             )
             audio_start_time = time.time()
+            _emit('stage', stage='audio', condensed_chars=len(condensed_content))
 
             try:
-                audio = generate_audio(condensed_content)
+                audio = incremental_tts.finish(condensed_content) if incremental_tts is not None else None
+                incremental = audio is not None
+                if audio is None:
+                    audio = generate_audio(condensed_content)
                 audio_file_path = create_audio_file(audio)
                 audio_file = os.path.basename(audio_file_path)
                 # Save audio path BEFORE building the response to avoid losing it on crash
                 checkpoint["audio_file_path"] = str(audio_file_path)
-                save_checkpoint(checkpoint_key, checkpoint)
+                if incremental_tts is not None:
+                    incremental_tts.cleanup()
                 audio_time = time.time() - audio_start_time
+                record_stage_metric(
+                    checkpoint, "tts", audio_time, chars=len(condensed_content), incremental=incremental,
+                )
+                save_checkpoint(checkpoint_key, checkpoint)
                 print(f"[SUCCESS] Audio generated: {audio_file}")
                 print(f"[TIME] Audio generation took: {audio_time:.2f}s")
             except Exception as e:
                 error_msg = f"Audio generation failed: {e}"
                 print(f"[ERROR] {error_msg}")
                 if auto_send_telegram:
-                    return jsonify({'error': error_msg, 'success': False}), 422
+                    return {'error': error_msg, 'success': False}, 422, None
                 # For manual load, audio failure is not critical
                 print(f"[WARNING] Continuing without audio")
         
         # Step 4: Send to Telegram only if auto_send_telegram is True
         if auto_send_telegram:
             print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Auto-sending to Telegram (category: {category})...")
+            _emit('stage', stage='telegram')
             try:
                 bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
                 
@@ -359,17 +529,17 @@ def load_content():
                 chat_id = chat_map.get(category)
                 if not chat_id:
                     print(f"[ERROR] TELEGRAM_CHAT_ID_{category.upper()} not set")
-                    return jsonify({'error': f'Discussion group for {category} not configured', 'success': False}), 422
+                    return {'error': f'Discussion group for {category} not configured', 'success': False}, 422, None
                 
                 if not chat_id or not bot_token:
                     error_msg = "Telegram credentials not configured (TELEGRAM_CHAT_ID and TELEGRAM_BOT_TOKEN required)"
                     print(f"[ERROR] {error_msg}")
-                    return jsonify({'error': error_msg, 'success': False}), 422
+                    return {'error': error_msg, 'success': False}, 422, None
                 
                 if not audio_file_path:
                     error_msg = "Cannot send to Telegram: Audio file not generated"
                     print(f"[ERROR] {error_msg}")
-                    return jsonify({'error': error_msg, 'success': False}), 422
+                    return {'error': error_msg, 'success': False}, 422, None
                 
                 content_type = 'Article' if mode == 'news' else 'YouTube Video'
                 message = f"📝 Condensed {content_type}\n\n{condensed_content}"
@@ -394,7 +564,7 @@ def load_content():
                         print(f"[BACKUP] {error_msg}")
                     except Exception as backup_error:
                         print(f"[ERROR] Failed to create backup: {backup_error}")
-                    return jsonify({'error': error_msg, 'success': False}), 422
+                    return {'error': error_msg, 'success': False}, 422, None
                 
                 print(f"[SUCCESS] Content sent to Telegram successfully")
             except Exception as e:
@@ -407,16 +577,19 @@ def load_content():
                     print(f"[BACKUP] {error_msg}")
                 except Exception as backup_error:
                     print(f"[ERROR] Failed to create backup: {backup_error}")
-                return jsonify({'error': error_msg, 'success': False}), 422
+                return {'error': error_msg, 'success': False}, 422, None
         
-        # Step 5: Store condensed content in conversation memory for future Q&A
-        # The memory now contains: system prompt (from create_runnable_chain) + condensed input
-        session_history.add_user_message(f"Here is the condensed {'article' if mode == 'news' else 'video transcript'} content (Original: {raw_word_count} words, Condensed: {condensed_word_count} words):\n\n{condensed_content}")
-        session_history.add_ai_message(f"I have received and processed the condensed content. I'm ready to answer your questions about it.")
-        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Condensed content added to memory. Ready for Q&A.")
+        document = {
+            'mode': mode,
+            'checkpoint_key': checkpoint_key,
+            'checkpoint': checkpoint,
+            'content': condensed_content,
+            'raw_word_count': raw_word_count,
+            'condensed_word_count': condensed_word_count,
+        }
 
         # Return success only if everything succeeded
-        return jsonify({
+        return {
             'content': condensed_content,
             'mode': mode,
             'word_count': condensed_word_count,
@@ -426,22 +599,255 @@ def load_content():
             'from_cache': _cache_hit,
             'video_id': _video_id,
             'success': True
-        })
+        }, 200, document
 
     except ValueError as e:
         # ValueError is raised when thinking tokens aren't removed properly.
         # The checkpoint has already been saved with all progress so far;
         # the next retry will resume from the last successful step.
         print(f"[ERROR] Thinking token validation failed: {e}")
-        return jsonify({
+        return {
             'error': str(e),
             'success': False,
             'checkpoint_key': checkpoint_key,
             'resume_progress': get_progress_summary(checkpoint),
-        }), 422
+        }, 422, None
     except Exception as e:
         print(f"[ERROR] load_content failed: {e}")
-        return jsonify({'error': str(e), 'success': False}), 500
+        return {'error': str(e), 'success': False}, 500, None
+
+
+def _start_qa_session(document: dict) -> None:
+    """Make a loaded document the subject of /chat and /streamChat."""
+    global conversation_chain, current_mode, current_checkpoint
+    mode = document['mode']
+    conversation_chain = create_runnable_chain(mode)
+    current_mode = mode
+    # The memory now contains: system prompt (from create_runnable_chain) + condensed input
+    session_history.add_user_message(f"Here is the condensed {'article' if mode == 'news' else 'video transcript'} content (Original: {document['raw_word_count']} words, Condensed: {document['condensed_word_count']} words):\n\n{document['content']}")
+    session_history.add_ai_message(f"I have received and processed the condensed content. I'm ready to answer your questions about it.")
+    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Condensed content added to memory. Ready for Q&A.")
+    checkpoint_key, checkpoint = document['checkpoint_key'], document['checkpoint']
+    current_checkpoint = (checkpoint_key, checkpoint)
+    if SUMMARY_PYRAMID_MODE == "eager" and not pyramid_is_current(checkpoint):
+        threading.Thread(
+            target=_ensure_summary_pyramid, args=(checkpoint_key, checkpoint), name="summary-pyramid", daemon=True
+        ).start()
+
+
+def _process_content(data: dict, on_progress=None) -> tuple[dict, int]:
+    """Load one URL and start Q&A on it; shared by /load_content and /load_content_stream.
+
+    See _load_document() for ``data`` and ``on_progress``.
+
+    Returns:
+        (response_payload, http_status)
+    """
+    payload, status, document = _load_document(data, on_progress)
+    if document is not None:
+        _start_qa_session(document)
+    return payload, status
+
+
+@app.route('/load_content', methods=['POST'])
+def load_content():
+    """Load content, condense it using condenser_service, and prepare for Q&A"""
+    payload, status = _process_content(request.json or {})
+    return jsonify(payload), status
+
+
+@app.route('/load_content_stream', methods=['POST'])
+def load_content_stream():
+    """Same as /load_content, streamed as Server-Sent Events.
+
+    Emits {'event': 'stage', ...} progress events (with get_progress_summary()),
+    {'event': 'map_chunk', ...} as chunks finish and {'event': 'reduce_batch',
+    'total', 'total_estimated', 'text': ...} for every finished REDUCE batch, then one final {'done': True,
+    'status': <http status>, ...} event carrying the /load_content response body.
+    """
+    data = request.json or {}
+    events = queue.Queue()
+    result = {}
+
+    def on_progress(event, payload):
+        events.put({'event': event, **payload})
+
+    def run():
+        # Runs outside the request context; keeps going (and checkpointing) even
+        # if the client disconnects, so a retry resumes from the saved progress.
+        try:
+            result['payload'], result['status'] = _process_content(data, on_progress)
+        except Exception as e:
+            print(f"[ERROR] load_content_stream worker failed: {e}")
+            result['payload'], result['status'] = {'error': str(e), 'success': False}, 500
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run, name="load-content-stream", daemon=True).start()
+
+    def stream_events():
+        while True:
+            try:
+                event = events.get(timeout=LOAD_STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                # SSE comment: keeps proxies from closing the connection during long LLM calls
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            yield f"data:{json.dumps(event)}\n\n"
+        final_data = {'done': True, 'status': result['status'], **result['payload']}
+        yield f"data:{json.dumps(final_data)}\n\n"
+
+    return Response(stream_with_context(stream_events()),
+                    mimetype='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no',
+                         'Cache-Control': 'no-cache'
+                    })
+
+
+@app.route('/load_content_batch', methods=['POST'])
+def load_content_batch():
+    """Process several news URLs, condensing the short ones together.
+
+    Request JSON: {urls: [...], category, auto_send_telegram, refresh}.  Every article is
+    fetched (re-fetched with refresh) into its own checkpoint first; articles
+    short enough are then packed into shared single-pass LLM calls
+    (condenser_service.plan_condense_batches / condense_batch), which write each
+    script to that article's checkpoint.  The request returns once the batch calls
+    are done; every URL then goes through _load_document() on a background thread,
+    one at a time — batched articles resume from their cached final_output and go
+    straight to TTS / Telegram, the rest (long articles, or any the batch call
+    missed) are condensed on their own.  The chat session is left untouched: load
+    an article through /load_content to ask questions about it.
+
+    Returns 202 {job_id, status_url, urls, batched, batch_calls}; the per-URL results
+    are served by GET /load_content_batch/<job_id>.
+    """
+    data = request.json or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list) or not urls or not all(isinstance(u, str) and u for u in urls):
+        return jsonify({'error': 'urls must be a non-empty list of URLs', 'success': False}), 400
+    urls = list(dict.fromkeys(urls))  # one checkpoint per URL, even if repeated
+    refresh = bool(data.get('refresh', False))
+
+    # Fetch every article into its checkpoint; collect the ones still to condense
+    loaded = {}
+    pending = []
+    for url in urls:
+        checkpoint_key = compute_cache_key(url, 'news', current_model_key, 'transcript', condenser_stage_models)
+        checkpoint = load_checkpoint(checkpoint_key)
+        if checkpoint is None:
+            checkpoint_key, checkpoint = create_checkpoint(
+                url, 'news', current_model_key, 'transcript', condenser_stage_models
+            )
+        elif refresh and checkpoint.get("raw_content"):
+            # Before the batch plan, so an edited article (final_output cleared) is batched too
+            _refresh_news_article(url, checkpoint_key, checkpoint)
+        # _load_document() continues from this copy instead of reading the file again
+        loaded[url] = (checkpoint_key, checkpoint)
+        if checkpoint.get("final_output") or checkpoint.get("single_pass") is False:
+            continue  # already condensed, or already on the map-reduce path
+        raw_content = checkpoint.get("raw_content") or _fetch_news_article(url, checkpoint_key, checkpoint)
+        if raw_content:
+            pending.append((checkpoint_key, checkpoint, raw_content))
+
+    batches = plan_condense_batches(
+        [raw_content for _, _, raw_content in pending], condenser_stage_models.get("reduce") or current_model_key
+    )
+    batched = 0
+    for batch in batches:
+        results = condense_batch(
+            [pending[i][2] for i in batch], current_model, current_model_key,
+            stage_models=condenser_stage_models,
+            checkpoints=[(pending[i][0], pending[i][1]) for i in batch],
+        )
+        batched += sum(result is not None for result in results)
+
+    print(
+        f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Batch load: {len(urls)} URLs, "
+        f"{batched} condensed in {len(batches)} batch call(s); TTS / Telegram continue in the background"
+    )
+    job_id = uuid.uuid4().hex[:12]
+    job = {'job_id': job_id, 'done': False, 'results': [], 'batched': batched, 'batch_calls': len(batches)}
+    with _batch_jobs_lock:
+        _batch_jobs[job_id] = job
+        while len(_batch_jobs) > BATCH_JOBS_KEPT:
+            _batch_jobs.pop(next(iter(_batch_jobs)))
+
+    def run():
+        # One URL at a time: TTS and the LLM server are shared with interactive requests
+        for url in urls:
+            try:
+                payload, status, _ = _load_document({
+                    'url': url,
+                    'mode': 'news',
+                    'category': data.get('category', 'tech'),
+                    'auto_send_telegram': data.get('auto_send_telegram', False),
+                    'refresh': False,  # already re-fetched above
+                }, loaded=loaded[url])
+            except Exception as e:
+                payload, status = {'error': str(e), 'success': False}, 500
+            with _batch_jobs_lock:
+                job['results'].append({'url': url, 'status': status, **payload})
+        with _batch_jobs_lock:
+            job['done'] = True
+            job['success'] = all(r['status'] == 200 for r in job['results'])
+        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Batch load {job_id} finished")
+
+    threading.Thread(target=run, name=f"load-batch-{job_id}", daemon=True).start()
+    return jsonify({
+        'job_id': job_id,
+        'status_url': f"/load_content_batch/{job_id}",
+        'urls': urls,
+        'batched': batched,
+        'batch_calls': len(batches),
+        'success': True,
+    }), 202
+
+
+@app.route('/load_content_batch/<job_id>', methods=['GET'])
+def load_content_batch_status(job_id):
+    """Progress of a /load_content_batch job.
+
+    Returns {job_id, done, results: [{url, status, ...load_content body}], batched,
+    batch_calls, success}; results grow as URLs finish.  Until the job is done
+    success is None; then it is False if any URL failed.
+    """
+    with _batch_jobs_lock:
+        job = _batch_jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown batch job', 'success': False}), 404
+        snapshot = {'success': None, **job, 'results': list(job['results'])}
+    return jsonify(snapshot)
+
+
+@app.route('/condenser_stats', methods=['GET'])
+def condenser_stats():
+    """Report condenser cache counters for this server process"""
+    return jsonify({
+        'map_cache': get_map_cache_stats(),
+        'checkpoint_io': get_io_stats(),
+        'map_hedging': get_hedge_stats(),
+        'llm_concurrency': get_concurrency_stats(),
+        'success': True
+    })
+
+
+@app.route('/llm_concurrency', methods=['GET'])
+def llm_concurrency():
+    """Adaptive concurrency limit, in-flight calls and observed latency per LLM server"""
+    return jsonify({'servers': get_concurrency_stats(), 'success': True})
+
+
+@app.route('/condenser_metrics', methods=['GET'])
+def condenser_metrics():
+    """Per-stage latency percentiles and token totals over the most recent checkpoints"""
+    try:
+        limit = max(1, int(request.args.get('limit', 50)))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer', 'success': False}), 400
+    return jsonify({**aggregate_stage_metrics(limit), 'success': True})
 
 
 @app.route('/send_email', methods=['POST'])
@@ -850,38 +1256,47 @@ def chat():
         return jsonify({'error': 'Message is required'}), 400
 
     try:
-        # Get response from conversation chain
-        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Generating LLM response for: '{user_input[:50]}...'")
-        
-        # Track token usage with callback and time
         import time
-        llm_start_time = time.time()
+        cached = _cached_summary_answer(user_input)
+        if cached is not None:
+            summary_level, response_text = cached
+            llm_time = 0.0
+        else:
+            summary_level = None
+            # Get response from conversation chain
+            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Generating LLM response for: '{user_input[:50]}...'")
         
-        with get_openai_callback() as cb:
-            response = conversation_chain.invoke({
-                "input": user_input
-            })
+            # Track token usage with callback and time
+            llm_start_time = time.time()
+        
+            # Shares the server's adaptive concurrency limit with the condenser
+            with get_limiter(current_model).slot() as llm_slot, get_openai_callback() as cb:
+                response = conversation_chain.invoke({
+                    "input": user_input
+                })
             
-            # Extract token usage from callback
-            token_usage = {
-                'prompt_tokens': cb.prompt_tokens,
-                'completion_tokens': cb.completion_tokens,
-                'total_tokens': cb.total_tokens
-            }
+                # Extract token usage from callback
+                token_usage = {
+                    'prompt_tokens': cb.prompt_tokens,
+                    'completion_tokens': cb.completion_tokens,
+                    'total_tokens': cb.total_tokens
+                }
+                if cb.total_tokens:
+                    llm_slot.record(cb.prompt_tokens, cb.completion_tokens)
         
-        llm_time = time.time() - llm_start_time
-        response_text = response['response']
+            llm_time = time.time() - llm_start_time
+            response_text = response.content
         
-        # Remove thinking tokens from response
-        response_text, thinking_tokens_removed = remove_thinking_tokens(response_text)
-        if not thinking_tokens_removed:
-            error_msg = "Failed to remove thinking tokens from LLM response"
-            print(f"[ERROR] {error_msg}")
-            return jsonify({'error': error_msg, 'success': False}), 422
+            # Remove thinking tokens from response
+            response_text, thinking_tokens_removed = remove_thinking_tokens(response_text)
+            if not thinking_tokens_removed:
+                error_msg = "Failed to remove thinking tokens from LLM response"
+                print(f"[ERROR] {error_msg}")
+                return jsonify({'error': error_msg, 'success': False}), 422
         
-        print(f"[SUCCESS] LLM response generated. Length: {len(response_text)} characters")
-        print(f"[TOKENS] Prompt: {token_usage['prompt_tokens']}, Completion: {token_usage['completion_tokens']}, Total: {token_usage['total_tokens']}")
-        print(f"[TIME] LLM generation took: {llm_time:.2f}s")
+            print(f"[SUCCESS] LLM response generated. Length: {len(response_text)} characters")
+            print(f"[TOKENS] Prompt: {token_usage['prompt_tokens']}, Completion: {token_usage['completion_tokens']}, Total: {token_usage['total_tokens']}")
+            print(f"[TIME] LLM generation took: {llm_time:.2f}s")
         
         # Get token usage if available
         token_usage = None
@@ -919,6 +1334,7 @@ def chat():
             'token_usage': token_usage,
             'llm_time': round(llm_time, 2),
             'audio_time': round(audio_time, 2) if audio_time else None,
+            'summary_level': summary_level,
             'success': True
         })
 
@@ -955,49 +1371,79 @@ def stream_chat():
             audio_file = None
             audio_time = None
 
-            llm_start_time = time.time()
-            total_chunk_size = 0
-            complete_response_text = ""
-
-            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Generating streaming LLM response for: '{user_input[:50]}...'")
-
-            with get_openai_callback() as cb:
-                chunk_received = False
-                # with get_openai_callback() as cb:
-                for chunk_response in conversation_chain.stream({
-                    "input": user_input
-                }, config = {"configurable": {"session_id": "any_string_here"}}):
-
-                    if chunk_response:  # Only send non-empty chunks
-                        chunk_received = True
-                        complete_response_text += chunk_response
-                        total_chunk_size += len(chunk_response)
-                        # Send only the chunk during streaming
-                        chunk_data = {'chunk': chunk_response}
-                        yield f"data:{json.dumps(chunk_data)}\n\n"
-
-                if not chunk_received:
-                    raise Exception("No response from LLM - check if local LLM server is running")
-
-                # Extract token usage from callback
-                token_usage = {
-                    'prompt_tokens': cb.prompt_tokens,
-                    'completion_tokens': cb.completion_tokens,
-                    'total_tokens': cb.total_tokens
-                }
-
-            llm_time = time.time() - llm_start_time
-            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Streaming complete. Time: {llm_time:.2f}s, Chunks: {total_chunk_size} chars")
-
-            # Remove thinking tokens from complete response
-            complete_response_text, thinking_tokens_removed = remove_thinking_tokens(complete_response_text)
-            if not thinking_tokens_removed:
-                error_msg = "Failed to remove thinking tokens from LLM response"
-                print(f"[ERROR] {error_msg}")
-                error_data = {'error': error_msg}
-                yield f"data:{json.dumps(error_data)}\n\n"
-                return
-            print(f"[DEBUG] After thinking token removal: {len(complete_response_text)} chars")
+            stopped_early = False
+            cached = _cached_summary_answer(user_input)
+            if cached is not None:
+                summary_level, complete_response_text = cached
+                llm_time = 0.0
+                yield f"data:{json.dumps({'chunk': complete_response_text})}\n\n"
+            else:
+                summary_level = None
+                llm_start_time = time.time()
+                total_chunk_size = 0
+
+                print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Generating streaming LLM response for: '{user_input[:50]}...'")
+
+                # Held while streaming: shares the server's adaptive concurrency limit with the condenser
+                with get_limiter(current_model).slot() as llm_slot, get_openai_callback() as cb:
+                    chunk_received = False
+                    stopped_early = False
+                    # Only <final_script> content reaches the browser, as it arrives
+                    extractor = FinalScriptExtractor()
+                    history_length = len(session_history.messages)
+                    # with get_openai_callback() as cb:
+                    chat_stream = conversation_chain.stream({
+                        "input": user_input
+                    }, config = {"configurable": {"session_id": "any_string_here"}})
+                    for chunk_message in chat_stream:
+                        chunk_response = chunk_message.content
+
+                        if chunk_response:  # Only send non-empty chunks
+                            chunk_received = True
+                            total_chunk_size += len(chunk_response)
+                            script_piece = extractor.feed(chunk_response)
+                            if script_piece:
+                                chunk_data = {'chunk': script_piece}
+                                yield f"data:{json.dumps(chunk_data)}\n\n"
+                            if EARLY_STOP and extractor.complete:
+                                stopped_early = True
+                                break
+
+                    if stopped_early:
+                        # Closing the stream aborts the generation still running on the server
+                        chat_stream.close()
+                        # RunnableWithMessageHistory saves whatever it had aggregated when the
+                        # stream was closed, which can miss the final chunks — store the turn
+                        # with the complete answer so later questions see a well-formed reply.
+                        del session_history.messages[history_length:]
+                        session_history.add_user_message(user_input)
+                        session_history.add_ai_message(f"<final_script>\n{extractor.text}\n</final_script>")
+                        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Stopped generation after </final_script> ({total_chunk_size} chars received)")
+
+                    if not chunk_received:
+                        raise Exception("No response from LLM - check if local LLM server is running")
+
+                    # Extract token usage from callback
+                    token_usage = {
+                        'prompt_tokens': cb.prompt_tokens,
+                        'completion_tokens': cb.completion_tokens,
+                        'total_tokens': cb.total_tokens
+                    }
+                    if cb.total_tokens:
+                        llm_slot.record(cb.prompt_tokens, cb.completion_tokens)
+
+                llm_time = time.time() - llm_start_time
+                print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Streaming complete. Time: {llm_time:.2f}s, Chunks: {total_chunk_size} chars")
+
+                # Thinking tokens were skipped while streaming; the answer is the extracted script
+                complete_response_text = extractor.text
+                if not extractor.complete:
+                    error_msg = "Failed to remove thinking tokens from LLM response"
+                    print(f"[ERROR] {error_msg}")
+                    error_data = {'error': error_msg}
+                    yield f"data:{json.dumps(error_data)}\n\n"
+                    return
+                print(f"[DEBUG] After thinking token removal: {len(complete_response_text)} chars")
 
             # print(f"[SUCCESS] LLM streaming response completed. Length: {total_chunk_size} characters")
             # print(f"[TOKENS] Prompt: {token_usage['prompt_tokens']}, Completion: {token_usage['completion_tokens']}, Total: {token_usage['total_tokens']}")
@@ -1031,6 +1477,8 @@ def stream_chat():
                 'token_usage': token_usage,
                 'llm_time': round(llm_time, 2),
                 'audio_time': round(audio_time, 2) if audio_time else None,
+                'stopped_early': stopped_early,
+                'summary_level': summary_level,
                 'success': True
             }
 
@@ -1067,7 +1515,7 @@ def get_audio(filename):
 def clear_conversation():
     """Clear conversation memory and reset mode"""
     print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Clearing conversation memory")
-    global conversation_chain, current_mode
+    global conversation_chain, current_mode, current_checkpoint
     
     if session_history:
         session_history.clear()
@@ -1075,6 +1523,7 @@ def clear_conversation():
     
     conversation_chain = None
     current_mode = None
+    current_checkpoint = None
     print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Conversation state reset")
 
     return jsonify({'success': True, 'message': 'Conversation cleared'})
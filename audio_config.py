@@ -7,3 +7,5 @@ QWEN_OMNI_SPEAKER = os.getenv("QWEN_OMNI_SPEAKER", "Chelsie")
 KOKORO_VOICE = os.getenv("KOKORO_VOICE", "af_sarah")
 KOKORO_LANG_CODE = os.getenv("KOKORO_LANG_CODE", "a")
 WHISPER_MODEL_ID = os.getenv("WHISPER_MODEL_ID", "mlx-community/whisper-large-v3-mlx")
+# Synthesize each finished REDUCE batch while later batches are still condensing
+INCREMENTAL_TTS = os.getenv("INCREMENTAL_TTS", "1") != "0"
@@ -0,0 +1,248 @@
+"""
+Near-duplicate span elimination ahead of the MAP phase.
+
+YouTube transcripts repeat sponsor reads, intros / outros and recaps, and
+split_content() deliberately overlaps neighbouring chunks.  Every repeated
+span costs MAP prefill and produces duplicate narrative that REDUCE then has
+to deduplicate again.
+
+Method — word shingling with containment, plus MinHash / LSH:
+  * Each chunk is cut into sentences; each sentence becomes a set of k-word
+    shingles (hashed to 64 bits).
+  * Walking the chunks in order, a sentence is dropped when at least
+    DEDUP_CONTAINMENT_THRESHOLD of its shingles already occurred earlier in
+    the document.  Comparing against the union of everything seen so far
+    makes detection independent of where span boundaries fall in each
+    repetition.
+  * Exact word shingles miss reworded repeats: one changed word ("video is"
+    → "video's") breaks SHINGLE_WORDS shingles.  Every kept sentence also
+    gets a MinHash signature over character shingles, indexed by LSH bands;
+    a sentence whose estimated Jaccard similarity to an earlier kept one is
+    at least DEDUP_SIMILARITY_THRESHOLD is dropped as a near-duplicate.
+  * Auto-captions often have no punctuation, so one "sentence" can be a whole
+    chunk.  Those spans are handled per word instead: runs of at least
+    MIN_RUN_WORDS words covered by previously seen shingles are cut.
+  * Chunks that shrink are merged with their neighbours while they still fit
+    the MAP chunk budget, so dropped text also saves LLM calls.  With
+    content-defined chunking the merge is skipped: it would move chunk
+    boundaries and stop unchanged chunks from matching their previous version.
+
+The step changes what MAP sees, so it is off unless CONDENSER_DEDUP=1.
+"""
+
+import hashlib
+import os
+import re
+from typing import Callable
+
+import numpy as np
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+DEDUP_ENABLED = os.getenv("CONDENSER_DEDUP", "0") == "1"
+DEDUP_CONTAINMENT_THRESHOLD = float(os.getenv("CONDENSER_DEDUP_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 8
+MIN_SHINGLES_TO_DROP = 3  # spans shorter than SHINGLE_WORDS + 2 words are always kept
+MAX_SPAN_WORDS = 60       # longer "sentences" (unpunctuated captions) use run detection
+MIN_RUN_WORDS = 16        # shortest repeated word run cut from an unpunctuated span
+# MinHash near-duplicate detection: estimated Jaccard similarity of character
+# shingles at which a sentence repeats an earlier one
+DEDUP_SIMILARITY_THRESHOLD = float(os.getenv("CONDENSER_DEDUP_SIMILARITY", "0.6"))
+CHAR_SHINGLE = 5
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4          # 64 hash functions; bands catch pairs from ~0.5 similarity
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(7)  # fixed seed: signatures must match across runs
+_HASH_A = _rng.integers(1, _MERSENNE_PRIME, MINHASH_BANDS * MINHASH_ROWS, dtype=np.int64)
+_HASH_B = _rng.integers(0, _MERSENNE_PRIME, MINHASH_BANDS * MINHASH_ROWS, dtype=np.int64)
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])(\s+)")
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _split_spans(text: str) -> list[str]:
+    """Split text into sentences that keep their trailing whitespace, so kept spans re-join losslessly."""
+    parts = _SENTENCE_BOUNDARY.split(text)
+    # re.split with a capture group alternates [sentence, sep, sentence, sep, ...]
+    spans = [parts[i] + (parts[i + 1] if i + 1 < len(parts) else "") for i in range(0, len(parts), 2)]
+    return [span for span in spans if span]
+
+
+def _shingle_hash(words: list[str]) -> int:
+    return int.from_bytes(hashlib.blake2b(" ".join(words).encode(), digest_size=8).digest(), "little")
+
+
+def _shingles(span: str) -> set[int]:
+    words = _WORD.findall(span.lower())
+    return {_shingle_hash(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _minhash(span: str) -> np.ndarray:
+    """MinHash signature of the span's character shingles (over its normalised words)."""
+    text = " ".join(_WORD.findall(span.lower()))
+    grams = {text[i:i + CHAR_SHINGLE] for i in range(len(text) - CHAR_SHINGLE + 1)} or {text}
+    values = np.array(
+        [int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), "little") for g in grams],
+        dtype=np.int64,
+    ) % _MERSENNE_PRIME
+    # (a * x + b) mod p stays below 2^62, so int64 never overflows
+    return ((np.outer(values, _HASH_A) + _HASH_B) % _MERSENNE_PRIME).min(axis=0)
+
+
+class _MinHashIndex:
+    """LSH index of kept sentences' signatures: finds earlier near-duplicates without pairwise scans."""
+
+    def __init__(self):
+        self._signatures: list[np.ndarray] = []
+        self._buckets: dict[tuple[int, bytes], list[int]] = {}
+
+    def _bands(self, signature: np.ndarray) -> list[tuple[int, bytes]]:
+        return [
+            (band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS].tobytes())
+            for band in range(MINHASH_BANDS)
+        ]
+
+    def similar(self, signature: np.ndarray) -> bool:
+        """True if an indexed signature shares a band and is estimated at least DEDUP_SIMILARITY_THRESHOLD similar."""
+        candidates = {i for band in self._bands(signature) for i in self._buckets.get(band, ())}
+        return any(
+            np.mean(self._signatures[i] == signature) >= DEDUP_SIMILARITY_THRESHOLD for i in candidates
+        )
+
+    def add(self, signature: np.ndarray) -> None:
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, []).append(len(self._signatures))
+        self._signatures.append(signature)
+
+
+def _drop_repeated_runs(span: str, seen: set[int]) -> tuple[str, int]:
+    """Remove runs of already-seen words from one long, unpunctuated span.
+
+    A word is "covered" when any shingle containing it was seen before; runs of
+    at least MIN_RUN_WORDS covered words are cut.  Returns (text, runs_dropped)
+    and adds the span's shingles to ``seen``.
+    """
+    matches = list(re.finditer(r"\S+", span))
+    words = ["".join(_WORD.findall(m.group().lower())) for m in matches]
+    hashes = [_shingle_hash(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+
+    covered = [False] * len(words)
+    for i, h in enumerate(hashes):
+        if h in seen:
+            covered[i:i + SHINGLE_WORDS] = [True] * SHINGLE_WORDS
+    seen.update(hashes)
+
+    pieces: list[str] = []
+    cursor = 0
+    runs_dropped = 0
+    i = 0
+    while i < len(words):
+        if not covered[i]:
+            i += 1
+            continue
+        j = i
+        while j < len(words) and covered[j]:
+            j += 1
+        if j - i >= MIN_RUN_WORDS:
+            pieces.append(span[cursor:matches[i].start()])
+            cursor = matches[j].start() if j < len(words) else len(span)
+            runs_dropped += 1
+        i = j
+    pieces.append(span[cursor:])
+    return "".join(pieces), runs_dropped
+
+
+def _merge_small_chunks(chunks: list[str], max_tokens: int, count_tokens: Callable[[str], int]) -> list[str]:
+    """Greedily merge consecutive chunks while the result stays within max_tokens."""
+    merged: list[str] = []
+    current = ""
+    current_tokens = 0
+    for chunk in chunks:
+        chunk_tokens = count_tokens(chunk)
+        if current and current_tokens + chunk_tokens <= max_tokens:
+            current = f"{current.rstrip()}\n\n{chunk.lstrip()}"
+            current_tokens += chunk_tokens
+        else:
+            if current:
+                merged.append(current)
+            current, current_tokens = chunk, chunk_tokens
+    if current:
+        merged.append(current)
+    return merged
+
+
+def dedupe_chunks(
+    chunks: list[str],
+    max_chunk_tokens: int,
+    count_tokens: Callable[[str], int],
+    merge: bool = True,
+) -> tuple[list[str], dict]:
+    """Drop near-duplicate spans across chunks, then re-pack shrunken chunks.
+
+    Args:
+        chunks:           Output of split_content(), in document order.
+        max_chunk_tokens: MAP chunk budget; merged chunks never exceed it.
+        count_tokens:     Token counter used for the budget and the savings stat.
+        merge:            False keeps the chunk boundaries (content-defined chunking).
+
+    Returns:
+        (new_chunks, stats) where stats records spans and tokens before / after.
+    """
+    tokens_before = sum(count_tokens(chunk) for chunk in chunks)
+    seen: set[int] = set()
+    index = _MinHashIndex()
+    spans_total = 0
+    spans_dropped = 0
+    near_duplicates = 0
+    runs_dropped = 0
+    deduped: list[str] = []
+
+    for chunk in chunks:
+        kept: list[str] = []
+        for span in _split_spans(chunk):
+            spans_total += 1
+            if len(span.split()) > MAX_SPAN_WORDS:
+                text, runs = _drop_repeated_runs(span, seen)
+                runs_dropped += runs
+                kept.append(text)
+                continue
+            shingles = _shingles(span)
+            if len(shingles) >= MIN_SHINGLES_TO_DROP:
+                contained = len(shingles & seen) / len(shingles)
+                if contained >= DEDUP_CONTAINMENT_THRESHOLD:
+                    spans_dropped += 1
+                    continue
+                signature = _minhash(span)
+                if index.similar(signature):
+                    spans_dropped += 1
+                    near_duplicates += 1
+                    continue
+                index.add(signature)
+            seen |= shingles
+            kept.append(span)
+        text = "".join(kept).strip()
+        if text:
+            deduped.append(text)
+
+    if not deduped:
+        # Never hand MAP an empty document
+        deduped = [chunks[0]] if chunks else []
+
+    if merge and (spans_dropped or runs_dropped):
+        deduped = _merge_small_chunks(deduped, max_chunk_tokens, count_tokens)
+
+    tokens_after = sum(count_tokens(chunk) for chunk in deduped)
+    stats = {
+        "spans_total": spans_total,
+        "spans_dropped": spans_dropped,
+        "near_duplicates_dropped": near_duplicates,
+        "runs_dropped": runs_dropped,
+        "chunks_before": len(chunks),
+        "chunks_after": len(deduped),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
+    return deduped, stats
@@ -2,24 +2,47 @@
 Pipeline-wide resume / checkpoint cache for the condensation pipeline.
 
 Each processing run is identified by a 16-char hex key derived from the
-canonical URL identifier and the active model key.  Progress is saved to
+canonical URL identifier and the active model key (plus any per-stage
+condenser model routing).  Progress is saved to
   condensation_cache/<key>.json
 using atomic writes (write to .tmp then os.replace) so a crash never
 leaves a corrupt checkpoint file.
 
 Checkpoint stages (in order):
   0  raw_content       — transcript / article text after fetch / Whisper
+     cleaning_stats    — YouTube transcript pre-cleaning before condensation
+                         (cues / fillers / repeated words removed, tokens saved)
   1  map_chunks        — content split stored so resume uses identical chunks
+                         (after optional extractive pre-compression, extractive_stats)
+                         (skipped with stages 2–4 when single_pass is True)
   2  map_results[i]    — MAP output per chunk (string keys)
   3  reduce_results[i] — REDUCE output per batch (string keys)
+     reduce_batch_plan — token-packed MAP output range per batch, planned incrementally
+     reduce_tree_nodes["L<level>:<i>"] — tree-reduce node outputs (tree strategy)
   4  consolidation_result — optional final consolidation output
   5  final_output      — fully condensed text, condensation pipeline done
-  6  audio_file_path   — Kokoro TTS output path
+     llm_calls         — per-LLM-call token counts and prompt-processing time
+     partial_outputs[step] — script of a response cut off mid-<final_script>,
+                         finished by continuation requests (any stage 1–4 step)
+     step_hashes[step] — prompt hash of every finished step; on a content update
+                         (reset_for_content_update()) step outputs move to
+                         reusable_outputs[prompt_hash] for unchanged steps to reuse
+     summary_pyramid   — headline / short / medium distilled from final_output
+                         (summary_pyramid module), with the final_output hash it
+                         was built from
+     metrics[stage][key] — per-stage timings: fetch, single_pass, map (per chunk),
+                         reduce (per batch / tree node), consolidation, condense,
+                         summary_pyramid, tts
+  6  audio_segments[i] — per-batch TTS segments synthesized during REDUCE
+     audio_file_path   — Kokoro TTS output path
 """
 
 import hashlib
 import json
+import math
 import os
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Optional
@@ -33,6 +56,17 @@ CACHE_DIR = Path("condensation_cache")
 CHECKPOINT_TTL_HOURS = 24
 MAX_RETRIES_PER_STEP = 3
 
+# Serialises checkpoint writes: every save for a key shares one .tmp path, so two
+# threads writing at once (concurrent MAP workers) would clobber each other.
+_write_lock = threading.Lock()
+
+# Checkpoint write counters for this process (benchmarks, /condenser_stats)
+_io_stats = {"saves": 0, "save_seconds": 0.0, "bytes_written": 0}
+
+# Serialises record_stage_metric(): the condenser and the incremental TTS thread
+# both record into checkpoint["metrics"]
+_metrics_lock = threading.Lock()
+
 # Query-string keys that are tracking noise and must be stripped before hashing
 _TRACKING_PREFIXES = ("utm_", "fbclid", "gclid", "ref", "source", "campaign")
 
@@ -88,6 +122,7 @@ def compute_cache_key(
     mode: str,
     model_key: str,
     fetch_mode: str = "transcript",
+    stage_models: Optional[dict] = None,
 ) -> str:
     """Derive a stable 16-char hex key from (canonical_url, model_key, fetch_mode).
 
@@ -95,9 +130,20 @@ def compute_cache_key(
     Different models never share a key.
     fetch_mode ('transcript' | 'audio') is included so a Whisper-forced audio run
     never reuses a cached transcript-API run for the same video.
+    stage_models (llm_models.resolve_stage_models()) adds every stage routed
+    to a model other than model_key (except "map_hedge"), so mixed-model runs never share a key
+    with single-model ones; unrouted runs keep their original key.
     """
     canonical_id = _canonicalize_url(url, mode)
     raw = f"{canonical_id}|{model_key}|{fetch_mode}"
+    # The MAP hedge model is left out: a hedged MAP result is stored under the
+    # model that produced it, so hedging never changes what a key can reuse.
+    routed = sorted(
+        (stage, key) for stage, key in (stage_models or {}).items()
+        if key and key != model_key and stage != "map_hedge"
+    )
+    if routed:
+        raw += "|" + ",".join(f"{stage}={key}" for stage, key in routed)
     return hashlib.sha256(raw.encode()).hexdigest()[:16]
 
 
@@ -121,33 +167,56 @@ def _is_expired(data: dict) -> bool:
         return True  # malformed → treat as expired
 
 
-def _fresh_checkpoint(url: str, mode: str, model_key: str, fetch_mode: str = "transcript") -> dict:
+def _fresh_checkpoint(
+    url: str, mode: str, model_key: str, fetch_mode: str = "transcript", stage_models: Optional[dict] = None
+) -> dict:
     """Return a blank checkpoint dict with all fields initialized."""
     return {
         "url": url,
         "mode": mode,
         "model_key": model_key,
+        "stage_models": stage_models,  # condenser routing {"map", "reduce", "consolidation"} -> model key
         "fetch_mode": fetch_mode,
         "created_at": _now_iso(),
         "expires_at": _expires_iso(),
         # Stage 0 — raw content
         "raw_content": None,
         "source": None,          # "whisper" | "transcript_api" | "news_loader"
-        # Stage 1 — split chunks (list of strings)
+        "cleaning_stats": None,  # YouTube pre-cleaning: cues / fillers / repeated words removed, tokens_saved
+        # Short content: one combined LLM call instead of split/MAP/REDUCE
+        "single_pass": None,     # decided on first condense; True skips stages 1–4
+        "single_pass_retries": 0,
+        # Stage 1 — split chunks (list of strings), after near-duplicate removal
         "map_chunks": None,
+        "extractive_stats": None,  # optional TF-IDF TextRank pre-compression: ratio, kept_units, tokens saved
+        "dedup_stats": None,     # spans dropped, tokens_before / tokens_after / tokens_saved
         # Stage 2 — MAP results (str-keyed dict: {"0": "...", "1": "..."})
         "map_results": {},
         "map_retry_counts": {},
         # Stage 3 — REDUCE results (str-keyed dict)
-        "reduce_batches_total": None,
+        "reduce_batches_total": None,  # set once reduce_batch_plan covers every MAP output
+        "reduce_batch_plan": None,     # chained: [[start, end], ...] MAP output ranges, packed by tokens
         "reduce_results": {},
         "reduce_retry_counts": {},
+        "reduce_strategy": None,     # "chained" | "tree", pinned on first REDUCE
+        "reduce_tree_nodes": {},     # tree strategy: {"L0:0": "...", "L1:0": "..."}
+        "reduce_tree_retry_counts": {},
+        "reduce_stats": None,        # strategy, elapsed_s, critical_path_calls, depth, fan_out
         # Stage 4 — consolidation
         "consolidation_result": None,
         "consolidation_retries": 0,
         # Stage 5 — final condensation output
         "final_output": None,
+        "llm_calls": [],         # per-call stats: stage, prompt / cached tokens, prompt_processing_s
+        "partial_outputs": {},   # truncated-output salvage: {"map:3": {"prompt_hash", "text", "model_key", "continuations"}}
+        # Content updates (reset_for_content_update()): steps whose prompt is unchanged are reused
+        "step_hashes": {},       # {"map:3": prompt_hash, "reduce:0": ..., "consolidation:0": ...}
+        "reusable_outputs": {},  # previous content version's step outputs by prompt hash
+        "content_revision": None,  # {"revision", "updated_at", "reusable_steps", "reused_steps", "steps"}
+        "summary_pyramid": None,   # {"headline", "short", "medium", "source_hash", "source_chars", "model_key", "elapsed_s"}
+        "metrics": {},           # {stage: {key: {"seconds", tokens...}}}, see record_stage_metric()
         # Stage 6 — TTS
+        "audio_segments": {},    # incremental TTS per REDUCE batch: {"0": {"path", "text_hash", "chars"}}
         "audio_file_path": None,
     }
 
@@ -165,14 +234,24 @@ def _tmp_path(key: str) -> Path:
 
 
 def save_checkpoint(key: str, data: dict) -> None:
-    """Atomically persist checkpoint data to disk."""
+    """Atomically persist checkpoint data to disk.
+
+    Thread-safe with respect to other saves; callers that mutate ``data`` from
+    several threads must still hold their own lock across mutate + save.
+    """
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
     tmp = _tmp_path(key)
     final = _checkpoint_path(key)
     try:
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, final)
+        with _write_lock:
+            started = time.perf_counter()
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                size = f.tell()
+            os.replace(tmp, final)
+            _io_stats["saves"] += 1
+            _io_stats["save_seconds"] += time.perf_counter() - started
+            _io_stats["bytes_written"] += size
     except Exception as e:
         print(f"[ERROR]   save_checkpoint: failed to write {final}: {e}")
         # Best-effort cleanup of tmp file
@@ -199,6 +278,22 @@ def load_checkpoint(key: str) -> Optional[dict]:
         return None
 
 
+def get_io_stats() -> dict:
+    """Return checkpoint write counters (count, seconds, bytes) for this process."""
+    with _write_lock:
+        return {
+            "saves": _io_stats["saves"],
+            "save_seconds": round(_io_stats["save_seconds"], 4),
+            "bytes_written": _io_stats["bytes_written"],
+        }
+
+
+def reset_io_stats() -> None:
+    """Zero the checkpoint write counters (used between benchmark runs)."""
+    with _write_lock:
+        _io_stats.update(saves=0, save_seconds=0.0, bytes_written=0)
+
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
@@ -208,6 +303,7 @@ def create_checkpoint(
     mode: str,
     model_key: str,
     fetch_mode: str = "transcript",
+    stage_models: Optional[dict] = None,
 ) -> tuple[str, dict]:
     """Create a fresh in-memory checkpoint; does NOT write to disk.
 
@@ -218,16 +314,74 @@ def create_checkpoint(
         fetch_mode: ``'transcript'`` or ``'audio'``.  Must match the value
                     used when the cache key was computed so resume works
                     correctly across retries.
+        stage_models: Condenser stage routing; part of the key, see compute_cache_key().
 
     Returns:
         (key, data)
     """
-    key = compute_cache_key(url, mode, model_key, fetch_mode)
-    data = _fresh_checkpoint(url, mode, model_key, fetch_mode)
+    key = compute_cache_key(url, mode, model_key, fetch_mode, stage_models)
+    data = _fresh_checkpoint(url, mode, model_key, fetch_mode, stage_models)
     print(f"[INFO]    [{datetime.now().strftime('%H:%M:%S')}] New checkpoint created: key={key}")
     return key, data
 
 
+# Fields derived from raw_content: reset when the source content changes.
+# llm_calls / metrics (history) and audio_segments (checked by text hash) are kept.
+_CONTENT_DERIVED_FIELDS = (
+    "cleaning_stats", "single_pass", "single_pass_retries", "map_chunks", "extractive_stats", "dedup_stats",
+    "map_results", "map_retry_counts", "reduce_batches_total", "reduce_batch_plan",
+    "reduce_results", "reduce_retry_counts", "reduce_strategy", "reduce_tree_nodes",
+    "reduce_tree_retry_counts", "reduce_stats", "consolidation_result", "consolidation_retries",
+    "final_output", "partial_outputs", "step_hashes", "summary_pyramid", "audio_file_path",
+)
+
+
+def _step_output(data: dict, step: str) -> Optional[str]:
+    """Stored output of a condenser step ("<stage>:<key>", as in step_hashes)."""
+    stage, _, key = step.partition(":")
+    if stage == "map":
+        return (data.get("map_results") or {}).get(key)
+    if stage == "reduce":
+        return (data.get("reduce_results") or {}).get(key) or (data.get("reduce_tree_nodes") or {}).get(key)
+    if stage == "consolidation":
+        return data.get("consolidation_result")
+    if stage == "single_pass":
+        return data.get("final_output")
+    return None
+
+
+def reset_for_content_update(data: dict, raw_content: str) -> int:
+    """Replace ``data``'s raw_content with a new version of the source, in place.
+
+    Everything derived from the old content is reset, but the output of every
+    finished condenser step is kept in ``reusable_outputs`` under the hash of
+    the prompt that produced it.  condense_content() reuses those outputs for
+    steps whose prompt is unchanged — with content-defined chunking
+    (CONDENSER_CHUNKING=cdc) that is every MAP chunk outside the edited
+    regions and the REDUCE steps built only from them.
+
+    Returns:
+        Number of reusable step outputs.
+    """
+    reusable = dict(data.get("reusable_outputs") or {})
+    for step, prompt_hash in (data.get("step_hashes") or {}).items():
+        output = _step_output(data, step)
+        if output:
+            reusable[prompt_hash] = output
+
+    fresh = _fresh_checkpoint(data.get("url"), data.get("mode"), data.get("model_key"))
+    for field in _CONTENT_DERIVED_FIELDS:
+        data[field] = fresh[field]
+    data["raw_content"] = raw_content
+    data["reusable_outputs"] = reusable
+    data["content_revision"] = {
+        "revision": (data.get("content_revision") or {}).get("revision", 0) + 1,
+        "updated_at": _now_iso(),
+        "reusable_steps": len(reusable),
+    }
+    return len(reusable)
+
+
 def get_progress_summary(data: dict) -> dict:
     """Return a human-readable progress dict suitable for error responses."""
     map_total = len(data.get("map_chunks") or [])
@@ -236,16 +390,90 @@ def get_progress_summary(data: dict) -> dict:
     reduce_done = len(data.get("reduce_results", {}))
     return {
         "raw_content_cached": data.get("raw_content") is not None,
+        "single_pass": bool(data.get("single_pass")),
         "map_chunks_total": map_total,
         "map_chunks_done": map_done,
         "reduce_batches_total": reduce_total,
         "reduce_batches_done": reduce_done,
+        "reduce_strategy": data.get("reduce_strategy"),
+        "reduce_tree_nodes_done": len(data.get("reduce_tree_nodes") or {}),
         "consolidation_done": data.get("consolidation_result") is not None,
         "final_output_cached": data.get("final_output") is not None,
+        "audio_segments_done": len(data.get("audio_segments") or {}),
         "audio_cached": data.get("audio_file_path") is not None,
     }
 
 
+# ---------------------------------------------------------------------------
+# Stage metrics
+# ---------------------------------------------------------------------------
+
+def record_stage_metric(data: dict, stage: str, seconds: float, key: str = "0", **fields) -> None:
+    """Record one stage timing in ``data["metrics"][stage][key]``; persisted by the next save.
+
+    Per-step stages use the step as ``key`` (MAP chunk index, REDUCE batch index
+    or tree node key), so a retried step overwrites its failed attempt; stages
+    that run once per job keep the default key.  Extra ``fields`` (token counts,
+    chars, source) are stored alongside ``seconds``.
+
+    The metrics dicts are replaced, never mutated in place, so a json.dump of
+    the checkpoint running on another thread never sees them mid-change.
+    """
+    entry = {"seconds": round(seconds, 3), **fields}
+    with _metrics_lock:
+        metrics = dict(data.get("metrics") or {})
+        steps = dict(metrics.get(stage) or {})
+        steps[str(key)] = entry
+        metrics[stage] = steps
+        data["metrics"] = metrics
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def aggregate_stage_metrics(limit: int = 50) -> dict:
+    """Per-stage latency percentiles over the ``limit`` most recently saved checkpoints.
+
+    Every recorded step is one sample, so "map" percentiles are per chunk and
+    "condense" percentiles are per job.  Token counts are summed per stage.
+    """
+    paths = sorted(CACHE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True) if CACHE_DIR.exists() else []
+    samples: dict[str, list[float]] = {}
+    tokens: dict[str, dict[str, int]] = {}
+    jobs = 0
+    for path in paths[:limit]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                metrics = json.load(f).get("metrics") or {}
+        except (json.JSONDecodeError, OSError):
+            continue
+        if metrics:
+            jobs += 1
+        for stage, steps in metrics.items():
+            for entry in steps.values():
+                samples.setdefault(stage, []).append(entry["seconds"])
+                totals = tokens.setdefault(stage, {"prompt_tokens": 0, "completion_tokens": 0})
+                totals["prompt_tokens"] += entry.get("prompt_tokens") or 0
+                totals["completion_tokens"] += entry.get("completion_tokens") or 0
+
+    stages = {}
+    for stage, values in samples.items():
+        values.sort()
+        stages[stage] = {
+            "count": len(values),
+            "p50_s": _percentile(values, 50),
+            "p90_s": _percentile(values, 90),
+            "p99_s": _percentile(values, 99),
+            "max_s": values[-1],
+            "mean_s": round(sum(values) / len(values), 3),
+            **tokens[stage],
+        }
+    return {"jobs": jobs, "checkpoints_scanned": min(len(paths), limit), "stages": stages}
+
+
 # ---------------------------------------------------------------------------
 # Housekeeping
 # ---------------------------------------------------------------------------
@@ -0,0 +1,899 @@
+"""
+Deterministic benchmark for the condensation pipeline.
+
+Drives condense_content() against a local OpenAI-compatible stub server, so
+condenser changes can be measured without LM Studio at LM_STUDIO_BASE_URL.
+
+The stub (StubLLMServer) serves POST /v1/chat/completions, streaming and
+non-streaming.  For every request it:
+  * classifies the pipeline stage from the prompt text (map / reduce /
+    reduce_with_context / single_pass / summary_pyramid, or continuation for
+    truncated-output salvage requests),
+  * waits  latency + uncached_prompt_tokens / prefill_tps + completion_tokens / tps
+    (--prefill-tps 0 skips the prefill term), optionally limited to
+    --server-slots concurrent generations like LM Studio's parallel slots,
+  * emulates prompt-prefix caching: the longest prefix shared with a recent
+    prompt counts as cached (reported as prompt_tokens_details.cached_tokens)
+    and is not prefilled again (--no-prefix-cache disables this),
+  * answers with deterministic text derived from the input, wrapped in
+    <final_script> tags (optionally preceded by --think-chars of reasoning and
+    followed by --trail-chars of text generated past the closing tag; every
+    --truncate-every-th step response is cut off mid-script),
+  * notices when a streaming client disconnects early and records the
+    request as aborted with the chars actually delivered.
+
+The corpus is synthetic and seeded: punctuated news-style articles and
+unpunctuated caption-style transcripts (with a recurring sponsor read,
+caption cues, stutters and rolling-caption repeats) at each requested size,
+1k to 500k characters by default.  Transcripts are condensed as YouTube
+content, so transcript pre-cleaning applies to them.
+
+Every run gets a fresh working directory, so checkpoints and the shared MAP
+result store start cold and runs never see each other's results.
+
+Usage:
+    python condenser_benchmark.py
+    python condenser_benchmark.py --sizes 20000,100000 --strategies chained,tree --map-workers 1,4
+    python condenser_benchmark.py --latency 0.2 --tps 60 --server-slots 2 --output results.json
+    python condenser_benchmark.py --sizes 100000,500000 --extractive-ratios 0,0.5
+    python condenser_benchmark.py --sizes 100000 --truncate-every 4
+    python condenser_benchmark.py --sizes 1000,2000,4000,8000 --kinds article --batch
+    python condenser_benchmark.py --sizes 5000,100000 --pyramid
+    python condenser_benchmark.py --kinds transcript --transcript-cleaning on,off
+    python condenser_benchmark.py --sizes 100000 --map-workers 8 --server-slots 2 --adaptive-concurrency both
+
+The JSON report (default: benchmark_results/condenser_<timestamp>_<commit>.json)
+holds one record per (document, configuration) with wall time, LLM call
+count, input / output chars and LLM seconds per stage, checkpoint I/O, and
+the condenser's own reduce_stats / dedup_stats / extractive_stats and per-stage llm_calls totals
+(prompt-processing seconds, cached prompt tokens, distinct prompt prefixes).
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from collections import deque
+from typing import Optional
+
+from langchain_openai import ChatOpenAI
+
+import condenser_service
+from condensation_cache import create_checkpoint, get_io_stats, reset_io_stats
+from llm_calls import summarize_calls
+import llm_models
+from llm_models import get_concurrency_stats, get_model_budget, reset_limiters
+from summary_pyramid import LEVEL_WORDS, PYRAMID_LEVELS, cached_summary
+from system_prompts import map_reduce_custom_prompts
+from utils import count_tokens
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+DEFAULT_SIZES = [1_000, 5_000, 20_000, 100_000, 500_000]
+DEFAULT_BUDGET_MODEL = "mlx_community_qwen_stream_local_llm"
+RESULTS_DIR = Path("benchmark_results")
+
+# Output length relative to the stage's payload, roughly what the prompts ask for
+STAGE_OUTPUT_RATIO = {
+    "map": 0.4,
+    "reduce": 0.5,
+    "reduce_with_context": 0.5,
+    "single_pass": 0.4,
+    "continuation": 0.15,  # of the original step's payload: only the cut-off remainder
+    "other": 0.3,
+}
+TRUNCATE_KEEP = 0.6  # share of a --truncate-every response sent before the cut
+STREAM_TICK_SECONDS = 0.02  # pacing granularity for streamed responses
+PREFIX_CACHE_ENTRIES = 8    # recent prompts the stub's prefix cache remembers
+
+
+def _template_prefix(template: str) -> str:
+    """Template text before its first placeholder — appears verbatim in every rendered prompt."""
+    return template[:template.index("{")]
+
+
+# Checked in order: reduce_with_context before reduce in case one prefix contains the other
+STAGE_PREFIXES = [
+    ("reduce_with_context", _template_prefix(map_reduce_custom_prompts["reduce_with_context_prompt"])),
+    ("batch_single_pass", _template_prefix(map_reduce_custom_prompts["batch_single_pass_prompt"])),
+    ("summary_pyramid", _template_prefix(map_reduce_custom_prompts["summary_pyramid_prompt"])),
+    ("single_pass", _template_prefix(map_reduce_custom_prompts["single_pass_prompt"])),
+    ("map", _template_prefix(map_reduce_custom_prompts["map_prompt"])),
+    ("reduce", _template_prefix(map_reduce_custom_prompts["reduce_prompt"])),
+]
+_ARTICLE_SOURCE = re.compile(r'<article id="(\d+)">\n(.*?)\n</article>', re.DOTALL)
+# Continuation requests are the original prompt followed by these instructions
+_CONTINUATION_TEMPLATE = map_reduce_custom_prompts["continuation_prompt"]
+CONTINUATION_MARKER = _CONTINUATION_TEMPLATE[
+    len("{original_prompt}"):_CONTINUATION_TEMPLATE.index("{partial_script}")
+]
+
+
+# ---------------------------------------------------------------------------
+# Stub OpenAI-compatible server
+# ---------------------------------------------------------------------------
+
+def _message_text(messages: list) -> str:
+    """Flatten chat messages (string or content-part lists) into one string."""
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def classify_stage(prompt: str) -> tuple[str, str]:
+    """Return (stage, payload) where payload is the prompt text after the template prefix."""
+    marker = prompt.find(CONTINUATION_MARKER)
+    if marker != -1:
+        return "continuation", classify_stage(prompt[:marker])[1]
+    for stage, prefix in STAGE_PREFIXES:
+        pos = prompt.find(prefix)
+        if pos != -1:
+            return stage, prompt[pos + len(prefix):]
+    return "other", prompt
+
+
+def _fake_script(stage: str, payload: str) -> str:
+    """Deterministic script text whose length follows STAGE_OUTPUT_RATIO."""
+    ratio = STAGE_OUTPUT_RATIO.get(stage, STAGE_OUTPUT_RATIO["other"])
+    # Strip angle brackets so template text echoed from the payload can't fake a tag
+    words = payload.replace("<", " ").replace(">", " ").split()
+    target = max(80, int(len(payload) * ratio))
+    step = max(1, round(1 / ratio))
+    picked = words[::step] or ["nothing", "to", "report"]
+
+    out_words: list[str] = []
+    length = 0
+    for i, word in enumerate(itertools.cycle(picked)):
+        if length >= target:
+            break
+        if i % 15 == 14:
+            word += "."
+        out_words.append(word)
+        length += len(word) + 1
+    return " ".join(out_words).rstrip(".") + "."
+
+
+def fake_completion(stage: str, payload: str, max_chars: Optional[int], think_chars: int, trail_chars: int = 0) -> str:
+    """Deterministic <final_script> answer whose length follows STAGE_OUTPUT_RATIO.
+
+    Batch single-pass prompts get one <article id="N"> script per source block;
+    summary pyramid prompts get each level cut to its LEVEL_WORDS target.
+    """
+    if stage == "batch_single_pass":
+        body = "\n".join(
+            f'<article id="{n}">\n{_fake_script("single_pass", source)}\n</article>'
+            for n, source in _ARTICLE_SOURCE.findall(payload)
+        )
+    elif stage == "summary_pyramid":
+        words = _fake_script("single_pass", payload).split()
+        body = "\n".join(
+            f"<{level}>{' '.join(words[:LEVEL_WORDS[level]])}</{level}>" for level in ("medium", "short", "headline")
+        )
+    else:
+        body = _fake_script(stage, payload)
+
+    thinking = ""
+    if think_chars > 0:
+        thinking = "<think>\n" + ("weighing the segment " * (think_chars // 21 + 1))[:think_chars] + "\n</think>\n"
+    trailing = ""
+    if trail_chars:
+        # Models often keep going after the closing tag until they hit their cap
+        trailing = "\n" + ("Let me know if you need anything else. " * (trail_chars // 40 + 1))[:trail_chars]
+    text = f"{thinking}<final_script>\n{body}\n</final_script>{trailing}"
+    if max_chars is not None and len(text) > max_chars:
+        text = text[:max_chars]  # generation cap hit: closing tag is lost, like a real truncation
+    return text
+
+
+class StubLLMServer:
+    """Threaded OpenAI-compatible chat completions stub with simulated generation speed."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        tps: float = 4000.0,
+        prefill_tps: float = 0.0,
+        think_chars: int = 0,
+        slots: int = 0,
+        trail_chars: int = 0,
+        prefix_cache: bool = True,
+        truncate_every: int = 0,
+    ):
+        self.latency = latency
+        self.tps = tps
+        self.prefill_tps = prefill_tps
+        self.think_chars = think_chars
+        self.trail_chars = trail_chars
+        self.truncate_every = truncate_every
+        self._step_responses = 0
+        self._slots = threading.Semaphore(slots) if slots > 0 else None
+        self._prefix_cache: Optional[deque] = deque(maxlen=PREFIX_CACHE_ENTRIES) if prefix_cache else None
+        self._lock = threading.Lock()
+        self.requests: list[dict] = []
+        self._inflight = 0
+        self.peak_inflight = 0
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]  # type: ignore[union-attr]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # noqa: A002 — silence per-request logging
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server._handle(self, body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="stub-llm", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def wait_idle(self, timeout: float = 5.0) -> None:
+        """Wait for in-flight requests to be recorded (cancelled streams finish writing after the client returns)."""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            with self._lock:
+                if self._inflight == 0:
+                    return
+            time.sleep(STREAM_TICK_SECONDS)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = []
+            self.peak_inflight = 0
+            self._step_responses = 0
+            if self._prefix_cache is not None:
+                self._prefix_cache.clear()
+
+    def _cached_tokens(self, prompt: str) -> int:
+        """Tokens of the longest prefix ``prompt`` shares with a recent prompt, then remember it."""
+        if self._prefix_cache is None:
+            return 0
+        with self._lock:
+            recent = list(self._prefix_cache)
+            self._prefix_cache.append(prompt)
+        shared = max((len(os.path.commonprefix([prompt, other])) for other in recent), default=0)
+        return count_tokens(prompt[:shared])
+
+    # -- request handling ---------------------------------------------------
+
+    def _handle(self, handler: BaseHTTPRequestHandler, body: dict) -> None:
+        started = time.perf_counter()
+        prompt = _message_text(body.get("messages") or [])
+        stage, payload = classify_stage(prompt)
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+        text = fake_completion(stage, payload, max_tokens * 4 if max_tokens else None, self.think_chars, self.trail_chars)
+        truncated = False
+        if self.truncate_every > 0 and stage not in ("continuation", "other"):
+            with self._lock:
+                self._step_responses += 1
+                truncated = self._step_responses % self.truncate_every == 0
+        if truncated:
+            text = text[:int(len(text) * TRUNCATE_KEEP)]  # e.g. a provider-side output cap
+        prompt_tokens = count_tokens(prompt)
+        cached_tokens = self._cached_tokens(prompt)
+        completion_tokens = count_tokens(text)
+        record = {
+            "stage": stage,
+            "input_chars": len(prompt),
+            "output_chars": len(text),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "stream": bool(body.get("stream")),
+            "aborted": False,
+            "truncated": truncated,
+        }
+
+        if self._slots is not None:
+            self._slots.acquire()
+        # Generation starts once a slot is free: queued requests pay for the wait
+        granted = time.perf_counter()
+        record["queue_s"] = round(granted - started, 4)
+        with self._lock:
+            self._inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self._inflight)
+        try:
+            first_token_at = granted + self.latency
+            if self.prefill_tps > 0:
+                first_token_at += (prompt_tokens - cached_tokens) / self.prefill_tps
+            generate_seconds = completion_tokens / self.tps if self.tps > 0 else 0.0
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            }
+            if record["stream"]:
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                sent = self._send_stream(handler, body, text, first_token_at, generate_seconds, usage, include_usage)
+                if sent < len(text):
+                    record["aborted"] = True
+                    record["output_chars"] = sent
+            else:
+                _sleep_until(first_token_at + generate_seconds)
+                self._send_json(handler, {
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "bench-stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+        finally:
+            with self._lock:
+                self._inflight -= 1
+            if self._slots is not None:
+                self._slots.release()
+            record["seconds"] = round(time.perf_counter() - started, 4)
+            with self._lock:
+                self.requests.append(record)
+
+    @staticmethod
+    def _send_json(handler: BaseHTTPRequestHandler, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_stream(
+        self,
+        handler: BaseHTTPRequestHandler,
+        body: dict,
+        text: str,
+        first_token_at: float,
+        generate_seconds: float,
+        usage: dict,
+        include_usage: bool,
+    ) -> int:
+        """Stream text as SSE chunks paced over generate_seconds.  Returns chars delivered."""
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        def event(choices: list, **extra) -> bytes:
+            payload = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "bench-stub"),
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> bytes:
+            return event([{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+
+        ticks = max(1, int(generate_seconds / STREAM_TICK_SECONDS))
+        piece_size = max(1, -(-len(text) // ticks))
+        sent = 0
+        try:
+            _sleep_until(first_token_at)
+            handler.wfile.write(chunk({"role": "assistant", "content": ""}))
+            for n, pos in enumerate(range(0, len(text), piece_size), start=1):
+                piece = text[pos:pos + piece_size]
+                _sleep_until(first_token_at + generate_seconds * min(1.0, n / ticks))
+                handler.wfile.write(chunk({"content": piece}))
+                handler.wfile.flush()
+                sent += len(piece)
+            handler.wfile.write(chunk({}, "stop"))
+            if include_usage:
+                # OpenAI sends usage last, in a chunk with an empty choices list
+                handler.wfile.write(event([], usage=usage))
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client stopped reading (early stop / cancellation)
+        return sent
+
+
+def _sleep_until(deadline: float) -> None:
+    remaining = deadline - time.perf_counter()
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+# ---------------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------------
+
+_SYLLABLES = ["ka", "lo", "mi", "ren", "sta", "vo", "de", "qui", "tor", "an", "bel", "si", "mar", "pol", "ex", "un"]
+_FILLERS = ["um", "uh", "you know", "like", "so", "basically", "right"]
+_CAPTION_CUES = ["[Music]", "[Applause]", "[Laughter]"]
+
+
+def _vocabulary(rng: random.Random, size: int = 4000) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def _zipf_words(rng: random.Random, vocab: list[str], count: int) -> list[str]:
+    weights = [1.0 / (rank + 1) for rank in range(len(vocab))]
+    return rng.choices(vocab, weights=weights, k=count)
+
+
+def make_article(size: int, seed: int) -> str:
+    """Punctuated news-style text of about size chars, in paragraphs."""
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng)
+    paragraphs: list[str] = []
+    length = 0
+    while length < size:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = _zipf_words(rng, vocab, rng.randint(8, 25))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return _cut("\n\n".join(paragraphs), size)
+
+
+def make_transcript(size: int, seed: int) -> str:
+    """Unpunctuated caption-style text of about size chars with a recurring sponsor read.
+
+    Caption artifacts come from their own generator, so the spoken words are
+    the same as without them: a cue every ~400 words, a stuttered word every
+    ~100 and a repeated rolling-caption line (the previous 4–8 words) every ~150.
+    """
+    rng = random.Random(seed)
+    artifacts = random.Random(seed + 2)
+    vocab = _vocabulary(rng)
+    sponsor = " ".join(_zipf_words(random.Random(seed + 1), vocab, 45))
+    words: list[str] = []
+    spoken: list[str] = []
+    length = 0
+    next_sponsor = 30_000
+    while length < size:
+        if length >= next_sponsor:
+            words.append(sponsor)
+            length += len(sponsor) + 1
+            next_sponsor += 40_000
+            continue
+        word = rng.choice(_FILLERS) if rng.random() < 0.08 else _zipf_words(rng, vocab, 1)[0]
+        roll = artifacts.random()
+        if roll < 0.0025:
+            extra = [artifacts.choice(_CAPTION_CUES)]
+        elif roll < 0.0125:
+            extra = [word]
+        elif roll < 0.019 and len(spoken) >= 8:
+            extra = spoken[-artifacts.randint(4, 8):]
+        else:
+            extra = []
+        words.extend(extra)
+        words.append(word)
+        spoken.append(word)
+        length += sum(len(w) + 1 for w in extra) + len(word) + 1
+    return _cut(" ".join(words), size)
+
+
+def _cut(text: str, size: int) -> str:
+    """Trim text to at most size chars on a word boundary."""
+    if len(text) <= size:
+        return text
+    cut = text.rfind(" ", 0, size)
+    return text[:cut if cut > 0 else size]
+
+
+def build_corpus(sizes: list[int], kinds: list[str], seed: int) -> list[dict]:
+    corpus = []
+    for size in sizes:
+        for kind in kinds:
+            maker = make_article if kind == "article" else make_transcript
+            corpus.append({"id": f"{kind}_{size}", "kind": kind, "text": maker(size, seed + size)})
+    return corpus
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def _stage_breakdown(requests: list[dict]) -> dict:
+    stages: dict[str, dict] = {}
+    for record in requests:
+        stage = stages.setdefault(record["stage"], {
+            "calls": 0, "input_chars": 0, "output_chars": 0,
+            "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "llm_seconds": 0.0, "aborted": 0,
+            "truncated": 0,
+        })
+        stage["calls"] += 1
+        stage["input_chars"] += record["input_chars"]
+        stage["output_chars"] += record["output_chars"]
+        stage["prompt_tokens"] += record["prompt_tokens"]
+        stage["cached_tokens"] += record["cached_tokens"]
+        stage["completion_tokens"] += record["completion_tokens"]
+        stage["llm_seconds"] += record["seconds"]
+        stage["aborted"] += int(record["aborted"])
+        stage["truncated"] += int(record["truncated"])
+    for stage in stages.values():
+        stage["llm_seconds"] = round(stage["llm_seconds"], 3)
+    return stages
+
+
+def _apply_config(config: dict) -> dict:
+    """Point condenser_service's module-level settings at config; return the previous values.
+
+    Also switches the adaptive concurrency limiter and starts it fresh, so no
+    run inherits the limit or latency baseline of the one before.
+    """
+    llm_models.ADAPTIVE_CONCURRENCY = config["adaptive_concurrency"]
+    reset_limiters()
+    settings = {
+        "REDUCE_STRATEGY": config["strategy"],
+        "MAP_MAX_WORKERS": config["map_workers"],
+        "REDUCE_MAX_WORKERS": config["map_workers"],
+        "PIPELINE_MAP_REDUCE": config["pipeline"],
+        "DEDUP_ENABLED": config["dedup"],
+        "EXTRACTIVE_RATIO": config["extractive_ratio"],
+        "CHUNKING_MODE": config["chunking"],
+        "TRANSCRIPT_CLEANING": config["transcript_cleaning"],
+    }
+    previous = {name: getattr(condenser_service, name) for name in settings}
+    for name, value in settings.items():
+        setattr(condenser_service, name, value)
+    return previous
+
+
+def run_one(doc: dict, config: dict, server: StubLLMServer, model, budget_model: str,
+            verbose: bool, keep_artifacts: bool, pyramid: bool = False) -> dict:
+    """Condense one document under one configuration in a fresh working directory.
+
+    With ``pyramid`` the summary pyramid is built afterwards and every level is
+    read back from the checkpoint, as /chat serves summary requests.
+    """
+    workdir = tempfile.mkdtemp(prefix="condenser_bench_")
+    original_cwd = os.getcwd()
+    previous = _apply_config(config)
+    server.reset()
+    reset_io_stats()
+    record = {"doc": doc["id"], "kind": doc["kind"], "chars": len(doc["text"]), **config}
+    log = io.StringIO()
+    try:
+        os.chdir(workdir)
+        key = f"bench_{doc['id']}"
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            _, checkpoint = create_checkpoint(f"https://bench.local/{doc['id']}", "news", budget_model)
+            if doc["kind"] == "transcript":
+                # Condensed as YouTube content (transcript pre-cleaning); the key is
+                # computed as news so no YouTube URL parsing is needed
+                checkpoint["mode"] = "youtube"
+            started = time.perf_counter()
+            try:
+                output = condenser_service.condense_content(
+                    doc["text"], model, checkpoint_key=key, checkpoint=checkpoint, model_key=budget_model
+                )
+                record["error"] = None
+            except Exception as e:
+                output = ""
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["wall_s"] = round(time.perf_counter() - started, 3)
+            if pyramid and record["error"] is None:
+                record["summary_pyramid"] = _run_pyramid(checkpoint, key, model, budget_model)
+    finally:
+        os.chdir(original_cwd)
+        for name, value in previous.items():
+            setattr(condenser_service, name, value)
+        if not keep_artifacts:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    server.wait_idle()
+    requests = list(server.requests)
+    record.update({
+        "llm_calls": len(requests),
+        "llm_seconds": round(sum(r["seconds"] for r in requests), 3),
+        "peak_concurrent_requests": server.peak_inflight,
+        "stages": _stage_breakdown(requests),
+        "checkpoint_io": get_io_stats(),
+        "map_chunks": len(checkpoint.get("map_chunks") or []),
+        # Stub server's limiter: final limit, peak in-flight calls, cuts, queue wait
+        "concurrency": next(iter(get_concurrency_stats().values()), None),
+        "reduce_stats": checkpoint.get("reduce_stats"),
+        "dedup_stats": checkpoint.get("dedup_stats"),
+        "cleaning_stats": checkpoint.get("cleaning_stats"),
+        # kept_units can run to thousands of indices; the counts are enough here
+        "extractive_stats": {
+            k: v for k, v in (checkpoint.get("extractive_stats") or {}).items() if k != "kept_units"
+        } or None,
+        "llm_call_stats": summarize_calls(checkpoint.get("llm_calls") or []),
+        "output_chars": len(output),
+    })
+    if keep_artifacts:
+        record["workdir"] = workdir
+    return record
+
+
+def _run_pyramid(checkpoint: dict, key: str, model, budget_model: str) -> dict:
+    """Build the checkpoint's summary pyramid, then time serving each level from it."""
+    started = time.perf_counter()
+    built = condenser_service.build_summary_pyramid(checkpoint, model, checkpoint_key=key, model_key=budget_model)
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    levels = {level: cached_summary(checkpoint, level) for level in PYRAMID_LEVELS}
+    serve_s = time.perf_counter() - started
+    return {
+        "built": built is not None,
+        "build_s": round(build_s, 3),
+        "serve_ms": round(serve_s * 1000, 3),
+        "words": {level: len(text.split()) if text else None for level, text in levels.items()},
+    }
+
+
+def run_batch(docs: list[dict], server: StubLLMServer, model, budget_model: str, verbose: bool) -> dict:
+    """Condense every short document through plan_condense_batches() / condense_batch().
+
+    Compare with the same documents' single-pass rows to see what packing saves.
+    Documents left out of every batch are condensed one by one, as
+    /load_content_batch does.
+    """
+    workdir = tempfile.mkdtemp(prefix="condenser_bench_")
+    original_cwd = os.getcwd()
+    server.reset()
+    reset_io_stats()
+    reset_limiters()
+    record = {"doc": "batch", "docs": [doc["id"] for doc in docs], "chars": sum(len(d["text"]) for d in docs)}
+    log = io.StringIO()
+    try:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            checkpoints = [
+                create_checkpoint(f"https://bench.local/{doc['id']}", "news", budget_model) for doc in docs
+            ]
+            texts = [doc["text"] for doc in docs]
+            started = time.perf_counter()
+            try:
+                batches = condenser_service.plan_condense_batches(texts, budget_model)
+                for batch in batches:
+                    condenser_service.condense_batch(
+                        [texts[i] for i in batch], model, budget_model, checkpoints=[checkpoints[i] for i in batch]
+                    )
+                for (key, checkpoint), text in zip(checkpoints, texts):
+                    if not checkpoint.get("final_output"):
+                        condenser_service.condense_content(
+                            text, model, checkpoint_key=key, checkpoint=checkpoint, model_key=budget_model
+                        )
+                record["error"] = None
+            except Exception as e:
+                batches = []
+                record["error"] = f"{type(e).__name__}: {e}"
+        record["wall_s"] = round(time.perf_counter() - started, 3)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    server.wait_idle()
+    requests = list(server.requests)
+    record.update({
+        "batch_calls": len(batches),
+        "batched_docs": sum(
+            (checkpoint.get("reduce_stats") or {}).get("strategy") == "batch_single_pass" for _, checkpoint in checkpoints
+        ),
+        "llm_calls": len(requests),
+        "llm_seconds": round(sum(r["seconds"] for r in requests), 3),
+        "stages": _stage_breakdown(requests),
+        "output_chars": sum(len(checkpoint.get("final_output") or "") for _, checkpoint in checkpoints),
+    })
+    return record
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _csv(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark condense_content() against a local stub LLM.")
+    parser.add_argument("--sizes", type=lambda v: _csv(v, int), default=DEFAULT_SIZES,
+                        help="Comma-separated document sizes in chars (default: 1000,5000,20000,100000,500000)")
+    parser.add_argument("--kinds", type=_csv, default=["article", "transcript"],
+                        help="Comma-separated corpus kinds: article, transcript")
+    parser.add_argument("--strategies", type=_csv, default=["chained"],
+                        help="Comma-separated REDUCE strategies to compare (chained, tree)")
+    parser.add_argument("--map-workers", type=lambda v: _csv(v, int), default=[1],
+                        help="Comma-separated MAP / REDUCE worker counts to compare")
+    parser.add_argument("--pipeline", choices=["on", "off", "both"], default="on",
+                        help="MAP→REDUCE pipelining setting(s) to run")
+    parser.add_argument("--dedup", action="store_true", help="Enable near-duplicate elimination")
+    parser.add_argument("--extractive-ratios", type=lambda v: _csv(v, float), default=[0.0],
+                        help="Comma-separated extractive pre-compression ratios to compare (0 = off), e.g. 0,0.5")
+    parser.add_argument("--chunking", type=_csv, default=["recursive"],
+                        help="Comma-separated chunking modes to compare (recursive, cdc)")
+    parser.add_argument("--transcript-cleaning", choices=["on", "off", "both"], default="on",
+                        help="Transcript pre-cleaning setting(s) to run")
+    parser.add_argument("--adaptive-concurrency", choices=["on", "off", "both"], default="on",
+                        help="Adaptive (AIMD) LLM concurrency limiter setting(s) to run; off = fixed limit of LLM_CONCURRENCY_INITIAL")
+    parser.add_argument("--batch", action="store_true",
+                        help="Also condense all short documents together with condense_batch() (request packing)")
+    parser.add_argument("--pyramid", action="store_true",
+                        help="Build the summary pyramid after each run and time serving its levels from cache")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub time to first token, seconds")
+    parser.add_argument("--tps", type=float, default=4000.0, help="Stub generation speed, tokens/s")
+    parser.add_argument("--prefill-tps", type=float, default=0.0, help="Stub prompt processing speed, tokens/s (0 = free)")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="Disable the stub's prompt-prefix cache emulation")
+    parser.add_argument("--think-chars", type=int, default=0, help="Reasoning chars emitted before <final_script>")
+    parser.add_argument("--trail-chars", type=int, default=0, help="Chars generated after </final_script>")
+    parser.add_argument("--truncate-every", type=int, default=0,
+                        help="Cut every Nth MAP / REDUCE / single-pass response mid-script (0 = never)")
+    parser.add_argument("--server-slots", type=int, default=0, help="Max concurrent generations (0 = unlimited)")
+    parser.add_argument("--budget-model", default=DEFAULT_BUDGET_MODEL,
+                        help="models_collection key whose token budget sizes the chunks")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Report path, or '-' for stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show condenser logs")
+    parser.add_argument("--keep-artifacts", action="store_true", help="Keep each run's checkpoint directory")
+    args = parser.parse_args(argv)
+
+    pipelines = {"on": [True], "off": [False], "both": [True, False]}[args.pipeline]
+    cleanings = {"on": [True], "off": [False], "both": [True, False]}[args.transcript_cleaning]
+    adaptives = {"on": [True], "off": [False], "both": [True, False]}[args.adaptive_concurrency]
+    configs = [
+        {"strategy": strategy, "map_workers": workers, "pipeline": pipeline, "dedup": args.dedup,
+         "extractive_ratio": ratio, "chunking": chunking, "transcript_cleaning": cleaning,
+         "adaptive_concurrency": adaptive}
+        for strategy, workers, pipeline, ratio, chunking, cleaning, adaptive in itertools.product(
+            args.strategies, args.map_workers, pipelines, args.extractive_ratios, args.chunking, cleanings, adaptives
+        )
+    ]
+    corpus = build_corpus(args.sizes, args.kinds, args.seed)
+
+    server = StubLLMServer(
+        args.latency, args.tps, args.prefill_tps, args.think_chars, args.server_slots,
+        prefix_cache=not args.no_prefix_cache, trail_chars=args.trail_chars,
+        truncate_every=args.truncate_every,
+    ).start()
+    budget = get_model_budget(args.budget_model)
+    model = ChatOpenAI(
+        base_url=server.base_url,
+        api_key="test",
+        model="bench-stub",
+        temperature=0,
+        max_completion_tokens=budget["max_output_tokens"],
+        timeout=3600,
+    )
+
+    commit = _git_commit()
+    print(
+        f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Benchmark: {len(corpus)} documents × "
+        f"{len(configs)} configurations against stub at {server.base_url}"
+    )
+    runs = []
+    try:
+        for doc in corpus:
+            for config in configs:
+                record = run_one(
+                    doc, config, server, model, args.budget_model, args.verbose, args.keep_artifacts, args.pyramid
+                )
+                runs.append(record)
+                status = "ok" if record["error"] is None else f"ERROR {record['error']}"
+                if record.get("summary_pyramid"):
+                    pyramid = record["summary_pyramid"]
+                    status += (
+                        f"  pyramid build={pyramid['build_s']:.2f}s serve={pyramid['serve_ms']:.2f}ms "
+                        f"words={'/'.join(str(pyramid['words'][level]) for level in PYRAMID_LEVELS)}"
+                    )
+                prefill_s = sum(stage["prompt_processing_s"] for stage in record["llm_call_stats"].values())
+                print(
+                    f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] {record['doc']:<18} "
+                    f"strategy={config['strategy']:<7} workers={config['map_workers']} "
+                    f"pipeline={'on' if config['pipeline'] else 'off'} extractive={config['extractive_ratio']:g} "
+                    f"chunking={config['chunking']} cleaning={'on' if config['transcript_cleaning'] else 'off'} "
+                    f"adaptive={'on' if config['adaptive_concurrency'] else 'off'}  "
+                    f"wall={record['wall_s']:.2f}s out={record['output_chars']} "
+                    f"calls={record['llm_calls']} peak={record['peak_concurrent_requests']} "
+                    f"prefill={prefill_s:.2f}s io={record['checkpoint_io']['save_seconds']:.3f}s "
+                    f"({record['checkpoint_io']['saves']} saves)  {status}"
+                )
+        if args.batch:
+            short_docs = [
+                doc for doc in corpus if count_tokens(doc["text"]) <= condenser_service.BATCH_MAX_ARTICLE_TOKENS
+            ]
+            batch_run = run_batch(short_docs, server, model, args.budget_model, args.verbose)
+            runs.append(batch_run)
+            status = "ok" if batch_run["error"] is None else f"ERROR {batch_run['error']}"
+            print(
+                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] batch of {len(short_docs)} short documents  "
+                f"wall={batch_run['wall_s']:.2f}s out={batch_run['output_chars']} calls={batch_run['llm_calls']} "
+                f"({batch_run['batched_docs']} docs in {batch_run['batch_calls']} batch calls)  {status}"
+            )
+    finally:
+        server.stop()
+
+    report = {
+        "benchmark": "condenser",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "settings": {
+            "latency_s": args.latency,
+            "tps": args.tps,
+            "prefill_tps": args.prefill_tps,
+            "prefix_cache": not args.no_prefix_cache,
+            "think_chars": args.think_chars,
+            "trail_chars": args.trail_chars,
+            "truncate_every": args.truncate_every,
+            "server_slots": args.server_slots,
+            "budget_model": args.budget_model,
+            "budget": budget,
+            "seed": args.seed,
+            "reduce_batch_size": condenser_service.REDUCE_BATCH_SIZE,
+            "single_pass_max_tokens": condenser_service.SINGLE_PASS_MAX_TOKENS,
+            "extractive_min_tokens": condenser_service.EXTRACTIVE_MIN_TOKENS,
+            "salvage_continuations": condenser_service.SALVAGE_CONTINUATIONS,
+            "batch_max_article_tokens": condenser_service.BATCH_MAX_ARTICLE_TOKENS,
+            "batch_max_articles": condenser_service.BATCH_MAX_ARTICLES,
+            "pyramid_level_words": LEVEL_WORDS,
+            "map_chunk_token_limit": condenser_service.map_chunk_token_limit(args.budget_model),
+        },
+        "runs": runs,
+    }
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"condenser_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[SUCCESS] Benchmark report written to {output}")
+    return 0 if all(run["error"] is None for run in runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
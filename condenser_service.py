@@ -1,14 +1,230 @@
+import hashlib
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional, TypeVar
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from system_prompts import *
-from utils import remove_thinking_tokens
-from condensation_cache import save_checkpoint, MAX_RETRIES_PER_STEP
+from utils import count_tokens, remove_thinking_tokens, truncated_script
+from condensation_cache import record_stage_metric, save_checkpoint, MAX_RETRIES_PER_STEP
+from llm_models import get_model, get_model_budget
+from chunk_dedup import DEDUP_ENABLED, dedupe_chunks
+from content_chunking import split_content_defined
+from extractive_compression import EXTRACTIVE_MIN_TOKENS, EXTRACTIVE_RATIO, compress_extractive
+from llm_calls import call_llm, call_llm_hedged, summarize_calls, template_prefix
+from map_result_cache import get_map_result, map_result_key, put_map_result
+from summary_pyramid import LEVEL_WORDS, parse_pyramid, pyramid_source, source_hash
+from transcript_cleaning import TRANSCRIPT_CLEANING, clean_transcript
 
 # Configuration
 REDUCE_BATCH_SIZE = 3  # Number of chunks to reduce per batch (smaller = less hallucination)
 FINAL_CONSOLIDATION_THRESHOLD = 150000  # Chars threshold to trigger final consolidation
+# Max MAP chunks in flight at once.  1 = sequential (original behaviour) — raise it
+# when the LLM endpoint can serve parallel requests (LM Studio parallel slots, Groq);
+# the per-server concurrency limiter (llm_models.get_limiter) then decides how many
+# of those calls actually run.
+MAP_MAX_WORKERS = int(os.getenv("CONDENSER_MAP_WORKERS", "1"))
+# Content at or under this many tokens skips split/MAP/REDUCE and is condensed with
+# one combined prompt (single LLM call).  0 disables the fast path.
+SINGLE_PASS_MAX_TOKENS = int(os.getenv("CONDENSER_SINGLE_PASS_MAX_TOKENS", "4000"))
+# Batch condensation (/load_content_batch): sources of at most this many tokens are
+# packed, up to BATCH_MAX_ARTICLES per call, into one combined single-pass prompt so
+# short news articles share the per-call prompt, warmup and thinking overhead.
+BATCH_MAX_ARTICLE_TOKENS = int(os.getenv("CONDENSER_BATCH_MAX_ARTICLE_TOKENS", str(SINGLE_PASS_MAX_TOKENS)))
+BATCH_MAX_ARTICLES = int(os.getenv("CONDENSER_BATCH_MAX_ARTICLES", "6"))
+BATCH_ARTICLE_WRAPPER_TOKENS = 16  # <article id="N"> ... </article> delimiters per source
+# Stream MAP results into REDUCE: a REDUCE batch starts as soon as its own chunks
+# are mapped instead of waiting for the whole MAP phase.  "0" restores the barrier.
+PIPELINE_MAP_REDUCE = os.getenv("CONDENSER_PIPELINE", "1") != "0"
+# REDUCE strategy for multi-batch inputs:
+#   "chained" — batches run in order, each seeded with the tail of the previous one
+#   "tree"    — independent batch reductions per level, merged level by level
+REDUCE_STRATEGY = os.getenv("CONDENSER_REDUCE_STRATEGY", "chained")
+# Max tree-reduce nodes in flight at once within one level.
+REDUCE_MAX_WORKERS = int(os.getenv("CONDENSER_REDUCE_WORKERS", str(MAP_MAX_WORKERS)))
+# Which llm_models.resolve_stage_models() entry serves each LLM call stage.  The
+# single-pass prompt does MAP and REDUCE at once, so it uses the REDUCE model.
+STAGE_MODEL_ROLES = {
+    "single_pass": "reduce",
+    "map": "map",
+    "reduce": "reduce",
+    "reduce_with_context": "reduce",
+    "consolidation": "consolidation",
+}
+# Hedged MAP calls (llm_models "map_hedge" model): a MAP call still running after
+# the HEDGE_PERCENTILE-th percentile of recent MAP latencies is duplicated to the
+# hedge model.  Until HEDGE_MIN_SAMPLES latencies are known, HEDGE_INITIAL_DELAY_S applies.
+HEDGE_PERCENTILE = float(os.getenv("CONDENSER_HEDGE_PERCENTILE", "90"))
+HEDGE_INITIAL_DELAY_S = float(os.getenv("CONDENSER_HEDGE_INITIAL_DELAY_S", "60"))
+HEDGE_MIN_SAMPLES = 5
+HEDGE_WINDOW = 50  # recent MAP latencies the percentile is taken over
+# In-process attempts per MAP chunk / REDUCE batch / consolidation call before the
+# request fails with 422.  Every failed attempt still counts toward the step's
+# persisted MAX_RETRIES_PER_STEP budget, so this never grants extra attempts; the
+# default stays below that budget so a resubmitted request still gets a try.
+# 1 restores fail-fast (retry only by resubmitting the request).
+STEP_ATTEMPTS = int(os.getenv("CONDENSER_STEP_ATTEMPTS", "2"))
+# Backoff before in-process retry n: base * 2**(n-1), capped, with equal jitter
+RETRY_BACKOFF_S = float(os.getenv("CONDENSER_RETRY_BACKOFF_S", "2"))
+RETRY_BACKOFF_MAX_S = 30.0
+# HTTP statuses that retrying the same prompt cannot fix (bad request, auth, context too long)
+_PERMANENT_HTTP_STATUSES = {400, 401, 403, 404, 413, 422}
+# How split_content() places chunk boundaries:
+#   "recursive" — RecursiveCharacterTextSplitter, chunk sizes balanced over the document
+#   "cdc"       — content-defined (rolling hash, see content_chunking): an edit to the
+#                 source only changes the chunks around it, so re-condensing an updated
+#                 article reuses the MAP / REDUCE steps of its unchanged regions
+CHUNKING_MODE = os.getenv("CONDENSER_CHUNKING", "recursive")
+# Truncated-output salvage: when a response stops inside its <final_script> block,
+# the partial script is checkpointed in "partial_outputs" and up to this many
+# continuation requests finish it instead of re-running the step.  0 disables.
+SALVAGE_CONTINUATIONS = int(os.getenv("CONDENSER_SALVAGE_CONTINUATIONS", "2"))
+SALVAGE_MIN_CHARS = 200  # shorter partial scripts are cheaper to regenerate
+# Chars of the previous REDUCE batch carried into the next one (chained strategy)
+REDUCE_CONTEXT_CHARS = 3000
+# Tokens added per MAP output when packing REDUCE batches ("\n\n---\n\n" joiner)
+REDUCE_SEPARATOR_TOKENS = 4
+# Tree reduce stops merging once the joined level output fits in this many chars.
+TREE_REDUCE_BUDGET_CHARS = FINAL_CONSOLIDATION_THRESHOLD
+
+# Chunk sizing (tokens).  A MAP chunk must fit the model's context alongside the
+# prompt and the reserved output, and REDUCE_BATCH_SIZE MAP outputs (~40% of their
+# input each, per the system prompt's length target) must fit one generation with
+# room left for thinking tokens.
+CHUNK_OVERLAP_TOKENS = 50
+MAP_OUTPUT_RATIO = 0.4          # expected MAP output tokens per input token
+OUTPUT_SCRIPT_SHARE = 0.8       # share of max_output_tokens left for the script itself
+CONTEXT_SAFETY_TOKENS = 512     # slack for chat-template tokens and tokenizer mismatch
+MIN_CHUNK_TOKENS = 500
+
+# Version tag for the shared MAP result store: derived from the exact prompt text,
+# so editing the system or map prompt automatically invalidates old entries.
+MAP_PROMPT_VERSION = hashlib.sha256(
+    (yt_transcript_shortener_system_message + map_reduce_custom_prompts["map_prompt"]).encode()
+).hexdigest()[:12]
+
+
+def _extract_script(response_text: str, final_script: Optional[str]) -> tuple[str, bool]:
+    """Script found while the response streamed in, else remove_thinking_tokens() on the full text."""
+    if final_script is not None:
+        print(f"[CLEANUP] Extracted {len(final_script)} chars from final_script tag (removed {len(response_text) - len(final_script)} chars)")
+        return final_script, True
+    return remove_thinking_tokens(response_text)
+
+
+# Recent MAP-model latencies (seconds) across runs, for map_hedge_delay()
+_map_latencies: deque = deque(maxlen=HEDGE_WINDOW)
+_map_latency_lock = threading.Lock()
+
+
+def map_hedge_delay() -> float:
+    """Seconds to wait for a MAP call before hedging: nearest-rank HEDGE_PERCENTILE of recent latencies."""
+    with _map_latency_lock:
+        latencies = sorted(_map_latencies)
+    if len(latencies) < HEDGE_MIN_SAMPLES:
+        return HEDGE_INITIAL_DELAY_S
+    rank = max(1, math.ceil(HEDGE_PERCENTILE / 100 * len(latencies)))
+    return latencies[rank - 1]
+
+
+def _record_map_latency(seconds: float) -> None:
+    with _map_latency_lock:
+        _map_latencies.append(seconds)
+
+
+def _prompt_hash(user_text: str) -> str:
+    """Identity of a step's rendered prompt, for partial_outputs and step_hashes."""
+    return hashlib.sha256(user_text.encode()).hexdigest()[:16]
+
+
+def _retry_delay(attempt: int) -> float:
+    """Seconds to wait after failed attempt ``attempt`` (1-based): exponential, equal jitter."""
+    ceiling = min(RETRY_BACKOFF_MAX_S, RETRY_BACKOFF_S * 2 ** (attempt - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def _is_permanent_error(exc: Exception) -> bool:
+    """True for provider errors that will fail again with the same prompt."""
+    return getattr(exc, "status_code", None) in _PERMANENT_HTTP_STATUSES
+
+
+_T = TypeVar("_T")
+
+
+def _run_with_retries(
+    attempt_once: Callable[[], tuple[Optional[_T], str]],
+    label: str,
+    bump_retry: Optional[Callable[[], int]] = None,
+) -> _T:
+    """Run one LLM step attempt after another with backoff until one succeeds.
+
+    ``attempt_once`` returns (result, error_msg); a None result is a failed
+    attempt (e.g. no <final_script> block) described by error_msg.  An
+    exception is a failed attempt too, and a permanent provider error stops at
+    once.  ``bump_retry`` persists one failed attempt and returns the step's new
+    retry count (checkpointed steps); without it the attempt number counts.
+    Attempts stop at STEP_ATTEMPTS or once the count reaches
+    MAX_RETRIES_PER_STEP, and the last error is raised as ValueError.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        permanent = False
+        try:
+            result, error_msg = attempt_once()
+        except Exception as e:
+            error_msg = f"Model crashed during {label}: {e}"
+            permanent = _is_permanent_error(e)
+        else:
+            if result is not None:
+                return result
+        print(f"[ERROR] {error_msg}")
+
+        retries_used = bump_retry() if bump_retry is not None else attempt
+        if permanent or attempt >= STEP_ATTEMPTS or retries_used >= MAX_RETRIES_PER_STEP:
+            raise ValueError(error_msg)
+        delay = _retry_delay(attempt)
+        print(
+            f"[WARNING] {label}: retrying in {delay:.1f}s "
+            f"(attempt {attempt + 1}, {retries_used}/{MAX_RETRIES_PER_STEP} retries used)"
+        )
+        time.sleep(delay)
+
+
+def _run_ordered(tasks: list[Callable[[], str]], max_workers: int, name: str) -> list[str]:
+    """Run zero-arg tasks on a bounded thread pool and return results in task order.
+
+    Tasks already running when a sibling fails still finish (and checkpoint);
+    tasks that never started are cancelled.  The error of the lowest failing
+    task index is re-raised so failures read the same as in sequential mode.
+    """
+    if max_workers <= 1 or len(tasks) <= 1:
+        return [task() for task in tasks]
+
+    results: list[Optional[str]] = [None] * len(tasks)
+    failures: dict[int, Exception] = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name) as executor:
+        futures = {executor.submit(task): i for i, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            i = futures[future]
+            if future.cancelled():
+                continue
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                failures[i] = e
+                for other in futures:
+                    other.cancel()
+    if failures:
+        raise failures[min(failures)]
+    return results  # type: ignore[return-value]
 
 
 def condense_content(
@@ -16,6 +232,9 @@ def condense_content(
     current_model,
     checkpoint_key: Optional[str] = None,
     checkpoint: Optional[dict] = None,
+    model_key: Optional[str] = None,
+    on_progress: Optional[Callable[[str, dict], None]] = None,
+    stage_models: Optional[dict[str, str]] = None,
 ) -> str:
     """Run map-reduce condensation, resuming from checkpoint if provided.
 
@@ -25,18 +244,376 @@ def condense_content(
         checkpoint_key: Key for atomic checkpoint saves.  None = no persistence.
         checkpoint:     Mutable checkpoint dict; updated in-place and saved after
                         every step so a crash loses at most one step's work.
+        model_key:      Key of ``current_model`` in ``models_collection``; sizes the
+                        chunks from its token budget and scopes the shared MAP
+                        result store.  Defaults to the checkpoint's ``model_key``.
+        on_progress:    Optional callback(event, payload).  Receives ``"stage"``
+                        events, ``"map_chunk"`` {index, total} as chunks finish
+                        (possibly from MAP worker threads) and ``"reduce_batch"``
+                        {index, total, total_estimated, text} for every finished
+                        REDUCE batch, in order.  While chained REDUCE is still
+                        planning batches behind MAP, ``total`` is an estimate and
+                        ``total_estimated`` is True.  Exceptions raised by the
+                        callback are logged and ignored.
+        stage_models:   Optional routing {"map", "reduce", "consolidation"} ->
+                        models_collection key (llm_models.resolve_stage_models());
+                        stages without an entry use ``current_model``.  A
+                        "map_hedge" entry hedges MAP calls to that model.  Defaults
+                        to the checkpoint's ``stage_models``.  Chunks
+                        are sized to fit both the MAP and the REDUCE model, and
+                        the shared MAP result store is keyed by the MAP model.
+
+    YouTube content (checkpoint ``mode``) is first stripped of caption cues,
+    fillers and repeated caption lines (transcript_cleaning, stats in
+    ``cleaning_stats``).  Content of at most ``SINGLE_PASS_MAX_TOKENS`` tokens
+    skips map-reduce and is condensed with one combined prompt.  Otherwise MAP chunks fan out over up to
+    ``MAP_MAX_WORKERS`` threads; results are
+    always returned in chunk order regardless of completion order.  Multi-batch
+    REDUCE follows ``REDUCE_STRATEGY`` ("chained" or "tree"); the strategy,
+    tree depth / fan-out and REDUCE latency are recorded in ``reduce_stats``.
+    Every LLM call sends the system prompt as a real system message (see
+    llm_calls) and appends its token / prompt-processing stats to ``llm_calls``.
 
     Returns:
         Condensed text string.
     """
     _has_checkpoint = checkpoint_key is not None and checkpoint is not None
+    # Guards every checkpoint mutation + save: MAP workers update the shared dict
+    # concurrently and json.dump must never see it mid-mutation.
+    _state_lock = threading.RLock()
 
     def _save() -> None:
         if _has_checkpoint:
-            save_checkpoint(checkpoint_key, checkpoint)  # type: ignore[arg-type]
+            with _state_lock:
+                save_checkpoint(checkpoint_key, checkpoint)  # type: ignore[arg-type]
+
+    def _emit(event: str, **payload) -> None:
+        if on_progress is None:
+            return
+        try:
+            on_progress(event, payload)
+        except Exception as e:
+            print(f"[WARNING] condense_content: progress callback failed for '{event}': {e}")
+
+    run_calls: list[dict] = []
+
+    def _call_llm(
+        stage: str,
+        template: str,
+        user_text: str,
+        label: str,
+        metric: tuple[str, str],
+        continuation_of: Optional[str] = None,
+    ) -> tuple[str, Optional[str], str]:
+        """Role-separated call: shared system message, then the rendered stage template.
+
+        Returns (response_text, final_script, model_key) — see llm_calls.call_llm();
+        model_key is the model that produced the response.  MAP calls are hedged
+        to the "map_hedge" model when one is routed.  Per-call
+        stats (prompt tokens, cached tokens, prompt-processing time) are appended
+        to checkpoint["llm_calls"], and the call's latency and token counts are
+        recorded as checkpoint["metrics"][metric stage][metric key]; both are
+        saved with the step's result.
+
+        ``continuation_of`` marks a salvage continuation of that rendered
+        prompt: it is logged as stage "<stage>_continuation", is never hedged,
+        and its cacheable prefix is the whole original prompt.
+        """
+        model, stats_model_key = _stage_models.get(STAGE_MODEL_ROLES[stage], (current_model, model_key))
+        hedge = _stage_models.get("map_hedge") if stage == "map" and continuation_of is None else None
+        if hedge is not None:
+            hedge_after = map_hedge_delay()
+            model_keys = {"primary": stats_model_key, "hedge": hedge[1]}
+
+            def _record_loser(role: str, loser_stats: dict) -> None:
+                # The losing request was sent too: keep its tokens in llm_calls
+                loser_stats = {**loser_stats, "model_key": model_keys[role], "hedge_loser": True}
+                with _state_lock:
+                    run_calls.append(loser_stats)
+                    if _has_checkpoint:
+                        checkpoint.setdefault("llm_calls", []).append(loser_stats)
+
+            text, script, stats = call_llm_hedged(
+                model,
+                hedge[0],
+                hedge_after,
+                yt_transcript_shortener_system_message,
+                user_text,
+                stage=stage,
+                prefix_chars=len(template_prefix(template)),
+                label=label,
+                on_loser=_record_loser,
+            )
+            stats["hedge_after_s"] = round(hedge_after, 3)
+            if stats["hedge_winner"] == "hedge":
+                stats_model_key = hedge[1]
+                # The MAP model had been running for at least this long: a lower bound
+                _record_map_latency(hedge_after + stats["latency_s"])
+            else:
+                _record_map_latency(stats["latency_s"])
+        else:
+            text, script, stats = call_llm(
+                model,
+                yt_transcript_shortener_system_message,
+                user_text,
+                stage=stage if continuation_of is None else f"{stage}_continuation",
+                prefix_chars=len(template_prefix(template) if continuation_of is None else continuation_of),
+                label=label,
+            )
+        stats["model_key"] = stats_model_key
+        with _state_lock:
+            run_calls.append(stats)
+            if _has_checkpoint:
+                checkpoint.setdefault("llm_calls", []).append(stats)
+                record_stage_metric(
+                    checkpoint, metric[0], stats["latency_s"], key=metric[1],
+                    prompt_tokens=stats["prompt_tokens"],
+                    completion_tokens=stats["completion_tokens"],
+                    cached_tokens=stats["cached_tokens"],
+                    prompt_processing_s=stats["prompt_processing_s"],
+                )
+        print(
+            f"[DEBUG] {label}: prompt processing {stats['prompt_processing_s']}s, "
+            f"{stats['prompt_tokens']} prompt tokens ({stats['cached_tokens']} cached), total {stats['latency_s']}s"
+            + (" (stopped at </final_script>)" if stats["stopped_early"] else "")
+            + (f" (hedged after {stats['hedge_after_s']}s, {stats['hedge_winner']} won)" if stats.get("hedged") else "")
+        )
+        return text, script, stats_model_key
+
+    partial_outputs: dict = checkpoint.setdefault("partial_outputs", {}) if _has_checkpoint else {}
+    # Prompt hash of every finished step, and outputs of the previous content version
+    # by prompt hash (condensation_cache.reset_for_content_update()): a step whose
+    # prompt is unchanged since then reuses its output without an LLM call.
+    step_hashes: dict = checkpoint.setdefault("step_hashes", {}) if _has_checkpoint else {}
+    reusable_outputs: dict = (checkpoint.get("reusable_outputs") or {}) if _has_checkpoint else {}
+    reused_steps: list[str] = []
+
+    def _attempt_step(
+        stage: str, template: str, user_text: str, label: str, metric: tuple[str, str]
+    ) -> tuple[Optional[str], str]:
+        """One attempt at a step: (cleaned_script or None on failed extraction, model_key).
+
+        A response cut off inside its <final_script> block is salvaged rather
+        than discarded: the partial script is checkpointed under
+        partial_outputs["<metric stage>:<metric key>"] (with a hash of the
+        prompt, so a resumed run only reuses it for identical input) and
+        finished by up to SALVAGE_CONTINUATIONS continuation requests.  The
+        next attempt — in-process or after resubmitting — resumes a stored
+        partial instead of calling the step prompt again.
+        """
+        step = f"{metric[0]}:{metric[1]}"
+        prompt_hash = _prompt_hash(user_text)
+        with _state_lock:
+            partial = partial_outputs.get(step)
+        if partial is not None and partial.get("prompt_hash") != prompt_hash:
+            partial = None
+        if partial is not None and partial["continuations"] >= SALVAGE_CONTINUATIONS:
+            # Stored by a run that stopped before dropping it: nothing left to resume,
+            # so regenerate in this attempt instead of spending it on the partial
+            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] {label}: salvaged partial has no continuations left, regenerating")
+            with _state_lock:
+                partial_outputs.pop(step, None)
+            _save()
+            partial = None
+        if partial is None:
+            text, script, served_by = _call_llm(stage, template, user_text, label, metric)
+            print(f"[DEBUG] {label} complete: {len(text)} chars")
+            cleaned, success = _extract_script(text, script)
+            if success:
+                return cleaned, served_by
+            salvaged = truncated_script(text) if SALVAGE_CONTINUATIONS > 0 else None
+            if salvaged is None or len(salvaged) < SALVAGE_MIN_CHARS:
+                return None, served_by
+            partial = {"prompt_hash": prompt_hash, "text": salvaged, "model_key": served_by, "continuations": 0}
+            with _state_lock:
+                partial_outputs[step] = partial
+            _save()
+            print(f"[WARNING] {label}: response cut off inside <final_script>, salvaging {len(salvaged)} chars")
+        else:
+            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] {label}: resuming salvaged partial script ({len(partial['text'])} chars)")
+
+        continuation_template = map_reduce_custom_prompts["continuation_prompt"]
+        while partial["continuations"] < SALVAGE_CONTINUATIONS:
+            with _state_lock:
+                partial["continuations"] += 1
+            _save()
+            text, script, _ = _call_llm(
+                stage,
+                continuation_template,
+                continuation_template.format(original_prompt=user_text, partial_script=partial["text"]),
+                f"{label} continuation {partial['continuations']}",
+                (f"{metric[0]}_continuation", f"{metric[1]}:{partial['continuations']}"),
+                continuation_of=user_text,
+            )
+            rest, success = _extract_script(text, script)
+            if success:
+                with _state_lock:
+                    partial_outputs.pop(step, None)
+                print(f"[SUCCESS] {label}: salvaged script completed with {partial['continuations']} continuation(s)")
+                return f"{partial['text']} {rest}".strip(), partial["model_key"]
+            more = truncated_script(text)
+            if more is None:
+                break
+            with _state_lock:
+                partial["text"] = f"{partial['text']} {more}"
+            _save()
+            print(f"[WARNING] {label}: continuation {partial['continuations']} was cut off too, {len(partial['text'])} chars so far")
+
+        # Continuations exhausted: the next attempt regenerates the step from scratch
+        with _state_lock:
+            partial_outputs.pop(step, None)
+        _save()
+        return None, partial["model_key"]
+
+    def _run_step(
+        stage: str,
+        template: str,
+        user_text: str,
+        label: str,
+        metric: tuple[str, str],
+        bump_retry: Callable[[], int],
+    ) -> tuple[str, str]:
+        """LLM call + script extraction for one step, retried in-process with backoff.
+
+        Returns (cleaned_script, model_key of the model that wrote it).
+
+        ``bump_retry`` persists one failed attempt and returns the step's new
+        retry count.  Attempts stop at STEP_ATTEMPTS, once that count reaches
+        MAX_RETRIES_PER_STEP, or on a permanent provider error; the last error
+        is then raised as ValueError (422 with resume progress in app.py).
+
+        A step whose rendered prompt matches one in ``reusable_outputs`` returns
+        that output without calling the model.
+        """
+        step = f"{metric[0]}:{metric[1]}"
+        prompt_hash = _prompt_hash(user_text)
+        reused = reusable_outputs.get(prompt_hash)
+        if reused is not None:
+            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] {label}: input unchanged since the previous content version, reusing its output")
+            with _state_lock:
+                step_hashes[step] = prompt_hash
+                reused_steps.append(step)
+            return reused, _stage_models.get(STAGE_MODEL_ROLES[stage], (current_model, model_key))[1]
+
+        def _attempt() -> tuple[Optional[tuple[str, str]], str]:
+            cleaned, served_by = _attempt_step(stage, template, user_text, label, metric)
+            if cleaned is None:
+                return None, f"Failed to remove thinking tokens from {label}"
+            return (cleaned, served_by), ""
+
+        cleaned, served_by = _run_with_retries(_attempt, label, bump_retry if _has_checkpoint else None)
+        with _state_lock:
+            step_hashes[step] = prompt_hash
+        return cleaned, served_by
+
+    def _finish_content_update() -> None:
+        """Record how many steps an updated content version reused, then drop the stale outputs."""
+        if not reusable_outputs:
+            return
+        revision = checkpoint.get("content_revision") or {}
+        checkpoint["content_revision"] = {**revision, "reused_steps": len(reused_steps), "steps": len(step_hashes)}
+        checkpoint["reusable_outputs"] = {}
+        print(
+            f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Content update: reused {len(reused_steps)} of "
+            f"{len(step_hashes)} condenser steps from the previous version"
+        )
+
+    def _log_call_summary() -> None:
+        for stage, totals in summarize_calls(run_calls).items():
+            print(
+                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] LLM calls [{stage}]: {totals['calls']} calls, "
+                f"prompt processing {totals['prompt_processing_s']}s, "
+                f"{totals['cached_tokens']}/{totals['prompt_tokens']} prompt tokens cached, "
+                f"{totals['distinct_prefixes']} distinct prefix(es)"
+            )
 
     print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] condense_content: Starting condensation for {len(content)} chars")
 
+    if model_key is None and _has_checkpoint:
+        model_key = checkpoint.get("model_key")
+    if stage_models is None and _has_checkpoint:
+        stage_models = checkpoint.get("stage_models")
+
+    # role -> (model, key) for routed stages; _call_llm falls back to current_model
+    _stage_models = {role: (get_model(key), key) for role, key in (stage_models or {}).items() if key}
+    map_model_key = (stage_models or {}).get("map", model_key)
+    reduce_model_key = (stage_models or {}).get("reduce", model_key)
+    # MAP chunks must fit the MAP model's context and REDUCE_BATCH_SIZE of their
+    # outputs one REDUCE generation: size them for whichever model is tighter
+    chunk_model_key = min((map_model_key, reduce_model_key), key=map_chunk_token_limit)
+
+    # ------------------------------------------------------------------
+    # Transcript pre-cleaning — deterministic, so a resumed run cleans the
+    # same way and single-pass / split see identical text.
+    # ------------------------------------------------------------------
+    if TRANSCRIPT_CLEANING and _has_checkpoint and checkpoint.get("mode") == "youtube":
+        content, cleaning_stats = clean_transcript(content, count_tokens)
+        print(
+            f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Transcript cleaning: removed "
+            f"{cleaning_stats['cues_removed']} cues, {cleaning_stats['fillers_removed']} fillers, "
+            f"{cleaning_stats['repeated_words_removed']} repeated words, "
+            f"{cleaning_stats['chars_before']} → {cleaning_stats['chars_after']} chars, "
+            f"saved {cleaning_stats['tokens_saved']} tokens in {cleaning_stats['elapsed_s']}s"
+        )
+        checkpoint["cleaning_stats"] = cleaning_stats
+
+    # ------------------------------------------------------------------
+    # Stage 0 — single-pass fast path for short content.  Decided once: a
+    # checkpoint that already has a split stays on the map-reduce path.
+    # ------------------------------------------------------------------
+    if _has_checkpoint and checkpoint.get("single_pass") is not None:
+        use_single_pass = checkpoint["single_pass"]
+    elif _has_checkpoint and checkpoint.get("map_chunks"):
+        use_single_pass = False
+    else:
+        content_tokens = count_tokens(content)
+        use_single_pass = (
+            SINGLE_PASS_MAX_TOKENS > 0
+            and content_tokens <= min(SINGLE_PASS_MAX_TOKENS, map_chunk_token_limit(reduce_model_key))
+        )
+        if use_single_pass:
+            print(
+                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Single-pass mode: "
+                f"{content_tokens} tokens <= {SINGLE_PASS_MAX_TOKENS} token threshold"
+            )
+        if _has_checkpoint:
+            checkpoint["single_pass"] = use_single_pass
+
+    if use_single_pass:
+        if _has_checkpoint:
+            retries_used = checkpoint.get("single_pass_retries", 0)
+            if retries_used >= MAX_RETRIES_PER_STEP:
+                raise ValueError(f"Single-pass condensation exceeded max retries ({MAX_RETRIES_PER_STEP}).")
+
+        def _bump_single_pass_retry() -> int:
+            checkpoint["single_pass_retries"] = checkpoint.get("single_pass_retries", 0) + 1
+            _save()
+            return checkpoint["single_pass_retries"]
+
+        single_pass_prompt = map_reduce_custom_prompts["single_pass_prompt"]
+        single_pass_input = single_pass_prompt.replace('{content_text}', content)
+        single_pass_started = time.time()
+        _emit("stage", stage="single_pass")
+        print(f"[DEBUG] Running single-pass condensation...")
+        final_output, _ = _run_step(
+            "single_pass", single_pass_prompt, single_pass_input, "single-pass condensation",
+            ("single_pass", "0"), _bump_single_pass_retry,
+        )
+
+        if _has_checkpoint:
+            checkpoint["reduce_stats"] = {
+                "strategy": "single_pass",
+                "critical_path_calls": 1,
+                "elapsed_s": round(time.time() - single_pass_started, 2),
+            }
+            checkpoint["final_output"] = final_output
+            _finish_content_update()
+            _save()
+
+        _log_call_summary()
+        print(f"[SUCCESS] Condensation complete (single pass). Original: {len(content)} -> Final: {len(final_output)} chars")
+        return final_output
+
     # ------------------------------------------------------------------
     # Stage 1 — split into chunks (idempotent; reuse stored split on resume)
     # ------------------------------------------------------------------
@@ -44,7 +621,32 @@ def condense_content(
         chunks = checkpoint["map_chunks"]
         print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: reusing {len(chunks)} stored chunks from checkpoint")
     else:
-        chunks = split_content(content)
+        map_source = content
+        if 0 < EXTRACTIVE_RATIO < 1 and count_tokens(content) > EXTRACTIVE_MIN_TOKENS:
+            # Keep the most central sentences so filler never reaches MAP
+            map_source, extractive_stats = compress_extractive(content, EXTRACTIVE_RATIO, count_tokens)
+            print(
+                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Extractive pre-compression: kept "
+                f"{extractive_stats['units_kept']}/{extractive_stats['units_total']} sentences, "
+                f"{extractive_stats['chars_before']} → {extractive_stats['chars_after']} chars, "
+                f"saved {extractive_stats['tokens_saved']} tokens in {extractive_stats['elapsed_s']}s"
+            )
+            if _has_checkpoint:
+                checkpoint["extractive_stats"] = extractive_stats
+        chunks = split_content(map_source, chunk_model_key)
+        if DEDUP_ENABLED:
+            # Drop repeated sponsor reads / recaps / split overlap before they reach MAP;
+            # CDC chunks keep their boundaries so unchanged chunks stay reusable
+            chunks, dedup_stats = dedupe_chunks(
+                chunks, map_chunk_token_limit(chunk_model_key), count_tokens, merge=CHUNKING_MODE != "cdc"
+            )
+            print(
+                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Dedup: dropped {dedup_stats['spans_dropped']}/"
+                f"{dedup_stats['spans_total']} spans ({dedup_stats['near_duplicates_dropped']} near-duplicates) + {dedup_stats['runs_dropped']} repeated runs, {dedup_stats['chunks_before']} → {dedup_stats['chunks_after']} chunks, "
+                f"saved {dedup_stats['tokens_saved']} tokens"
+            )
+            if _has_checkpoint:
+                checkpoint["dedup_stats"] = dedup_stats
         if _has_checkpoint:
             checkpoint["map_chunks"] = chunks
             _save()
@@ -55,24 +657,30 @@ def condense_content(
     reduce_with_context_prompt = map_reduce_custom_prompts["reduce_with_context_prompt"]
 
     # ------------------------------------------------------------------
-    # Stage 2 — MAP phase
+    # Stage 2 — MAP phase (bounded fan-out; results kept in chunk order)
     # ------------------------------------------------------------------
-    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Starting MAP phase ({len(chunks)} chunks)")
-    processed_chunks: list[str] = []
+    map_workers = max(1, min(MAP_MAX_WORKERS, len(chunks)))
+    _emit("stage", stage="map", chunks=len(chunks))
+    print(
+        f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Starting MAP phase "
+        f"({len(chunks)} chunks, {map_workers} worker{'s' if map_workers != 1 else ''})"
+    )
 
-    for idx, chunk in enumerate(chunks):
-        str_idx = str(idx)
+    def _bump_map_retry(str_idx: str) -> int:
+        with _state_lock:
+            checkpoint["map_retry_counts"][str_idx] = (
+                checkpoint["map_retry_counts"].get(str_idx, 0) + 1
+            )
+            _save()
+            return checkpoint["map_retry_counts"][str_idx]
 
-        # Resume: skip already-completed chunks
-        if _has_checkpoint and str_idx in checkpoint["map_results"]:
-            cached = checkpoint["map_results"][str_idx]
-            processed_chunks.append(cached)
-            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: MAP chunk {idx + 1}/{len(chunks)} already complete, skipping")
-            continue
+    def _map_chunk(idx: int, chunk: str) -> str:
+        str_idx = str(idx)
 
         # Retry cap: fail fast if this chunk has already blown its budget
         if _has_checkpoint:
-            retries_used = checkpoint["map_retry_counts"].get(str_idx, 0)
+            with _state_lock:
+                retries_used = checkpoint["map_retry_counts"].get(str_idx, 0)
             if retries_used >= MAX_RETRIES_PER_STEP:
                 error_msg = (
                     f"MAP chunk {idx + 1}/{len(chunks)} exceeded max retries "
@@ -82,301 +690,832 @@ def condense_content(
                 print(f"[ERROR] {error_msg}")
                 raise ValueError(error_msg)
 
-        print(f"[DEBUG] Processing MAP chunk {idx + 1}/{len(chunks)} ({len(chunk)} chars)")
-        map_input = f"""
-            System:
-            {yt_transcript_shortener_system_message}
-            Input:
-            {map_prompt.replace('{chunk_text}', chunk)}
-        """
+        map_input = map_prompt.replace('{chunk_text}', chunk)
 
-        try:
-            response = current_model.invoke(map_input)
-            chunk_response_text = response.content
-        except Exception as e:
-            print(f"[ERROR] Model crashed during MAP chunk {idx + 1}/{len(chunks)}: {e}")
-            if _has_checkpoint:
-                checkpoint["map_retry_counts"][str_idx] = (
-                    checkpoint["map_retry_counts"].get(str_idx, 0) + 1
-                )
-                _save()
-            raise ValueError(f"Model crashed during MAP chunk {idx + 1}/{len(chunks)}: {e}")
+        # Shared content-addressed store: the same chunk may already have been
+        # condensed under another URL, fetch mode or an expired checkpoint.
+        store_key = map_result_key(chunk, MAP_PROMPT_VERSION, map_model_key) if map_model_key else None
+        if store_key:
+            stored = get_map_result(store_key)
+            if stored is not None:
+                print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] MAP chunk {idx + 1}/{len(chunks)} served from shared MAP result store")
+                if _has_checkpoint:
+                    with _state_lock:
+                        checkpoint["map_results"][str_idx] = stored
+                        step_hashes[f"map:{str_idx}"] = _prompt_hash(map_input)
+                        _save()
+                _emit("map_chunk", index=idx, total=len(chunks))
+                return stored
 
-        print(f"[DEBUG] MAP chunk {idx + 1} complete: {len(chunk_response_text)} chars")
-        cleaned, success = remove_thinking_tokens(chunk_response_text)
+        print(f"[DEBUG] Processing MAP chunk {idx + 1}/{len(chunks)} ({len(chunk)} chars)")
 
-        if not success:
-            error_msg = f"Failed to remove thinking tokens from MAP chunk {idx + 1}/{len(chunks)}"
-            print(f"[ERROR] {error_msg}")
-            # Persist retry count before raising so the caller can resume
-            if _has_checkpoint:
-                checkpoint["map_retry_counts"][str_idx] = (
-                    checkpoint["map_retry_counts"].get(str_idx, 0) + 1
-                )
-                _save()
-            raise ValueError(error_msg)
+        llm_started = time.time()
+        cleaned, served_by = _run_step(
+            "map", map_prompt, map_input, f"MAP chunk {idx + 1}/{len(chunks)}", ("map", str_idx),
+            lambda: _bump_map_retry(str_idx),
+        )
 
         # Success — persist before moving on
         if _has_checkpoint:
-            checkpoint["map_results"][str_idx] = cleaned
-            _save()
+            with _state_lock:
+                checkpoint["map_results"][str_idx] = cleaned
+                _save()
+        if store_key:
+            if served_by != map_model_key:
+                # Hedged call won by the hedge model: file it under the model that wrote it
+                store_key = map_result_key(chunk, MAP_PROMPT_VERSION, served_by)
+            put_map_result(store_key, cleaned, served_by, MAP_PROMPT_VERSION, time.time() - llm_started)
 
-        processed_chunks.append(cleaned)
         print(f"[DEBUG] MAP chunk {idx + 1} processed: {len(cleaned)} chars")
+        _emit("map_chunk", index=idx, total=len(chunks))
+        return cleaned
 
-    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] MAP phase complete. {len(processed_chunks)} chunks processed")
+    # Every chunk gets a Future: resumed chunks are pre-resolved, the rest run on
+    # the MAP pool.  REDUCE pulls results through _map_output(), so with
+    # PIPELINE_MAP_REDUCE a batch is reduced while later chunks are still mapping.
+    map_futures: list[Future] = []
+    pending: list[int] = []
+    for idx in range(len(chunks)):
+        # Resume: skip already-completed chunks
+        if _has_checkpoint and str(idx) in checkpoint["map_results"]:
+            done: Future = Future()
+            done.set_result(checkpoint["map_results"][str(idx)])
+            map_futures.append(done)
+            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: MAP chunk {idx + 1}/{len(chunks)} already complete, skipping")
+        else:
+            map_futures.append(None)  # type: ignore[arg-type]
+            pending.append(idx)
 
-    # ------------------------------------------------------------------
-    # Stage 3 — REDUCE phase
-    # ------------------------------------------------------------------
-    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Starting REDUCE phase")
+    map_executor = ThreadPoolExecutor(max_workers=map_workers, thread_name_prefix="map")
+    map_remaining = [len(pending)]
+    map_failed = threading.Event()
 
-    if len(processed_chunks) <= REDUCE_BATCH_SIZE:
-        # ---- Single-batch reduce ----
-        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Single batch mode ({len(processed_chunks)} chunks)")
+    def _on_map_done(future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            # Fail fast: chunks already running finish and checkpoint, the rest never start
+            map_failed.set()
+            for other in map_futures:
+                other.cancel()
+        with _state_lock:
+            map_remaining[0] -= 1
+            if map_remaining[0] == 0 and not map_failed.is_set():
+                print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] MAP phase complete. {len(chunks)} chunks processed")
 
-        # Re-use cached result if it exists (covers single-batch reduce resume)
-        if _has_checkpoint and checkpoint["reduce_results"].get("0"):
-            final_output = checkpoint["reduce_results"]["0"]
-            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: single-batch REDUCE already complete, skipping")
-        else:
-            if _has_checkpoint:
-                retry_count = checkpoint["reduce_retry_counts"].get("0", 0)
-                if retry_count >= MAX_RETRIES_PER_STEP:
-                    raise ValueError(
-                        f"Single-batch REDUCE exceeded max retries ({MAX_RETRIES_PER_STEP})."
-                    )
+    for idx in pending:
+        map_futures[idx] = map_executor.submit(_map_chunk, idx, chunks[idx])
+    for idx in pending:
+        map_futures[idx].add_done_callback(_on_map_done)
+    if not pending:
+        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] MAP phase complete. {len(chunks)} chunks processed")
 
-            combined_chunks = "\n\n---\n\n".join(processed_chunks)
-            reduce_input = f"""
-                    System:
-                    {yt_transcript_shortener_system_message}
-                    Input:
-                    {reduce_prompt.replace('{combined_map_results}', combined_chunks)}
-                """
+    def _map_output(idx: int) -> str:
+        try:
+            return map_futures[idx].result()
+        except CancelledError:
+            raise ValueError(f"MAP chunk {idx + 1}/{len(chunks)} was cancelled after an earlier chunk failed")
 
-            print(f"[DEBUG] Running REDUCE phase...")
-            try:
-                response = current_model.invoke(reduce_input)
-                reduce_response_text = response.content
-            except Exception as e:
-                print(f"[ERROR] Model crashed during single-batch REDUCE: {e}")
-                if _has_checkpoint:
-                    checkpoint["reduce_retry_counts"]["0"] = (
-                        checkpoint["reduce_retry_counts"].get("0", 0) + 1
-                    )
-                    _save()
-                raise ValueError(f"Model crashed during single-batch REDUCE: {e}")
+    def _map_outputs(start: int, end: int) -> list[str]:
+        return [_map_output(i) for i in range(start, end)]
 
-            print(f"[DEBUG] REDUCE complete: {len(reduce_response_text)} chars")
-            cleaned_reduce, success = remove_thinking_tokens(reduce_response_text)
-            if not success:
-                error_msg = "Failed to remove thinking tokens from single-batch REDUCE phase"
-                print(f"[ERROR] {error_msg}")
-                if _has_checkpoint:
-                    checkpoint["reduce_retry_counts"]["0"] = (
-                        checkpoint["reduce_retry_counts"].get("0", 0) + 1
-                    )
+    try:
+        if not PIPELINE_MAP_REDUCE:
+            # Inside the try: a failed chunk must still join the executor below
+            _map_outputs(0, len(chunks))  # barrier: finish MAP before any REDUCE
+
+        # ------------------------------------------------------------------
+        # Stage 3 — REDUCE phase
+        # ------------------------------------------------------------------
+        # Pin the strategy on first use so a resume never mixes chained batch
+        # results with tree nodes after the env var changes.
+        reduce_strategy = REDUCE_STRATEGY
+        if _has_checkpoint:
+            # Pipelined MAP workers may still be saving the checkpoint
+            with _state_lock:
+                pinned_strategy = checkpoint.get("reduce_strategy")
+                if pinned_strategy is None:
+                    checkpoint["reduce_strategy"] = reduce_strategy
                     _save()
-                raise ValueError(error_msg)
+            if pinned_strategy is not None and pinned_strategy != reduce_strategy:
+                print(
+                    f"[WARNING] Checkpoint was started with reduce_strategy="
+                    f"'{pinned_strategy}' — keeping it instead of '{reduce_strategy}'"
+                )
+                reduce_strategy = pinned_strategy
+        if reduce_strategy not in ("chained", "tree"):
+            print(f"[WARNING] Unknown reduce strategy '{reduce_strategy}', falling back to 'chained'")
+            reduce_strategy = "chained"
 
-            if _has_checkpoint:
-                checkpoint["reduce_results"]["0"] = cleaned_reduce
-                checkpoint["reduce_batches_total"] = 1
-                _save()
+        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Starting REDUCE phase (strategy={reduce_strategy})")
+        _emit("stage", stage="reduce", strategy=reduce_strategy)
+        reduce_started = time.time()
+        reduce_stats: dict = {"strategy": reduce_strategy}
 
-            final_output = cleaned_reduce
+        def _bump_reduce_retry(str_batch: str) -> int:
+            with _state_lock:
+                checkpoint["reduce_retry_counts"][str_batch] = (
+                    checkpoint["reduce_retry_counts"].get(str_batch, 0) + 1
+                )
+                _save()
+                return checkpoint["reduce_retry_counts"][str_batch]
 
-    else:
-        # ---- Multi-batch reduce ----
-        num_batches = (len(processed_chunks) + REDUCE_BATCH_SIZE - 1) // REDUCE_BATCH_SIZE
-        print(
-            f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Batch mode: {len(processed_chunks)} chunks "
-            f"→ {num_batches} batches (with context continuity)"
-        )
+        if reduce_strategy == "tree" and len(chunks) > REDUCE_BATCH_SIZE:
+            # ---- Hierarchical tree reduce ----
+            # Level 0 reduces MAP outputs in independent groups of REDUCE_BATCH_SIZE;
+            # each further level merges the previous level's outputs the same way
+            # until the joined result fits TREE_REDUCE_BUDGET_CHARS (or one node is
+            # left).  Nodes within a level run in parallel and are checkpointed
+            # under "L<level>:<index>" keys.  A group over the chained batch limit
+            # (long MAP outputs, or merged nodes at upper levels) is split into
+            # token-packed parts reduced separately as "L<level>:<index>.<part>".
+            tree_token_limit = reduce_batch_token_limit(reduce_model_key)
+            split_nodes: list[str] = []
+            # setdefault: checkpoints written before tree reduce existed lack these keys
+            with _state_lock:
+                tree_nodes = checkpoint.setdefault("reduce_tree_nodes", {}) if _has_checkpoint else {}
+                tree_retries = checkpoint.setdefault("reduce_tree_retry_counts", {}) if _has_checkpoint else {}
 
-        if _has_checkpoint and checkpoint.get("reduce_batches_total") is None:
-            checkpoint["reduce_batches_total"] = num_batches
-            _save()
+            def _bump_tree_retry(node_key: str) -> int:
+                with _state_lock:
+                    tree_retries[node_key] = tree_retries.get(node_key, 0) + 1
+                    _save()
+                    return tree_retries[node_key]
 
-        # Seed previous_context from the last already-completed batch so that
-        # a resumed run doesn't start batch N with empty context.
-        completed_batch_indices = sorted(
-            int(k) for k in checkpoint["reduce_results"]
-        ) if _has_checkpoint else []
-        previous_context = (
-            checkpoint["reduce_results"][str(completed_batch_indices[-1])]
-            if completed_batch_indices else ""
-        )
+            def _pack_tree_group(group: list[str]) -> list[list[str]]:
+                """Split ``group`` in order into parts of at most tree_token_limit tokens (one input minimum)."""
+                parts: list[list[str]] = [[]]
+                used = 0
+                for text in group:
+                    tokens = count_tokens(text) + REDUCE_SEPARATOR_TOKENS
+                    if parts[-1] and used + tokens > tree_token_limit:
+                        parts.append([])
+                        used = 0
+                    parts[-1].append(text)
+                    used += tokens
+                return parts
 
-        batch_results: list[str] = []
+            def _reduce_tree_node(
+                level: int, node_idx: int, node_total: int, get_group: Callable[[], list[str]]
+            ) -> str:
+                node_key = f"L{level}:{node_idx}"
+                label = f"tree REDUCE level {level} node {node_idx + 1}/{node_total}"
 
-        for batch_idx in range(num_batches):
-            str_batch = str(batch_idx)
+                with _state_lock:
+                    cached_node = tree_nodes.get(node_key)
+                if cached_node is not None:
+                    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: {label} already complete, skipping")
+                    return cached_node
 
-            # Collect already-done batch result and keep previous_context in sync
-            if _has_checkpoint and str_batch in checkpoint["reduce_results"]:
-                cached_batch = checkpoint["reduce_results"][str_batch]
-                batch_results.append(cached_batch)
-                previous_context = cached_batch
+                parts = _pack_tree_group(get_group())
+                if len(parts) == 1:
+                    return _reduce_tree_group(node_key, label, parts[0])
                 print(
-                    f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
-                    f"Resuming: REDUCE batch {batch_idx + 1}/{num_batches} already complete, skipping"
+                    f"[WARNING] {label} exceeds {tree_token_limit} tokens — "
+                    f"splitting it into {len(parts)} parts"
                 )
-                continue
+                with _state_lock:
+                    split_nodes.append(node_key)
+                cleaned_node = "\n\n".join(
+                    _reduce_tree_group(f"{node_key}.{part_idx}", f"{label} part {part_idx + 1}/{len(parts)}", part)
+                    for part_idx, part in enumerate(parts)
+                )
+                if _has_checkpoint:
+                    with _state_lock:
+                        tree_nodes[node_key] = cleaned_node
+                        _save()
+                return cleaned_node
 
-            # Retry cap
-            if _has_checkpoint:
-                retries_used = checkpoint["reduce_retry_counts"].get(str_batch, 0)
+            def _reduce_tree_group(node_key: str, label: str, group: list[str]) -> str:
+                """Reduce one group under ``node_key``, resuming it from the checkpoint when done."""
+                with _state_lock:
+                    cached_node = tree_nodes.get(node_key)
+                    retries_used = tree_retries.get(node_key, 0)
+                if cached_node is not None:
+                    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: {label} already complete, skipping")
+                    return cached_node
                 if retries_used >= MAX_RETRIES_PER_STEP:
-                    raise ValueError(
-                        f"REDUCE batch {batch_idx + 1}/{num_batches} exceeded max retries "
-                        f"({MAX_RETRIES_PER_STEP})."
-                    )
+                    raise ValueError(f"{label} exceeded max retries ({MAX_RETRIES_PER_STEP}).")
+
+                print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Processing {label} ({len(group)} inputs)...")
+                combined_group = "\n\n---\n\n".join(group)
+                node_input = reduce_prompt.replace('{combined_map_results}', combined_group)
+                cleaned_node, _ = _run_step(
+                    "reduce", reduce_prompt, node_input, label, ("reduce", node_key),
+                    lambda: _bump_tree_retry(node_key),
+                )
+
+                if _has_checkpoint:
+                    with _state_lock:
+                        tree_nodes[node_key] = cleaned_node
+                        _save()
+                print(f"[SUCCESS] {label} complete: {len(cleaned_node)} chars")
+                return cleaned_node
+
+            level = 0
+            level_inputs = len(chunks)
+            nodes: list[str] = []
+            level_sizes: list[int] = [level_inputs]
+            while True:
+                ranges = [
+                    (i, min(i + REDUCE_BATCH_SIZE, level_inputs))
+                    for i in range(0, level_inputs, REDUCE_BATCH_SIZE)
+                ]
+                print(
+                    f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Tree level {level}: "
+                    f"{level_inputs} inputs → {len(ranges)} nodes"
+                )
+                if level == 0 and _has_checkpoint:
+                    with _state_lock:
+                        if checkpoint.get("reduce_batches_total") is None:
+                            checkpoint["reduce_batches_total"] = len(ranges)
+                            _save()
 
-            start_idx = batch_idx * REDUCE_BATCH_SIZE
-            end_idx = min((batch_idx + 1) * REDUCE_BATCH_SIZE, len(processed_chunks))
-            batch_chunks = processed_chunks[start_idx:end_idx]
+                tasks: list[Callable[[], str]] = []
+                for node_idx, (start, end) in enumerate(ranges):
+                    if level == 0:
+                        # Level-0 nodes wait only on their own MAP chunks
+                        tasks.append(
+                            lambda n=node_idx, total=len(ranges), a=start, b=end:
+                                _reduce_tree_node(0, n, total, lambda: _map_outputs(a, b))
+                        )
+                    elif end - start == 1:
+                        # Nothing to merge — carry a lone node up unchanged
+                        tasks.append(lambda text=nodes[start]: text)
+                    else:
+                        tasks.append(
+                            lambda lvl=level, n=node_idx, total=len(ranges), g=nodes[start:end]:
+                                _reduce_tree_node(lvl, n, total, lambda: g)
+                        )
+                nodes = _run_ordered(tasks, REDUCE_MAX_WORKERS, "reduce")
+                level_sizes.append(len(nodes))
+                level_inputs = len(nodes)
+
+                joined = "\n\n".join(nodes)
+                if len(nodes) == 1 or len(joined) <= TREE_REDUCE_BUDGET_CHARS:
+                    break
+                level += 1
 
+            final_output = joined
+            # Tree nodes are only final once the top level is reached
+            for node_idx, node_text in enumerate(nodes):
+                _emit("reduce_batch", index=node_idx, total=len(nodes), total_estimated=False, text=node_text)
+            reduce_stats.update({
+                "depth": level + 1,
+                "fan_out": REDUCE_BATCH_SIZE,
+                "level_sizes": level_sizes,
+                "node_token_limit": tree_token_limit,
+                "split_nodes": split_nodes,
+                "critical_path_calls": level + 1,
+            })
             print(
-                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
-                f"Processing REDUCE batch {batch_idx + 1}/{num_batches} ({len(batch_chunks)} chunks)..."
+                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Tree REDUCE complete: depth={level + 1}, "
+                f"fan_out={REDUCE_BATCH_SIZE}, level sizes={level_sizes}, {len(final_output)} chars"
             )
 
-            combined_batch = "\n\n---\n\n".join(batch_chunks)
-
-            if batch_idx == 0:
-                prompt_to_use = reduce_prompt.replace('{combined_map_results}', combined_batch)
+        else:
+            # ---- Chained reduce over token-packed batches ----
+            # MAP outputs are packed in order into batches of at most
+            # batch_token_limit tokens, so short outputs share a call and long
+            # ones never overflow the context.  A batch is planned as soon as
+            # the MAP output that no longer fits it is known (or MAP is done),
+            # so REDUCE still overlaps MAP.  The plan is checkpointed as it
+            # grows and a resumed run reuses identical batches.
+            batch_token_limit = reduce_batch_token_limit(reduce_model_key)
+            if _has_checkpoint and checkpoint.get("reduce_batch_plan") is not None:
+                batch_plan = [tuple(batch_range) for batch_range in checkpoint["reduce_batch_plan"]]
+            elif _has_checkpoint and checkpoint.get("reduce_batches_total") is not None:
+                # Checkpoint from before token packing: keep its fixed-size batches
+                batch_plan = [
+                    (i, min(i + REDUCE_BATCH_SIZE, len(chunks)))
+                    for i in range(0, len(chunks), REDUCE_BATCH_SIZE)
+                ]
             else:
-                context_snippet = previous_context[-3000:] if len(previous_context) > 3000 else previous_context
-                prompt_to_use = reduce_with_context_prompt.replace('{previous_context}', context_snippet)
-                prompt_to_use = prompt_to_use.replace('{combined_map_results}', combined_batch)
-
-            reduce_input = f"""
-                    System:
-                    {yt_transcript_shortener_system_message}
-                    Input:
-                    {prompt_to_use}
-                """
-
-            print(f"[DEBUG] Running REDUCE batch {batch_idx + 1}...")
-            try:
-                response = current_model.invoke(reduce_input)
-                batch_response_text = response.content
-            except Exception as e:
-                print(f"[ERROR] Model crashed during REDUCE batch {batch_idx + 1}/{num_batches}: {e}")
+                batch_plan = []
+            print(
+                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Batch mode: {len(chunks)} chunks, "
+                f"REDUCE batches packed up to {batch_token_limit} tokens (with context continuity)"
+            )
+
+            def _plan_complete() -> bool:
+                return bool(batch_plan) and batch_plan[-1][1] == len(chunks)
+
+            def _plan_batch(batch_idx: int) -> Optional[tuple[int, int]]:
+                """MAP output range of batch ``batch_idx``, planning it if needed; None past the last batch."""
+                if batch_idx < len(batch_plan):
+                    return batch_plan[batch_idx]
+                if _plan_complete():
+                    return None
+                start = batch_plan[-1][1] if batch_plan else 0
+                end, used = start, 0
+                while end < len(chunks):
+                    tokens = count_tokens(_map_output(end)) + REDUCE_SEPARATOR_TOKENS
+                    if end > start and used + tokens > batch_token_limit:
+                        break
+                    used += tokens
+                    end += 1
+                batch_plan.append((start, end))
                 if _has_checkpoint:
-                    checkpoint["reduce_retry_counts"][str_batch] = (
-                        checkpoint["reduce_retry_counts"].get(str_batch, 0) + 1
+                    with _state_lock:
+                        checkpoint["reduce_batch_plan"] = [list(batch_range) for batch_range in batch_plan]
+                        if end == len(chunks):
+                            checkpoint["reduce_batches_total"] = len(batch_plan)
+                        _save()
+                print(f"[DEBUG] Planned REDUCE batch {len(batch_plan)}: MAP outputs {start + 1}-{end} ({used} tokens)")
+                return batch_plan[-1]
+
+            def _batches_estimate() -> int:
+                """Final batch count once planning is done; until then extrapolated from the batches so far."""
+                if _plan_complete():
+                    return len(batch_plan)
+                planned = batch_plan[-1][1] if batch_plan else 0
+                if not planned:
+                    return math.ceil(len(chunks) / REDUCE_BATCH_SIZE)
+                return len(batch_plan) + math.ceil((len(chunks) - planned) * len(batch_plan) / planned)
+
+            def _batch_label(batch_idx: int) -> str:
+                return f"REDUCE batch {batch_idx + 1}/{'' if _plan_complete() else '~'}{_batches_estimate()}"
+
+            # Seed previous_context from the last already-completed batch so that
+            # a resumed run doesn't start batch N with empty context.
+            completed_batch_indices = sorted(
+                int(k) for k in checkpoint["reduce_results"]
+            ) if _has_checkpoint else []
+            previous_context = (
+                checkpoint["reduce_results"][str(completed_batch_indices[-1])]
+                if completed_batch_indices else ""
+            )
+
+            batch_results: list[str] = []
+
+            batch_idx = -1
+            while True:
+                batch_idx += 1
+                str_batch = str(batch_idx)
+
+                # Collect already-done batch result and keep previous_context in sync
+                if _has_checkpoint and str_batch in checkpoint["reduce_results"]:
+                    cached_batch = checkpoint["reduce_results"][str_batch]
+                    batch_results.append(cached_batch)
+                    previous_context = cached_batch
+                    _emit(
+                    "reduce_batch", index=batch_idx, total=_batches_estimate(),
+                    total_estimated=not _plan_complete(), text=cached_batch,
+                )
+                    print(
+                        f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
+                        f"Resuming: {_batch_label(batch_idx)} already complete, skipping"
                     )
-                    _save()
-                raise ValueError(f"Model crashed during REDUCE batch {batch_idx + 1}/{num_batches}: {e}")
+                    continue
 
-            print(f"[DEBUG] REDUCE batch {batch_idx + 1} complete: {len(batch_response_text)} chars")
-            cleaned_batch, success = remove_thinking_tokens(batch_response_text)
-            if not success:
-                error_msg = f"Failed to remove thinking tokens from REDUCE batch {batch_idx + 1}/{num_batches}"
-                print(f"[ERROR] {error_msg}")
+                batch_range = _plan_batch(batch_idx)
+                if batch_range is None:
+                    break
+                label = _batch_label(batch_idx)
+
+                # Retry cap
                 if _has_checkpoint:
-                    checkpoint["reduce_retry_counts"][str_batch] = (
-                        checkpoint["reduce_retry_counts"].get(str_batch, 0) + 1
-                    )
-                    _save()
-                raise ValueError(error_msg)
+                    retries_used = checkpoint["reduce_retry_counts"].get(str_batch, 0)
+                    if retries_used >= MAX_RETRIES_PER_STEP:
+                        raise ValueError(f"{label} exceeded max retries ({MAX_RETRIES_PER_STEP}).")
 
-            if _has_checkpoint:
-                checkpoint["reduce_results"][str_batch] = cleaned_batch
-                _save()
+                batch_chunks = _map_outputs(*batch_range)
+
+                print(
+                    f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
+                    f"Processing {label} ({len(batch_chunks)} chunks)..."
+                )
 
-            batch_results.append(cleaned_batch)
-            previous_context = cleaned_batch
-            print(f"[SUCCESS] REDUCE batch {batch_idx + 1} complete: {len(cleaned_batch)} chars")
+                combined_batch = "\n\n---\n\n".join(batch_chunks)
 
-        final_output = "\n\n".join(batch_results)
-        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] All REDUCE batches combined: {len(final_output)} chars")
+                if batch_idx == 0:
+                    batch_stage, batch_template = "reduce", reduce_prompt
+                    prompt_to_use = reduce_prompt.replace('{combined_map_results}', combined_batch)
+                else:
+                    batch_stage, batch_template = "reduce_with_context", reduce_with_context_prompt
+                    context_snippet = previous_context[-REDUCE_CONTEXT_CHARS:]
+                    prompt_to_use = reduce_with_context_prompt.replace('{previous_context}', context_snippet)
+                    prompt_to_use = prompt_to_use.replace('{combined_map_results}', combined_batch)
 
-        # Stage 4 — optional final consolidation
-        if len(final_output) > FINAL_CONSOLIDATION_THRESHOLD:
-            print(
-                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
-                f"Final consolidation needed ({len(final_output)} > {FINAL_CONSOLIDATION_THRESHOLD} chars)"
-            )
+                print(f"[DEBUG] Running REDUCE batch {batch_idx + 1}...")
+                cleaned_batch, _ = _run_step(
+                    batch_stage, batch_template, prompt_to_use, label,
+                    ("reduce", str_batch), lambda: _bump_reduce_retry(str_batch),
+                )
 
-            # Resume: reuse cached consolidation result
-            if _has_checkpoint and checkpoint.get("consolidation_result"):
-                final_output = checkpoint["consolidation_result"]
-                print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: final consolidation already complete, skipping")
-            else:
                 if _has_checkpoint:
-                    consol_retries = checkpoint.get("consolidation_retries", 0)
-                    if consol_retries >= MAX_RETRIES_PER_STEP:
-                        raise ValueError(
-                            f"Final consolidation exceeded max retries ({MAX_RETRIES_PER_STEP})."
-                        )
+                    with _state_lock:
+                        checkpoint["reduce_results"][str_batch] = cleaned_batch
+                        _save()
+
+                batch_results.append(cleaned_batch)
+                previous_context = cleaned_batch
+                _emit(
+                    "reduce_batch", index=batch_idx, total=_batches_estimate(),
+                    total_estimated=not _plan_complete(), text=cleaned_batch,
+                )
+                print(f"[SUCCESS] REDUCE batch {batch_idx + 1} complete: {len(cleaned_batch)} chars")
 
-                consolidation_input = f"""
-                    System:
-                    {yt_transcript_shortener_system_message}
-                    Input:
-                    {reduce_prompt.replace('{combined_map_results}', final_output)}
-                """
-
-                print(f"[DEBUG] Running final consolidation...")
-                try:
-                    response = current_model.invoke(consolidation_input)
-                    consolidation_text = response.content
-                except Exception as e:
-                    print(f"[ERROR] Model crashed during final consolidation: {e}")
+            num_batches = len(batch_plan)
+            reduce_stats.update({
+                "batch_token_limit": batch_token_limit,
+                "batch_sizes": [end - start for start, end in batch_plan],
+            })
+            final_output = "\n\n".join(batch_results)
+            reduce_stats["critical_path_calls"] = num_batches
+            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] All REDUCE batches combined: {len(final_output)} chars")
+
+            # Stage 4 — optional final consolidation
+            if len(final_output) > FINAL_CONSOLIDATION_THRESHOLD:
+                print(
+                    f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
+                    f"Final consolidation needed ({len(final_output)} > {FINAL_CONSOLIDATION_THRESHOLD} chars)"
+                )
+                # The consolidated text replaces the batch texts already emitted
+                _emit("stage", stage="consolidation")
+
+                # Resume: reuse cached consolidation result
+                if _has_checkpoint and checkpoint.get("consolidation_result"):
+                    final_output = checkpoint["consolidation_result"]
+                    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: final consolidation already complete, skipping")
+                else:
                     if _has_checkpoint:
-                        checkpoint["consolidation_retries"] = (
-                            checkpoint.get("consolidation_retries", 0) + 1
-                        )
+                        consol_retries = checkpoint.get("consolidation_retries", 0)
+                        if consol_retries >= MAX_RETRIES_PER_STEP:
+                            raise ValueError(
+                                f"Final consolidation exceeded max retries ({MAX_RETRIES_PER_STEP})."
+                            )
+
+                    consolidation_input = reduce_prompt.replace('{combined_map_results}', final_output)
+
+                    print(f"[DEBUG] Running final consolidation...")
+                    def _bump_consolidation_retry() -> int:
+                        checkpoint["consolidation_retries"] = checkpoint.get("consolidation_retries", 0) + 1
                         _save()
-                    raise ValueError(f"Model crashed during final consolidation: {e}")
+                        return checkpoint["consolidation_retries"]
+
+                    consolidated, _ = _run_step(
+                        "consolidation", reduce_prompt, consolidation_input, "final consolidation",
+                        ("consolidation", "0"), _bump_consolidation_retry,
+                    )
 
-                consolidated, success = remove_thinking_tokens(consolidation_text)
-                if not success:
-                    error_msg = "Failed to remove thinking tokens from final consolidation"
-                    print(f"[ERROR] {error_msg}")
                     if _has_checkpoint:
-                        checkpoint["consolidation_retries"] = (
-                            checkpoint.get("consolidation_retries", 0) + 1
-                        )
+                        checkpoint["consolidation_result"] = consolidated
                         _save()
-                    raise ValueError(error_msg)
 
-                if _has_checkpoint:
-                    checkpoint["consolidation_result"] = consolidated
-                    _save()
+                    final_output = consolidated
+                    print(f"[SUCCESS] Final consolidation complete: {len(final_output)} chars")
+                reduce_stats["critical_path_calls"] += 1
+            else:
+                print(
+                    f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
+                    f"No final consolidation needed ({len(final_output)} chars < {FINAL_CONSOLIDATION_THRESHOLD})"
+                )
+    finally:
+        # Normal path: every MAP future is already resolved.  Failure path: let
+        # in-flight chunks finish and checkpoint, drop the ones never started.
+        map_executor.shutdown(wait=True, cancel_futures=True)
 
-                final_output = consolidated
-                print(f"[SUCCESS] Final consolidation complete: {len(final_output)} chars")
-        else:
-            print(
-                f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] "
-                f"No final consolidation needed ({len(final_output)} chars < {FINAL_CONSOLIDATION_THRESHOLD})"
-            )
+    # Latency of this run's REDUCE (+ consolidation); lets chained and tree runs be compared.
+    reduce_stats["elapsed_s"] = round(time.time() - reduce_started, 2)
 
     # ------------------------------------------------------------------
     # Stage 5 — persist final output
     # ------------------------------------------------------------------
     if _has_checkpoint:
+        checkpoint["reduce_stats"] = reduce_stats
         checkpoint["final_output"] = final_output
+        _finish_content_update()
         _save()
 
     print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] REDUCE phase complete: {len(final_output)} chars")
+    _log_call_summary()
     print(f"[SUCCESS] Condensation complete. Original: {len(content)} -> Final: {len(final_output)} chars")
     return final_output
 
-def split_content(content: str):
-    chunk_size = 10000
-    chunk_overlap = 200
-    print(f"[DEBUG] split_content: Splitting {len(content)} chars with chunk_size={chunk_size}, overlap={chunk_overlap}")
+def map_chunk_token_limit(model_key: Optional[str]) -> int:
+    """Largest MAP chunk (in tokens) that fits the model's context and output budgets."""
+    budget = get_model_budget(model_key)
+    context_tokens = budget["context_tokens"]
+    max_output_tokens = budget["max_output_tokens"]
+
+    prompt_tokens = count_tokens(yt_transcript_shortener_system_message) + count_tokens(
+        map_reduce_custom_prompts["map_prompt"]
+    )
+    by_context = context_tokens - max_output_tokens - prompt_tokens - CONTEXT_SAFETY_TOKENS
+    by_output = int(max_output_tokens * OUTPUT_SCRIPT_SHARE / (MAP_OUTPUT_RATIO * REDUCE_BATCH_SIZE))
+    return max(MIN_CHUNK_TOKENS, min(by_context, by_output))
+
+
+def reduce_batch_token_limit(model_key: Optional[str]) -> int:
+    """Most MAP-output tokens one chained REDUCE batch may carry for the model.
+
+    The batch must fit the context beside the reduce-with-context prompt, the
+    carried previous-section context and the reserved output; and because
+    REDUCE keeps most of its input, it must also fit the script share of one
+    generation.
+    """
+    budget = get_model_budget(model_key)
+    context_tokens = budget["context_tokens"]
+    max_output_tokens = budget["max_output_tokens"]
+
+    prompt_tokens = count_tokens(yt_transcript_shortener_system_message) + count_tokens(
+        map_reduce_custom_prompts["reduce_with_context_prompt"]
+    )
+    # ~3 chars per token keeps the carried context estimate on the safe side
+    context_carry_tokens = REDUCE_CONTEXT_CHARS // 3
+    by_context = context_tokens - max_output_tokens - prompt_tokens - context_carry_tokens - CONTEXT_SAFETY_TOKENS
+    by_output = int(max_output_tokens * OUTPUT_SCRIPT_SHARE)
+    return max(MIN_CHUNK_TOKENS, min(by_context, by_output))
+
+
+def batch_token_limit(model_key: Optional[str]) -> int:
+    """Most source tokens one batch single-pass call may carry for the model.
+
+    Like one MAP chunk, the packed sources must fit the context beside the
+    prompt and the reserved output, and their scripts (~MAP_OUTPUT_RATIO of the
+    input) must fit the script share of one generation.
+    """
+    budget = get_model_budget(model_key)
+    context_tokens = budget["context_tokens"]
+    max_output_tokens = budget["max_output_tokens"]
+
+    prompt_tokens = count_tokens(yt_transcript_shortener_system_message) + count_tokens(
+        map_reduce_custom_prompts["batch_single_pass_prompt"]
+    )
+    by_context = context_tokens - max_output_tokens - prompt_tokens - CONTEXT_SAFETY_TOKENS
+    by_output = int(max_output_tokens * OUTPUT_SCRIPT_SHARE / MAP_OUTPUT_RATIO)
+    return max(MIN_CHUNK_TOKENS, min(by_context, by_output))
+
+
+def plan_condense_batches(contents: list[str], model_key: Optional[str] = None) -> list[list[int]]:
+    """Group indices of short sources into batch single-pass calls.
+
+    Sources of at most BATCH_MAX_ARTICLE_TOKENS tokens are packed greedily, in
+    order, up to batch_token_limit() tokens and BATCH_MAX_ARTICLES sources per
+    call.  Only groups of two or more are returned; every other source is left
+    to condense_content() on its own.
+    """
+    if BATCH_MAX_ARTICLES < 2:
+        return []
+    limit = batch_token_limit(model_key)
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+    for idx, content in enumerate(contents):
+        tokens = count_tokens(content)
+        if tokens > BATCH_MAX_ARTICLE_TOKENS:
+            continue
+        tokens += BATCH_ARTICLE_WRAPPER_TOKENS
+        if current and (current_tokens + tokens > limit or len(current) >= BATCH_MAX_ARTICLES):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(idx)
+        current_tokens += tokens
+    batches.append(current)
+    return [batch for batch in batches if len(batch) >= 2]
+
+
+_ARTICLE_BLOCK = re.compile(r'<article\s+id="?(\d+)"?\s*>(.*?)</article>', re.IGNORECASE | re.DOTALL)
+
+
+def _split_batch_scripts(script: str, count: int) -> list[Optional[str]]:
+    """Per-source scripts from a batch response's <article id="N"> blocks (N = 1..count).
+
+    A source without a (non-empty) block gets None.  When any id is repeated or
+    outside 1..count the numbering can't be trusted — a model counting from 0
+    would shift every script onto its neighbour — so every source gets None.
+    """
+    blocks = [(int(n), body.strip()) for n, body in _ARTICLE_BLOCK.findall(script)]
+    ids = [n for n, _ in blocks]
+    if len(set(ids)) != len(ids) or any(not 1 <= n <= count for n in ids):
+        print(f"[WARNING] Batch response numbers its articles {ids} for {count} sources — ignoring it")
+        return [None] * count
+    scripts = dict(blocks)
+    return [scripts.get(n) or None for n in range(1, count + 1)]
+
+
+def condense_batch(
+    contents: list[str],
+    current_model,
+    model_key: Optional[str] = None,
+    stage_models: Optional[dict[str, str]] = None,
+    checkpoints: Optional[list[tuple[str, dict]]] = None,
+) -> list[Optional[str]]:
+    """Condense several short sources with one LLM call (see plan_condense_batches()).
+
+    The sources are sent as numbered <article id="N"> blocks and the model
+    answers with one <final_script> block holding an <article id="N"> script per
+    source, which is split back out here.  The call uses the REDUCE model (as
+    single-pass does) and is retried in-process like any condenser step.
+
+    Args:
+        contents:     Raw source texts.
+        checkpoints:  Optional (checkpoint_key, checkpoint) per source.  Each
+                      script is stored as that checkpoint's single-pass
+                      ``final_output`` (reduce_stats strategy
+                      "batch_single_pass"), with the call's stats and metrics
+                      apportioned by source length, and saved.
+
+    Returns:
+        One script per source, or None where the call failed or the response
+        had no script for it — those sources should go through
+        condense_content() on their own.
+    """
+    reduce_key = (stage_models or {}).get("reduce") or model_key
+    model = get_model(reduce_key) if reduce_key and reduce_key != model_key else current_model
+    template = map_reduce_custom_prompts["batch_single_pass_prompt"]
+    articles_text = "\n\n".join(
+        f'<article id="{n}">\n{content}\n</article>' for n, content in enumerate(contents, 1)
+    )
+    user_text = template.replace("{articles_text}", articles_text)
+    label = f"batch single-pass ({len(contents)} sources)"
+    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] {label}: {sum(len(c) for c in contents)} chars in one call")
+
+    def _attempt() -> tuple[Optional[tuple[str, dict]], str]:
+        text, script, stats = call_llm(
+            model,
+            yt_transcript_shortener_system_message,
+            user_text,
+            stage="batch_single_pass",
+            prefix_chars=len(template_prefix(template)),
+            label=label,
+        )
+        cleaned, success = _extract_script(text, script)
+        if not success:
+            return None, f"Failed to remove thinking tokens from {label}"
+        return (cleaned, stats), ""
+
+    started = time.time()
+    try:
+        cleaned, stats = _run_with_retries(_attempt, label)
+    except ValueError:
+        print(f"[WARNING] {label}: giving up, sources will be condensed one by one")
+        return [None] * len(contents)
+
+    results = _split_batch_scripts(cleaned, len(contents))
+    elapsed_s = round(time.time() - started, 2)
+    stats["model_key"] = reduce_key
+    stats["batch_size"] = len(contents)
+
+    total_chars = sum(len(c) for c in contents) or 1
+    for position, (content, result) in enumerate(zip(contents, results)):
+        if result is None or checkpoints is None:
+            continue
+        checkpoint_key, checkpoint = checkpoints[position]
+        share = len(content) / total_chars
+
+        def _apportion(value):
+            return round(value * share) if value is not None else None
+
+        checkpoint["single_pass"] = True
+        checkpoint["reduce_stats"] = {
+            "strategy": "batch_single_pass",
+            "critical_path_calls": 1,
+            "elapsed_s": elapsed_s,
+            "batch_size": len(contents),
+            "batch_position": position,
+        }
+        checkpoint["final_output"] = result
+        checkpoint.setdefault("llm_calls", []).append({**stats, "batch_share": round(share, 3)})
+        record_stage_metric(
+            checkpoint, "single_pass", stats["latency_s"], key="0",
+            prompt_tokens=_apportion(stats["prompt_tokens"]),
+            completion_tokens=_apportion(stats["completion_tokens"]),
+            cached_tokens=_apportion(stats["cached_tokens"]),
+            prompt_processing_s=stats["prompt_processing_s"],
+            batch_size=len(contents),
+        )
+        save_checkpoint(checkpoint_key, checkpoint)
+
+    missing = [n for n, result in enumerate(results, 1) if result is None]
+    if missing:
+        print(f"[WARNING] {label}: no script for source(s) {missing}, they will be condensed one by one")
+    print(
+        f"[SUCCESS] Batch condensation: {len(contents) - len(missing)}/{len(contents)} sources "
+        f"condensed in one call ({elapsed_s}s)"
+    )
+    return results
+
+
+def build_summary_pyramid(
+    checkpoint: dict,
+    current_model,
+    checkpoint_key: Optional[str] = None,
+    model_key: Optional[str] = None,
+    stage_models: Optional[dict[str, str]] = None,
+) -> Optional[dict]:
+    """Distil the checkpoint's final_output into the summary pyramid (see summary_pyramid).
+
+    One call on the REDUCE model produces the medium, short and headline
+    levels, retried in-process like any condenser step.  The result is stored
+    as ``checkpoint["summary_pyramid"]`` with the hash of the final_output it
+    was built from, its call stats are appended to ``llm_calls`` and timed as
+    the "summary_pyramid" metric, and the checkpoint is saved when
+    ``checkpoint_key`` is given.
+
+    Returns:
+        The pyramid dict, or None when there is no final_output yet or every
+        attempt failed — summary requests then go to the chat model.
+    """
+    final_output = checkpoint.get("final_output")
+    if not final_output:
+        return None
+    model_key = model_key or checkpoint.get("model_key")
+    stage_models = stage_models if stage_models is not None else checkpoint.get("stage_models")
+    reduce_key = (stage_models or {}).get("reduce") or model_key
+    model = get_model(reduce_key) if reduce_key and reduce_key != model_key else current_model
+    template = map_reduce_custom_prompts["summary_pyramid_prompt"]
+    source = pyramid_source(final_output, reduce_batch_token_limit(reduce_key), count_tokens)
+    user_text = (
+        template.replace("{medium_words}", str(LEVEL_WORDS["medium"]))
+        .replace("{short_words}", str(LEVEL_WORDS["short"]))
+        .replace("{headline_words}", str(LEVEL_WORDS["headline"]))
+        .replace("{script}", source)
+    )
+    label = "summary pyramid"
+    print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Building {label} from {len(source)} of {len(final_output)} chars")
+
+    def _attempt() -> tuple[Optional[tuple[dict, dict]], str]:
+        text, script, stats = call_llm(
+            model,
+            yt_transcript_shortener_system_message,
+            user_text,
+            stage="summary_pyramid",
+            prefix_chars=len(template_prefix(template)),
+            label=label,
+        )
+        cleaned, success = _extract_script(text, script)
+        if not success:
+            return None, f"Failed to remove thinking tokens from {label}"
+        levels = parse_pyramid(cleaned)
+        if levels is None:
+            return None, f"{label} response is missing a level"
+        return (levels, stats), ""
+
+    started = time.time()
+    try:
+        levels, stats = _run_with_retries(_attempt, label)
+    except ValueError:
+        print(f"[WARNING] {label}: giving up, summary requests will go to the chat model")
+        return None
+
+    stats["model_key"] = reduce_key
+    pyramid = {
+        **levels,
+        "source_hash": source_hash(final_output),
+        "source_chars": len(source),
+        "model_key": reduce_key,
+        "elapsed_s": round(time.time() - started, 2),
+    }
+    checkpoint["summary_pyramid"] = pyramid
+    checkpoint.setdefault("llm_calls", []).append(stats)
+    record_stage_metric(
+        checkpoint, "summary_pyramid", stats["latency_s"], key="0",
+        prompt_tokens=stats["prompt_tokens"],
+        completion_tokens=stats["completion_tokens"],
+        cached_tokens=stats["cached_tokens"],
+        prompt_processing_s=stats["prompt_processing_s"],
+    )
+    if checkpoint_key is not None:
+        save_checkpoint(checkpoint_key, checkpoint)
+    print(
+        f"[SUCCESS] Summary pyramid built ({pyramid['elapsed_s']}s): "
+        + ", ".join(f"{level}={len(levels[level].split())} words" for level in LEVEL_WORDS)
+    )
+    return pyramid
+
+
+def split_content(content: str, model_key: Optional[str] = None) -> list[str]:
+    """Split content into the fewest token-measured chunks that fit the model's budget.
+
+    The chunk count is derived first (total tokens / per-chunk limit) and the
+    target size is then spread evenly across that many chunks, so a transcript
+    slightly over the limit yields two balanced halves rather than a full chunk
+    plus a sliver.  With CHUNKING_MODE "cdc" boundaries are content-defined
+    instead (content_chunking.split_content_defined()).
+    """
+    limit = map_chunk_token_limit(model_key)
+    if CHUNKING_MODE == "cdc":
+        chunks = split_content_defined(content, limit, count_tokens)
+        print(f"[DEBUG] split_content: Created {len(chunks)} content-defined chunks (limit {limit} tokens for model={model_key})")
+        return chunks
+    total_tokens = count_tokens(content)
+    if total_tokens <= limit:
+        print(f"[DEBUG] split_content: {total_tokens} tokens fit one chunk (limit {limit} tokens for model={model_key})")
+        return [content]
+    num_chunks = max(1, math.ceil(total_tokens / max(1, limit - CHUNK_OVERLAP_TOKENS)))
+    # 5% slack so boundary snapping in the recursive splitter doesn't spill an extra chunk
+    chunk_size = min(limit, math.ceil(total_tokens / num_chunks * 1.05) + CHUNK_OVERLAP_TOKENS)
+    chunk_overlap = CHUNK_OVERLAP_TOKENS
+    print(
+        f"[DEBUG] split_content: Splitting {len(content)} chars ({total_tokens} tokens) for model={model_key} "
+        f"with chunk_size={chunk_size} tokens (limit {limit}), overlap={chunk_overlap} tokens"
+    )
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap
+        chunk_overlap=chunk_overlap,
+        length_function=count_tokens,
     )
-    
+
     chunks = splitter.split_text(content)
     print(f"[DEBUG] split_content: Created {len(chunks)} chunks")
-    return chunks
\ No newline at end of file
+    return chunks
@@ -0,0 +1,103 @@
+"""
+Content-defined chunking for split_content().
+
+RecursiveCharacterTextSplitter spreads the target size evenly over the whole
+document, so inserting one paragraph moves every later chunk boundary and no
+chunk of an edited article matches its previous version.  With
+CONDENSER_CHUNKING=cdc, boundaries are chosen by the local content instead:
+an edit only changes the chunks around it, and the unchanged chunks keep
+their exact text, so their MAP results (and the REDUCE steps built only from
+them) can be reused.
+
+Method — word-level gear hash:
+  * The text is cut into words that keep their trailing whitespace, so chunk
+    text is taken verbatim from the source.
+  * Each word is hashed (crc32, stable across processes) and rolled into a
+    64-bit gear hash  h = (h << 1) + gear(word).  The shift pushes a word's
+    influence out of the low ``bits`` bits after ``bits`` more words, so
+    whether a boundary falls after a word depends only on the last few words.
+  * Once a chunk holds MIN_FILL of the token limit, it ends after the first
+    word whose hash has its low ``bits`` bits all zero; ``bits`` is chosen
+    so boundaries arrive on average halfway between MIN_FILL and the limit.
+    A chunk that reaches the limit without a boundary is cut there.
+  * Sizes are measured in characters (CHARS_PER_TOKEN per token) rather than
+    document-wide averages, so every parameter depends only on the limit and
+    an edit cannot move boundaries elsewhere.  A chunk that still measures
+    over the token limit is halved at a word boundary.
+"""
+
+import math
+import re
+import zlib
+from typing import Callable
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+MIN_FILL = 0.5          # no boundary before a chunk holds this share of the token limit
+CHARS_PER_TOKEN = 4     # conservative for English BPE (cl100k averages ~4.5)
+AVG_WORD_CHARS = 6      # word plus its trailing space, to turn the boundary gap into words
+_HASH_MASK = (1 << 64) - 1
+_WORD_WITH_SPACE = re.compile(r"\S+\s*")
+
+
+def _word_hash(word: str) -> int:
+    """64-bit pseudo-random value for a word, identical in every process."""
+    crc = zlib.crc32(word.encode("utf-8"))
+    # Spread the 32-bit crc over 64 bits (splitmix64 finaliser)
+    value = (crc * 0x9E3779B97F4A7C15) & _HASH_MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _HASH_MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _HASH_MASK
+    return value ^ (value >> 31)
+
+
+def split_content_defined(text: str, limit_tokens: int, count_tokens: Callable[[str], int]) -> list[str]:
+    """Split ``text`` into chunks of at most ``limit_tokens`` tokens at content-defined boundaries.
+
+    Returns the chunks in order, stripped; joined with single spaces they
+    reproduce the text up to the whitespace at chunk boundaries.
+    """
+    text = text.strip()
+    words = _WORD_WITH_SPACE.findall(text)
+    if not words:
+        return []
+    total_tokens = count_tokens(text)
+    if total_tokens <= limit_tokens:
+        return [text]
+
+    max_chars = limit_tokens * CHARS_PER_TOKEN
+    min_chars = int(max_chars * MIN_FILL)
+    # Expected gap after min_chars: half the remaining room
+    bits = max(1, round(math.log2(max(2, (max_chars - min_chars) / 2 / AVG_WORD_CHARS))))
+    boundary_mask = (1 << bits) - 1
+
+    chunks: list[str] = []
+    start = 0
+    size = 0
+    rolling = 0
+    for i, word in enumerate(words):
+        rolling = ((rolling << 1) + _word_hash(word.rstrip())) & _HASH_MASK
+        size += len(word)
+        if i + 1 < len(words) and size + len(words[i + 1]) > max_chars or (
+            size >= min_chars and rolling & boundary_mask == 0
+        ):
+            chunks.append("".join(words[start:i + 1]))
+            start = i + 1
+            size = 0
+    if start < len(words):
+        chunks.append("".join(words[start:]))
+
+    # The per-word estimate can undershoot on token-dense spans (numbers, names)
+    result: list[str] = []
+    pending = list(reversed(chunks))
+    while pending:
+        chunk = pending.pop()
+        chunk_words = _WORD_WITH_SPACE.findall(chunk)
+        if len(chunk_words) < 2 or count_tokens(chunk) <= limit_tokens:
+            result.append(chunk.strip())
+            continue
+        half = len(chunk_words) // 2
+        pending.append("".join(chunk_words[half:]))
+        pending.append("".join(chunk_words[:half]))
+    return result
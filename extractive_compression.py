@@ -0,0 +1,174 @@
+"""
+Extractive pre-compression ahead of split_content().
+
+Long transcripts carry a lot of low-information filler (greetings, asides,
+"so yeah, anyway"), and every sentence of it costs MAP prefill and
+generation.  When CONDENSER_EXTRACTIVE_RATIO is set, the raw content is cut
+down to that fraction of its characters before it is split, by keeping the
+most central sentences in their original order.
+
+Method — TF-IDF TextRank:
+  * The text is cut into units that keep their trailing whitespace: sentences,
+    or WINDOW_WORDS-word windows for unpunctuated caption runs longer than
+    MAX_UNIT_WORDS.
+  * Units become rows of a sparse TF-IDF matrix X (log-scaled term counts,
+    smoothed idf, stop words dropped, rows L2-normalised).
+  * PageRank runs on the cosine-similarity graph S = X·Xᵀ without
+    materialising it: S·w is computed as X·(Xᵀ·w) minus the self-similarity,
+    so each iteration costs O(nnz(X)) even for thousands of units.
+  * Units are taken by descending score until the kept characters reach the
+    target fraction, then re-joined in document order.
+
+The kept unit indices are returned with the stats so the checkpoint records
+exactly which text reached the LLM.
+"""
+
+import os
+import re
+import time
+from collections import Counter
+from typing import Callable
+
+import numpy as np
+from scipy import sparse
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Fraction of the raw characters to keep, e.g. 0.6.  0 (or >= 1) disables the stage.
+EXTRACTIVE_RATIO = float(os.getenv("CONDENSER_EXTRACTIVE_RATIO", "0"))
+# Content at or under this many tokens is never compressed: it is cheap to
+# condense as-is and has little filler to lose.
+EXTRACTIVE_MIN_TOKENS = int(os.getenv("CONDENSER_EXTRACTIVE_MIN_TOKENS", "8000"))
+MAX_UNIT_WORDS = 60     # longer "sentences" (unpunctuated captions) are cut into windows
+WINDOW_WORDS = 30
+DAMPING = 0.85
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-6
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])(\s+)")
+_WORD_WITH_SPACE = re.compile(r"\S+\s*")
+_TERM = re.compile(r"[a-z0-9']+")
+_STOP_WORDS = frozenset("""
+    a about after all also am an and any are as at be because been but by can could did do does
+    doing for from get got had has have he her here him his how i if in into is it its just know
+    like me more my no not now of on one or our out really right so some than that the their them
+    then there these they this those to too um uh up us very was we well were what when where which
+    who why will with would yeah you your
+""".split())
+
+
+def _split_units(text: str) -> list[str]:
+    """Sentences (or word windows for long unpunctuated runs) that re-join losslessly."""
+    parts = _SENTENCE_BOUNDARY.split(text)
+    # re.split with a capture group alternates [sentence, sep, sentence, sep, ...]
+    sentences = [parts[i] + (parts[i + 1] if i + 1 < len(parts) else "") for i in range(0, len(parts), 2)]
+    units: list[str] = []
+    for sentence in sentences:
+        if not sentence:
+            continue
+        words = _WORD_WITH_SPACE.findall(sentence)
+        if len(words) <= MAX_UNIT_WORDS:
+            units.append(sentence)
+            continue
+        # Leading whitespace is not matched by _WORD_WITH_SPACE; keep it on the first window
+        lead = sentence[:len(sentence) - len(sentence.lstrip())]
+        windows = ["".join(words[i:i + WINDOW_WORDS]) for i in range(0, len(words), WINDOW_WORDS)]
+        windows[0] = lead + windows[0]
+        units.extend(windows)
+    return units
+
+
+def _tfidf_matrix(units: list[str]) -> sparse.csr_matrix:
+    """Row-normalised TF-IDF matrix, one row per unit."""
+    vocabulary: dict[str, int] = {}
+    rows: list[int] = []
+    cols: list[int] = []
+    counts: list[int] = []
+    for row, unit in enumerate(units):
+        terms = Counter(t for t in _TERM.findall(unit.lower()) if len(t) > 2 and t not in _STOP_WORDS)
+        for term, count in terms.items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+
+    n = len(units)
+    matrix = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float64), (rows, cols)), shape=(n, max(1, len(vocabulary)))
+    )
+    matrix.data = 1.0 + np.log(matrix.data)
+    doc_freq = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1.0 + n) / (1.0 + doc_freq)) + 1.0
+    matrix = sparse.csr_matrix(matrix.multiply(idf[np.newaxis, :]))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sparse.csr_matrix(sparse.diags(inverse) @ matrix)
+
+
+def _textrank(matrix: sparse.csr_matrix) -> np.ndarray:
+    """PageRank scores on the implicit cosine-similarity graph matrix·matrixᵀ (self-loops removed)."""
+    n = matrix.shape[0]
+    transposed = matrix.T.tocsr()
+    # Rows are unit-normalised, so each node's self-similarity is 1 (0 for empty rows)
+    self_similarity = np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+
+    def similarity_dot(vector: np.ndarray) -> np.ndarray:
+        return matrix @ (transposed @ vector) - self_similarity * vector
+
+    degree = similarity_dot(np.ones(n))
+    dangling = degree <= 1e-12
+    safe_degree = np.where(dangling, 1.0, degree)
+    scores = np.full(n, 1.0 / n)
+    for _ in range(MAX_ITERATIONS):
+        spread = similarity_dot(np.where(dangling, 0.0, scores / safe_degree))
+        updated = (1.0 - DAMPING) / n + DAMPING * (spread + scores[dangling].sum() / n)
+        if np.abs(updated - scores).sum() < TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+
+def compress_extractive(text: str, ratio: float, count_tokens: Callable[[str], int]) -> tuple[str, dict]:
+    """Keep the highest-ranked units of ``text`` up to ``ratio`` of its characters.
+
+    Args:
+        text:         Raw content (article or transcript).
+        ratio:        Target fraction of characters to keep, 0 < ratio < 1.
+        count_tokens: Token counter for the savings stat.
+
+    Returns:
+        (compressed_text, stats) where stats records the ratio, unit counts,
+        ``kept_units`` (indices into the unit split, in document order) and
+        chars / tokens before and after.
+    """
+    started = time.perf_counter()
+    units = _split_units(text)
+    lengths = np.fromiter((len(unit) for unit in units), dtype=np.int64, count=len(units))
+    if len(units) < 2:
+        kept = np.arange(len(units))
+    else:
+        scores = _textrank(_tfidf_matrix(units))
+        # Stable sort keeps document order among equal scores
+        order = np.argsort(-scores, kind="stable")
+        target = ratio * lengths.sum()
+        keep_count = int(np.searchsorted(np.cumsum(lengths[order]), target)) + 1
+        kept = np.sort(order[:min(keep_count, len(units))])
+
+    compressed = "".join(units[i] for i in kept).strip()
+    tokens_before = count_tokens(text)
+    tokens_after = count_tokens(compressed)
+    stats = {
+        "method": "tfidf_textrank",
+        "ratio": ratio,
+        "units_total": len(units),
+        "units_kept": len(kept),
+        "kept_units": kept.tolist(),
+        "chars_before": len(text),
+        "chars_after": len(compressed),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+    return compressed, stats
@@ -0,0 +1,235 @@
+"""
+Incremental TTS: synthesize REDUCE batch outputs while later batches condense.
+
+In chained multi-batch mode the condensed text is exactly
+"\n\n".join(batch_results), so each batch can be voiced as soon as it is
+reduced.  IncrementalTTS runs synthesis on one background thread (TTS models
+are not shared across threads) fed by condense_content()'s "reduce_batch"
+progress events, so TTS for batch K overlaps the REDUCE call for batch K+1.
+
+Segments are written to  kokoro_outputs/segments/<checkpoint_key>_<i>.wav
+and recorded in checkpoint["audio_segments"] with a hash of the batch text,
+so a resumed run reuses segments whose text did not change.  Each synthesis
+is timed into checkpoint["metrics"]["tts_segment"].  finish()
+concatenates them only when the segment texts join to exactly the final
+output — when final consolidation rewrites the text, or any segment failed,
+it returns None and the caller synthesizes the whole text as before.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+
+from condensation_cache import record_stage_metric
+from kokoro_tts import load_audio_segment, save_audio_segment, sr
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+SEGMENT_DIR = os.path.join("kokoro_outputs", "segments")
+SEGMENT_GAP_SECONDS = 0.3  # silence between batches, roughly a paragraph pause
+BATCH_SEPARATOR = "\n\n"   # must match how condense_content joins REDUCE batches
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class IncrementalTTS:
+    """Background per-batch synthesis tied to one checkpoint.
+
+    Usage (app.py):
+        tts = IncrementalTTS(generate_audio, checkpoint_key, checkpoint, FINAL_CONSOLIDATION_THRESHOLD)
+        condense_content(..., on_progress=lambda e, p: tts.on_progress(e, p))
+        audio = tts.finish(condensed_text) or generate_audio(condensed_text)
+    """
+
+    def __init__(
+        self,
+        generate_audio: Callable[[str], np.ndarray],
+        checkpoint_key: str,
+        checkpoint: dict,
+        consolidation_threshold: Optional[int] = None,
+    ):
+        """
+        Args:
+            consolidation_threshold: Chars above which the condenser consolidates
+                the joined batches (FINAL_CONSOLIDATION_THRESHOLD).  Once the
+                batches seen so far exceed it, synthesis stops early instead of
+                voicing text that consolidation will replace.
+        """
+        self._generate_audio = generate_audio
+        self._consolidation_threshold = consolidation_threshold
+        self._checkpoint_key = checkpoint_key
+        self._checkpoint = checkpoint
+        # Created here (caller's thread) so later updates only replace the value:
+        # the condenser may be json-dumping the checkpoint from another thread.
+        checkpoint.setdefault("audio_segments", {})
+        self._lock = threading.Lock()
+        self._texts: dict[int, str] = {}
+        self._futures: dict[int, Future] = {}
+        self._total: Optional[int] = None
+        self._discarded = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+
+    # -- feeding ------------------------------------------------------------
+
+    def on_progress(self, event: str, payload: dict) -> None:
+        """condense_content() progress hook: queue batches, drop them on consolidation."""
+        if event == "reduce_batch":
+            self.submit(payload["index"], payload["total"], payload["text"], payload.get("total_estimated", False))
+            if self._consolidation_threshold is not None and payload["total"] > 1:
+                with self._lock:
+                    joined_chars = sum(len(text) for text in self._texts.values())
+                    joined_chars += len(BATCH_SEPARATOR) * (len(self._texts) - 1)
+                if joined_chars > self._consolidation_threshold:
+                    self.discard("batches already exceed the final consolidation threshold")
+        elif event == "stage" and payload.get("stage") == "consolidation":
+            self.discard("final consolidation rewrites the batch text")
+
+    def submit(self, index: int, total: int, text: str, total_estimated: bool = False) -> None:
+        """Queue synthesis of batch ``index`` (no-op if already queued or reusable).
+
+        An estimated ``total`` (chained REDUCE still planning behind MAP) is not
+        kept: finish() only joins against a final batch count.
+        """
+        with self._lock:
+            if self._discarded or index in self._futures:
+                return
+            self._texts[index] = text
+            if not total_estimated:
+                self._total = total
+            self._futures[index] = self._executor.submit(self._synthesize, index, text)
+
+    def _synthesize(self, index: int, text: str) -> str:
+        key = str(index)
+        text_hash = _text_hash(text)
+        stored = self._checkpoint.get("audio_segments", {}).get(key)
+        if stored and stored.get("text_hash") == text_hash and os.path.exists(stored.get("path", "")):
+            print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Resuming: audio segment {index + 1} already synthesized, skipping")
+            return stored["path"]
+
+        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Incremental TTS: synthesizing batch {index + 1} ({len(text)} chars)")
+        started = time.time()
+        audio = self._generate_audio(text)
+        path = save_audio_segment(audio, os.path.join(SEGMENT_DIR, f"{self._checkpoint_key}_{index}.wav"))
+        with self._lock:
+            if self._discarded:
+                _remove_quietly(path)
+                return path
+            # Replace the dict instead of mutating it (see __init__); persisted by
+            # the condenser's next checkpoint save, or by finish().
+            segments = dict(self._checkpoint.get("audio_segments") or {})
+            segments[key] = {"path": path, "text_hash": text_hash, "chars": len(text)}
+            self._checkpoint["audio_segments"] = segments
+            record_stage_metric(self._checkpoint, "tts_segment", time.time() - started, key=key, chars=len(text))
+        print(f"[SUCCESS] Incremental TTS: batch {index + 1} audio ready ({len(audio) / sr:.1f}s)")
+        return path
+
+    # -- completion ---------------------------------------------------------
+
+    def discard(self, reason: str) -> None:
+        """Stop using per-batch audio for this run; finish() will return None."""
+        with self._lock:
+            if self._discarded:
+                return
+            self._discarded = True
+            for future in self._futures.values():
+                future.cancel()
+            segments = self._checkpoint.get("audio_segments") or {}
+            self._checkpoint["audio_segments"] = {}
+        for segment in segments.values():
+            _remove_quietly(segment["path"])
+        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Incremental TTS discarded: {reason}")
+
+    def close(self) -> None:
+        """Abandon queued work and wait for the segment in synthesis (error paths).
+
+        Waiting keeps a retried request from starting a second synthesis on the
+        shared TTS pipeline while this one is still running.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _texts_from_checkpoint(self) -> None:
+        """Condensation was skipped (final_output cached): queue the stored chained batches."""
+        results = self._checkpoint.get("reduce_results") or {}
+        total = self._checkpoint.get("reduce_batches_total")
+        if (
+            not total
+            or self._checkpoint.get("reduce_strategy") == "tree"
+            or self._checkpoint.get("consolidation_result") is not None
+            or any(str(i) not in results for i in range(total))
+        ):
+            return
+        for i in range(total):
+            self.submit(i, total, results[str(i)])
+
+    def finish(self, final_text: str) -> Optional[np.ndarray]:
+        """Wait for all segments and return the concatenated audio, or None to fall back.
+
+        None means the caller must synthesize ``final_text`` itself: no batches
+        were seen, the batches don't join to ``final_text``, or a segment failed.
+        Queued segments are cancelled and the one in synthesis is waited for
+        before returning, so the caller's fallback never overlaps it.
+        """
+        if not self._futures and not self._discarded:
+            self._texts_from_checkpoint()
+        with self._lock:
+            discarded = self._discarded
+            total = self._total
+            texts = dict(self._texts)
+            futures = dict(self._futures)
+        try:
+            if discarded or not futures or total is None:
+                return None
+            if sorted(texts) != list(range(total)):
+                print(f"[WARNING] Incremental TTS: have {len(texts)}/{total} batches — falling back to full TTS")
+                return None
+            if BATCH_SEPARATOR.join(texts[i] for i in range(total)) != final_text:
+                print("[WARNING] Incremental TTS: batch text differs from final output — falling back to full TTS")
+                return None
+
+            paths = []
+            for i in range(total):
+                try:
+                    paths.append(futures[i].result())
+                except Exception as e:
+                    print(f"[ERROR] Incremental TTS: batch {i + 1} failed ({e}) — falling back to full TTS")
+                    return None
+
+            gap = np.zeros(int(sr * SEGMENT_GAP_SECONDS), dtype=np.float32)
+            pieces = []
+            for i, path in enumerate(paths):
+                if i:
+                    pieces.append(gap)
+                pieces.append(load_audio_segment(path))
+            audio = np.concatenate(pieces)
+            print(
+                f"[SUCCESS] Incremental TTS: joined {total} segments "
+                f"({len(audio) / sr:.1f}s of audio)"
+            )
+            return audio
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def cleanup(self) -> None:
+        """Delete segment files once the final audio file exists."""
+        with self._lock:
+            segments = self._checkpoint.get("audio_segments") or {}
+            self._checkpoint["audio_segments"] = {}
+        for segment in segments.values():
+            _remove_quietly(segment["path"])
@@ -63,6 +63,19 @@ def create_audio_file(audio):
     print(f"[KOKORO_TTS] Audio file saved: {output_file}")
     return output_file
 
+# %%
+def save_audio_segment(audio, path):
+    """Write one partial audio segment (any 24 kHz float32 array) to path."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    sf.write(path, audio, sr)
+    return path
+
+# %%
+def load_audio_segment(path):
+    """Read a segment written by save_audio_segment() back as a float32 array."""
+    audio, _ = sf.read(path, dtype='float32')
+    return audio
+
 # %%
 def generate_and_create_audio_file(text):
     audio = generate_audio(text)
@@ -0,0 +1,368 @@
+"""
+Role-separated LLM calls with per-call prompt-processing instrumentation.
+
+Condenser prompts are sent as two chat messages — the shared system prompt
+and the rendered stage template — instead of one "System: ... Input: ..."
+string.  Every stage template keeps its instructions ahead of the first
+placeholder, so the system message plus that text is a byte-identical
+prefix for all calls of one stage.  Servers that reuse a KV / prompt cache
+(LM Studio and llama.cpp slots, OpenAI and Groq prefix caching) then only
+prefill the per-call data.
+
+call_llm() returns a stats dict per call so the savings can be measured:
+  prompt_processing_s — provider-reported prompt time when available (Groq
+                        ``prompt_time``), otherwise the time to the first
+                        streamed chunk, which is dominated by prefill
+  cached_tokens       — prompt tokens served from the server's cache, when the
+                        server reports ``prompt_tokens_details.cached_tokens``
+  prefix_hash         — hash of the static prefix; equal across a stage's calls
+
+Responses are fed to utils.FinalScriptExtractor as they arrive, so the
+script is extracted without re-scanning the full text.  Streamed calls also
+stop early: models often keep generating after </final_script> until
+max_completion_tokens, so the stream is closed (which aborts the server-side
+generation) as soon as the extractor has seen the closing tag.  ``stopped_early`` and ``tokens_saved`` record the effect;
+tokens_saved is an upper bound — the generation budget that was left.  A
+cancelled stream never receives the usage chunk, so its token counts are
+local count_tokens() estimates.
+
+call_llm_hedged() sends the same messages to a secondary model when the
+primary has not answered within a delay (or failed before it), keeps the
+first response with a complete <final_script> block and cancels the other
+stream at its next chunk; the loser's stats are handed to the caller when it
+has stopped.  Process-wide hedge counters are served by get_hedge_stats().
+
+Every call first takes a slot from its server's adaptive concurrency limiter
+(llm_models.get_limiter()); ``queue_wait_s`` records the time spent waiting
+for it, and the call's token counts feed the limiter's latency baseline.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+
+from llm_models import get_limiter
+from utils import FinalScriptExtractor, count_tokens
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Stream condenser calls so time-to-first-chunk can be measured.  "0" uses a
+# plain invoke(); prompt time is then only known when the provider reports it.
+STREAM_CALLS = os.getenv("CONDENSER_LLM_STREAM", "1") != "0"
+# Cancel streamed generations once a complete <final_script> block has arrived
+# (condenser and /streamChat).  "0" always waits for the model to finish.
+EARLY_STOP = os.getenv("LLM_EARLY_STOP", "1") != "0"
+
+# Hedged-call counters for this process (/condenser_stats)
+_hedge_lock = threading.Lock()
+_hedge_stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "both_failed": 0}
+
+
+def template_prefix(template: str) -> str:
+    """Template text before its first placeholder — identical in every rendered prompt."""
+    pos = template.find("{")
+    return template if pos == -1 else template[:pos]
+
+
+def build_messages(system_text: str, user_text: str) -> list:
+    return [SystemMessage(content=system_text), HumanMessage(content=user_text)]
+
+
+def max_output_tokens(model) -> Optional[int]:
+    """Generation cap configured on a LangChain chat model, if any.
+
+    ChatOpenAI stores max_completion_tokens as ``max_tokens``; ChatGroq moves it
+    into ``model_kwargs``.
+    """
+    limit = getattr(model, "max_tokens", None)
+    if limit is None:
+        limit = (getattr(model, "model_kwargs", None) or {}).get("max_completion_tokens")
+    return limit
+
+
+def _prefix_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def _usage_from(message) -> tuple[Optional[int], Optional[int], Optional[int]]:
+    """(prompt_tokens, completion_tokens, cached_tokens) from a message's usage metadata."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if not usage:
+        return None, None, None
+    cached = (usage.get("input_token_details") or {}).get("cache_read")
+    return usage.get("input_tokens"), usage.get("output_tokens"), cached
+
+
+def _invoke(model, messages: list, extractor: FinalScriptExtractor) -> tuple[str, dict]:
+    response = model.invoke(messages)
+    extractor.feed(response.content)
+    token_usage = (response.response_metadata or {}).get("token_usage") or {}
+    prompt_tokens, completion_tokens, cached_tokens = _usage_from(response)
+    return response.content, {
+        "ttft_s": None,
+        "provider_prompt_s": token_usage.get("prompt_time"),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "stopped_early": False,
+        "tokens_saved": None,
+        "cancelled": False,
+    }
+
+
+def _stream(
+    model, messages: list, started: float, extractor: FinalScriptExtractor, cancel: Optional[threading.Event]
+) -> tuple[str, dict]:
+    # ChatOpenAI only sends usage on streams when asked; ChatGroq always does
+    kwargs = {"stream_usage": True} if isinstance(model, ChatOpenAI) else {}
+    parts: list[str] = []
+    first_chunk_at = None
+    final_chunk = None
+    stopped_early = False
+    cancelled = False
+    stream = model.stream(messages, **kwargs)
+    try:
+        for chunk in stream:
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+                extractor.feed(chunk.content)
+                if EARLY_STOP and extractor.complete:
+                    stopped_early = True
+                    break
+            if chunk.usage_metadata:
+                final_chunk = chunk
+    finally:
+        # Closing the generator closes the HTTP response, which aborts generation
+        stream.close()
+    text = "".join(parts)
+    prompt_tokens, completion_tokens, cached_tokens = _usage_from(final_chunk)
+    tokens_saved = None
+    if stopped_early or cancelled:
+        # Usage only arrives with the last chunk, which a cancelled stream never sends
+        prompt_tokens = sum(count_tokens(message.content) for message in messages)
+        completion_tokens = count_tokens(text)
+        limit = max_output_tokens(model)
+        tokens_saved = max(0, limit - completion_tokens) if limit else None
+    return text, {
+        "cancelled": cancelled,
+        "ttft_s": round(first_chunk_at - started, 3) if first_chunk_at is not None else None,
+        "provider_prompt_s": None,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "stopped_early": stopped_early,
+        "tokens_saved": tokens_saved,
+    }
+
+
+def call_llm(
+    model,
+    system_text: str,
+    user_text: str,
+    stage: str,
+    prefix_chars: int = 0,
+    label: Optional[str] = None,
+    cancel: Optional[threading.Event] = None,
+) -> tuple[str, Optional[str], dict]:
+    """Send [system, user] messages to ``model``; return (response_text, final_script, stats).
+
+    ``final_script`` is the content of the first complete <final_script> block
+    outside <think> (see utils.FinalScriptExtractor), or None when the response
+    has none — callers then fall back to remove_thinking_tokens(response_text).
+
+    Args:
+        stage:        Pipeline stage name recorded with the stats ("map", "reduce", ...).
+        prefix_chars: Length of the static template text at the start of
+                      ``user_text`` (see template_prefix); hashed with the system
+                      text so identical prefixes can be verified across calls.
+        label:        Human-readable call name for logs ("MAP chunk 3/12").
+        cancel:       When set, a streamed call stops at its next chunk and
+                      returns what it has with ``cancelled`` in the stats
+                      (invoke mode cannot be interrupted).
+
+    Exceptions from the model propagate unchanged; callers own retry handling.
+    """
+    messages = build_messages(system_text, user_text)
+    extractor = FinalScriptExtractor()
+    with get_limiter(model).slot(cancel) as slot:
+        started = time.perf_counter()
+        if slot is None:
+            # Cancelled while waiting for a free slot: nothing was sent
+            text, usage = "", {
+                "cancelled": True, "ttft_s": None, "provider_prompt_s": None, "prompt_tokens": 0,
+                "completion_tokens": 0, "cached_tokens": None, "stopped_early": False, "tokens_saved": None,
+            }
+        else:
+            if STREAM_CALLS:
+                text, usage = _stream(model, messages, started, extractor, cancel)
+            else:
+                text, usage = _invoke(model, messages, extractor)
+            if usage["cancelled"]:
+                slot.skip()
+            else:
+                slot.record(usage["prompt_tokens"], usage["completion_tokens"], usage["cached_tokens"])
+        latency = time.perf_counter() - started
+
+    provider_prompt_s = usage.pop("provider_prompt_s")
+    prompt_processing_s = provider_prompt_s if provider_prompt_s is not None else usage["ttft_s"]
+    stats = {
+        "stage": stage,
+        "label": label or stage,
+        "mode": "stream" if STREAM_CALLS else "invoke",
+        "prefix_hash": _prefix_hash(system_text + user_text[:prefix_chars]),
+        "prefix_chars": len(system_text) + prefix_chars,
+        "prompt_chars": len(system_text) + len(user_text),
+        **usage,
+        "prompt_processing_s": round(prompt_processing_s, 3) if prompt_processing_s is not None else None,
+        "latency_s": round(latency, 3),
+        "queue_wait_s": round(slot.waited_s, 3) if slot is not None else None,
+        "output_chars": len(text),
+        "finished_at": time.time(),
+    }
+    return text, (extractor.text if extractor.complete else None), stats
+
+
+def call_llm_hedged(
+    primary,
+    secondary,
+    hedge_after_s: float,
+    system_text: str,
+    user_text: str,
+    stage: str,
+    prefix_chars: int = 0,
+    label: Optional[str] = None,
+    on_loser: Optional[Callable[[str, dict], None]] = None,
+) -> tuple[str, Optional[str], dict]:
+    """call_llm() on ``primary``, duplicated to ``secondary`` after ``hedge_after_s``.
+
+    The hedge is sent at once when the primary finishes earlier without a
+    complete <final_script> block (an error or a response without one).  The
+    first response with a complete block wins and the other call is
+    cancelled.  When neither has one, the first finished response is returned
+    so the caller's remove_thinking_tokens() fallback still applies; when both
+    raise, the primary's exception propagates.  The winner's stats gain
+    ``hedged`` (a duplicate was sent), ``hedge_winner`` ("primary" | "hedge")
+    and ``hedge_reason`` ("slow" | "primary_failed").
+
+    ``on_loser(role, stats)`` receives the stats of the call that did not win
+    once it has finished — a cancelled stream returns at its next chunk, after
+    this function — so the tokens it spent can be recorded.  It is called from
+    the loser's thread; a loser that raised is not reported.
+    """
+    cancels = {"primary": threading.Event(), "hedge": threading.Event()}
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+
+    def _submit(role: str, model):
+        return executor.submit(
+            call_llm, model, system_text, user_text, stage, prefix_chars,
+            f"{label or stage} [{role}]", cancels[role],
+        )
+
+    def _report_loser(future) -> None:
+        if on_loser is not None and not future.cancelled() and future.exception() is None:
+            on_loser(futures[future], future.result()[2])
+
+    futures = {_submit("primary", primary): "primary"}
+    hedge_at = time.perf_counter() + hedge_after_s
+    hedge_reason = None
+    finished: list = []
+    errors: dict[str, Exception] = {}
+    pending = set(futures)
+    try:
+        while pending:
+            timeout = None if hedge_reason else max(0.0, hedge_at - time.perf_counter())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[futures[future]] = e
+                    continue
+                finished.append(future)
+                if result[1] is not None:
+                    for event in cancels.values():
+                        event.set()
+                    return _hedge_result(future, futures, hedge_reason, _report_loser)
+            if hedge_reason is None:
+                # Still running after the delay, or already failed: try the secondary now
+                hedge_reason = "primary_failed" if done else "slow"
+                hedge = _submit("hedge", secondary)
+                futures[hedge] = "hedge"
+                pending.add(hedge)
+        if finished:
+            return _hedge_result(finished[0], futures, hedge_reason, _report_loser)
+        with _hedge_lock:
+            _hedge_stats["calls"] += 1
+            _hedge_stats["hedged"] += 1
+            _hedge_stats["both_failed"] += 1
+        raise errors["primary"]
+    finally:
+        # The loser's thread exits at its next chunk; don't wait for it
+        executor.shutdown(wait=False)
+
+
+def _hedge_result(winner, futures: dict, hedge_reason: Optional[str], report_loser):
+    role = futures[winner]
+    text, script, stats = winner.result()
+    with _hedge_lock:
+        _hedge_stats["calls"] += 1
+        _hedge_stats["hedged"] += int(hedge_reason is not None)
+        _hedge_stats["hedge_wins" if role == "hedge" else "primary_wins"] += 1
+    for future in futures:
+        if future is not winner:
+            future.add_done_callback(report_loser)
+    stats["label"] = stats["label"].rsplit(" [", 1)[0]
+    return text, script, {**stats, "hedged": hedge_reason is not None, "hedge_winner": role, "hedge_reason": hedge_reason}
+
+
+def get_hedge_stats() -> dict:
+    """Hedged-call counters for this process, with hedge and hedge-win rates."""
+    with _hedge_lock:
+        stats = dict(_hedge_stats)
+    stats["hedge_rate"] = round(stats["hedged"] / stats["calls"], 3) if stats["calls"] else 0.0
+    stats["hedge_win_rate"] = round(stats["hedge_wins"] / stats["hedged"], 3) if stats["hedged"] else 0.0
+    return stats
+
+
+def summarize_calls(calls: list[dict]) -> dict:
+    """Per-stage totals of call stats: calls, prompt / cached tokens, early stops, hedges, prompt-processing and total seconds.
+
+    Hedge losers (``hedge_loser`` entries) count as calls and their prompt
+    tokens are included; ``hedge_losers`` counts them.
+    """
+    stages: dict[str, dict] = {}
+    for call in calls:
+        stage = stages.setdefault(call["stage"], {
+            "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "stopped_early": 0, "tokens_saved": 0,
+            "prompt_processing_s": 0.0, "latency_s": 0.0, "hedged": 0, "hedge_wins": 0, "hedge_losers": 0, "prefixes": set(),
+        })
+        stage["calls"] += 1
+        stage["prompt_tokens"] += call.get("prompt_tokens") or 0
+        stage["cached_tokens"] += call.get("cached_tokens") or 0
+        stage["stopped_early"] += int(bool(call.get("stopped_early")))
+        stage["tokens_saved"] += call.get("tokens_saved") or 0
+        stage["prompt_processing_s"] += call.get("prompt_processing_s") or 0.0
+        stage["latency_s"] += call.get("latency_s") or 0.0
+        stage["hedged"] += int(bool(call.get("hedged")))
+        stage["hedge_wins"] += int(call.get("hedge_winner") == "hedge")
+        stage["hedge_losers"] += int(bool(call.get("hedge_loser")))
+        stage["prefixes"].add(call.get("prefix_hash"))
+    for stage in stages.values():
+        # One distinct prefix per stage means every call could reuse the cached prefix
+        stage["distinct_prefixes"] = len(stage.pop("prefixes"))
+        stage["prompt_processing_s"] = round(stage["prompt_processing_s"], 3)
+        stage["latency_s"] = round(stage["latency_s"], 3)
+    return stages
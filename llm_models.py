@@ -1,6 +1,11 @@
 from langchain_groq import ChatGroq
 from langchain_openai import ChatOpenAI
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -174,8 +179,284 @@ models_collection = {
     "mistral_local_llm": mistral_local_llm
 }
 
+# Token budgets per model key, used to size condenser chunks.
+#   context_tokens    — context window the server is expected to load the model with
+#   max_output_tokens — generation cap (matches max_completion_tokens above, or the
+#                       server default where the model does not set one)
+# Lower context_tokens here if LM Studio loads a model with a smaller context length.
+model_token_budgets = {
+    "groq_llm": {"context_tokens": 131072, "max_output_tokens": 65000},
+    "gemma_local_llm": {"context_tokens": 131072, "max_output_tokens": 8192},
+    "nemotron_local_llm": {"context_tokens": 131072, "max_output_tokens": 10000},
+    "nemotron_stream_local_llm": {"context_tokens": 131072, "max_output_tokens": 15000},
+    "nexveridian_qwen_stream_local_llm": {"context_tokens": 131072, "max_output_tokens": 20000},
+    "mlx_community_qwen_stream_local_llm": {"context_tokens": 131072, "max_output_tokens": 15000},
+    "google_gemma_4_26b_a4b": {"context_tokens": 131072, "max_output_tokens": 15000},
+    "deepseekR1_local_llm": {"context_tokens": 32768, "max_output_tokens": 8192},
+    "gpt-oss_20b_local_llm": {"context_tokens": 131072, "max_output_tokens": 12800},
+    "mistral_local_llm": {"context_tokens": 32768, "max_output_tokens": 15000},
+}
+
+# Conservative budget for unknown keys — yields chunks close to the old 10k-char split.
+DEFAULT_TOKEN_BUDGET = {"context_tokens": 8192, "max_output_tokens": 4096}
+
+
+# Condenser stage routing: models_collection key per stage, so high-volume MAP
+# calls can run on a small fast model while REDUCE keeps the larger one.
+# Unset stages use the app's model; consolidation defaults to the REDUCE model.
+# "map_hedge" is optional: a second model that MAP calls are duplicated to when
+# the MAP model is slow (see condenser_service.map_hedge_delay()).
+condenser_stage_models = {
+    "map": os.getenv("CONDENSER_MAP_MODEL") or None,
+    "reduce": os.getenv("CONDENSER_REDUCE_MODEL") or None,
+    "consolidation": os.getenv("CONDENSER_CONSOLIDATION_MODEL") or None,
+    "map_hedge": os.getenv("CONDENSER_MAP_HEDGE_MODEL") or None,
+}
+
+
 def get_model(model_name):
     if model_name in models_collection:
         return models_collection[model_name]
     else:
         raise ValueError(f"Unknown model: {model_name}")
+
+
+def get_model_budget(model_name):
+    """Return the token budget dict for a model key (default budget if unknown)."""
+    return model_token_budgets.get(model_name, DEFAULT_TOKEN_BUDGET)
+
+
+def resolve_stage_models(default_model_key):
+    """Return {"map", "reduce", "consolidation", "map_hedge"} -> model key with defaults filled in.
+
+    "map_hedge" stays None unless configured.
+
+    Raises ValueError for keys missing from models_collection, so a typo in the
+    routing env vars fails at startup rather than mid-condensation.
+    """
+    reduce_key = condenser_stage_models["reduce"] or default_model_key
+    resolved = {
+        "map": condenser_stage_models["map"] or default_model_key,
+        "reduce": reduce_key,
+        "consolidation": condenser_stage_models["consolidation"] or reduce_key,
+        "map_hedge": condenser_stage_models["map_hedge"],
+    }
+    for stage, key in resolved.items():
+        if key is not None and key not in models_collection:
+            raise ValueError(f"Unknown model for condenser stage '{stage}': {key}")
+    return resolved
+
+
+# ---------------------------------------------------------------------------
+# Adaptive (AIMD) concurrency limit per LLM server
+# ---------------------------------------------------------------------------
+# A fixed worker count either leaves a server idle or queues requests on it
+# until they hit timeout=3600.  Every call to a model above goes through the
+# limiter of its server (all LM Studio models share one), which admits at
+# most ``limit`` concurrent calls and adapts the limit from the calls it sees:
+#   * latency is normalised by the call's size (seconds per token, prompt
+#     tokens weighted down because prefill is much faster than generation)
+#     and compared with the server's baseline (a low percentile of recent
+#     samples);
+#   * a call that ran with the limit saturated and stayed within
+#     LATENCY_TOLERANCE of the baseline adds 1/limit (about +1 per limit's
+#     worth of calls) — or a whole 1 until the first cut (slow start, as in
+#     TCP), so a fresh limiter reaches the server's capacity quickly;
+#   * an error, or a latency over the tolerance, multiplies the limit by
+#     BACKOFF, at most once per batch of in-flight calls (calls started
+#     before the last cut cannot cut again).
+# With LLM_ADAPTIVE_CONCURRENCY=0 the limit stays fixed at
+# LLM_CONCURRENCY_INITIAL: calls are still admitted against it and measured,
+# only the increases and decreases are skipped.
+
+ADAPTIVE_CONCURRENCY = os.getenv("LLM_ADAPTIVE_CONCURRENCY", "1") != "0"
+CONCURRENCY_INITIAL = int(os.getenv("LLM_CONCURRENCY_INITIAL", "2"))
+CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", "8"))
+CONCURRENCY_MIN = 1
+LATENCY_TOLERANCE = 2.0        # normalised latency this many times the baseline is a spike
+BACKOFF = 0.5                  # multiplicative decrease
+PREFILL_TOKENS_PER_OUTPUT_TOKEN = 20  # uncached prompt tokens costing as much time as one generated token
+CALL_OVERHEAD_TOKENS = 50      # fixed per-call cost (connection, scheduling) in output-token units
+BASELINE_WINDOW = 50           # recent normalised latencies the baseline is taken from
+BASELINE_PERCENTILE = 10
+MIN_BASELINE_SAMPLES = 3       # no spike verdicts before this many samples
+
+
+class CallSlot:
+    """One admitted call; report its token counts with record() so its latency can be judged."""
+
+    def __init__(self, limiter: "AdaptiveConcurrencyLimiter", started: float, waited_s: float, saturated: bool):
+        self.limiter = limiter
+        self.started = started
+        self.waited_s = waited_s
+        self.saturated = saturated
+        self.cost_tokens = None
+        self.discard = False
+
+    def record(self, prompt_tokens=None, completion_tokens=None, cached_tokens=None) -> None:
+        """Size of the call; calls without token counts only count as success / error."""
+        if prompt_tokens is None and completion_tokens is None:
+            return
+        uncached = max(0, (prompt_tokens or 0) - (cached_tokens or 0))
+        self.cost_tokens = (completion_tokens or 0) + uncached / PREFILL_TOKENS_PER_OUTPUT_TOKEN
+
+    def skip(self) -> None:
+        """Release without a latency sample (e.g. a cancelled hedge leg)."""
+        self.discard = True
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit for the calls to one LLM server (see the section comment above).
+
+    ``enabled=False`` keeps the limit fixed at ``initial`` instead of adapting it.
+    ``clock`` times calls and cuts (tests pass a fake one).
+    """
+
+    def __init__(
+        self, name: str, initial: int, max_limit: int, enabled: bool = True,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.name = name
+        self.enabled = enabled
+        self._clock = clock
+        self.max_limit = max(CONCURRENCY_MIN, max_limit)
+        self.limit = float(min(max(CONCURRENCY_MIN, initial), self.max_limit))
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._waiting = 0
+        self._last_cut_at = 0.0
+        self._slow_start = True
+        self._samples: deque = deque(maxlen=BASELINE_WINDOW)
+        self._stats = {
+            "calls": 0, "errors": 0, "spikes": 0, "increases": 0, "decreases": 0,
+            "peak_inflight": 0, "wait_s": 0.0, "last_latency_s": None, "last_s_per_token": None,
+        }
+
+    def acquire(self, cancel: Optional[threading.Event] = None) -> Optional[CallSlot]:
+        """Block until a call may start; None if ``cancel`` was set while waiting."""
+        requested = self._clock()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._inflight >= int(self.limit):
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    self._cond.wait(timeout=0.5 if cancel is not None else None)
+            finally:
+                self._waiting -= 1
+            self._inflight += 1
+            saturated = self._inflight >= int(self.limit)
+            self._stats["peak_inflight"] = max(self._stats["peak_inflight"], self._inflight)
+            started = self._clock()
+            self._stats["wait_s"] += started - requested
+        return CallSlot(self, started, started - requested, saturated)
+
+    def release(self, slot: CallSlot, error: bool = False) -> None:
+        """End a call: adjust the limit from its outcome and wake a waiting call."""
+        latency = self._clock() - slot.started
+        with self._cond:
+            self._inflight -= 1
+            self._stats["calls"] += 1
+            if error:
+                self._stats["errors"] += 1
+                self._decrease(slot)
+            elif not slot.discard and slot.cost_tokens is not None:
+                per_token = latency / (slot.cost_tokens + CALL_OVERHEAD_TOKENS)
+                self._stats["last_latency_s"] = round(latency, 3)
+                self._stats["last_s_per_token"] = round(per_token, 5)
+                baseline = self._baseline()
+                self._samples.append(per_token)
+                if baseline is not None and per_token > baseline * LATENCY_TOLERANCE:
+                    self._stats["spikes"] += 1
+                    self._decrease(slot)
+                elif self.enabled and slot.saturated and self.limit < self.max_limit:
+                    step = 1.0 if self._slow_start else 1 / self.limit
+                    self.limit = min(self.max_limit, self.limit + step)
+                    self._stats["increases"] += 1
+            self._cond.notify_all()
+
+    def _baseline(self) -> Optional[float]:
+        if len(self._samples) < MIN_BASELINE_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, len(ordered) * BASELINE_PERCENTILE // 100)]
+
+    def _decrease(self, slot: CallSlot) -> None:
+        if not self.enabled or slot.started < self._last_cut_at:
+            return  # fixed limit, or already cut for the calls running alongside this one
+        self.limit = max(float(CONCURRENCY_MIN), self.limit * BACKOFF)
+        self._last_cut_at = self._clock()
+        self._slow_start = False
+        self._stats["decreases"] += 1
+
+    @contextmanager
+    def slot(self, cancel: Optional[threading.Event] = None):
+        """Context manager around one call; yields the CallSlot, or None if cancelled while waiting.
+
+        An exception raised inside counts as an error; GeneratorExit and other
+        non-Exception exits release without a sample.
+        """
+        slot = self.acquire(cancel)
+        if slot is None:
+            yield None
+            return
+        try:
+            yield slot
+        except Exception:
+            self.release(slot, error=True)
+            raise
+        except BaseException:
+            slot.skip()
+            self.release(slot)
+            raise
+        else:
+            self.release(slot)
+
+    def stats(self) -> dict:
+        with self._cond:
+            baseline = self._baseline()
+            return {
+                "enabled": self.enabled,
+                "limit": int(self.limit),
+                "limit_exact": round(self.limit, 3),
+                "max_limit": self.max_limit,
+                "slow_start": self._slow_start,
+                "inflight": self._inflight,
+                "waiting": self._waiting,
+                "baseline_s_per_token": round(baseline, 5) if baseline is not None else None,
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in self._stats.items()},
+            }
+
+
+_limiters: dict[str, AdaptiveConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _server_of(model) -> str:
+    """Server a model's calls go to: its OpenAI-compatible base URL, or the provider class name."""
+    return getattr(model, "openai_api_base", None) or type(model).__name__
+
+
+def get_limiter(model) -> AdaptiveConcurrencyLimiter:
+    """The concurrency limiter shared by every model served from the same server as ``model``."""
+    server = _server_of(model)
+    with _limiters_lock:
+        limiter = _limiters.get(server)
+        if limiter is None:
+            limiter = _limiters[server] = AdaptiveConcurrencyLimiter(
+                server, CONCURRENCY_INITIAL, CONCURRENCY_MAX, ADAPTIVE_CONCURRENCY
+            )
+        return limiter
+
+
+def get_concurrency_stats() -> dict:
+    """Current limit, in-flight calls and observed latency per server."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+def reset_limiters() -> None:
+    """Forget every server's limiter and latency history (benchmarks, tests)."""
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,189 @@
+"""
+Content-addressed store for MAP-phase results, shared across checkpoints.
+
+Checkpoints (condensation_cache.py) are keyed by (canonical_url, model_key,
+fetch_mode) and expire after 24 h, so identical chunk text arriving via the
+transcript queue and then the audio queue, a mirrored article, or a re-run
+the next day would otherwise be summarised again.  This store keys each MAP
+output by
+
+  SHA-256(prompt_version | model_key | chunk_text)
+
+so any chunk already condensed with the same prompt and model is a hit no
+matter which URL or fetch mode produced it.
+
+Entries live in  condensation_cache/map_results/<hash>.json  (atomic writes,
+same as checkpoints).  The store is bounded by total size: when it grows past
+MAP_CACHE_MAX_BYTES the least recently used entries (by file mtime, bumped on
+every hit) are evicted down to MAP_CACHE_EVICT_TO_FRACTION of the limit.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from condensation_cache import CACHE_DIR
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+MAP_CACHE_DIR = CACHE_DIR / "map_results"
+MAP_CACHE_ENABLED = os.getenv("CONDENSER_MAP_CACHE", "1") != "0"
+MAP_CACHE_MAX_BYTES = int(float(os.getenv("CONDENSER_MAP_CACHE_MAX_MB", "200")) * 1024 * 1024)
+MAP_CACHE_EVICT_TO_FRACTION = 0.9
+
+# ---------------------------------------------------------------------------
+# In-process state
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_total_bytes: Optional[int] = None  # lazily computed from disk on first use
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "saved_llm_seconds": 0.0,
+}
+
+
+def map_result_key(chunk_text: str, prompt_version: str, model_key: str) -> str:
+    """Derive the content address for one MAP input."""
+    raw = f"{prompt_version}|{model_key}|{chunk_text}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return MAP_CACHE_DIR / f"{key}.json"
+
+
+def _ensure_total_bytes() -> int:
+    """Return the store's size on disk, scanning once per process.  Caller holds _lock."""
+    global _total_bytes
+    if _total_bytes is None:
+        total = 0
+        if MAP_CACHE_DIR.exists():
+            for path in MAP_CACHE_DIR.glob("*.json"):
+                try:
+                    total += path.stat().st_size
+                except OSError:
+                    pass
+        _total_bytes = total
+    return _total_bytes
+
+
+def _evict_if_needed() -> None:
+    """Drop least recently used entries until under the size bound.  Caller holds _lock."""
+    global _total_bytes
+    if _ensure_total_bytes() <= MAP_CACHE_MAX_BYTES:
+        return
+
+    entries = []
+    for path in MAP_CACHE_DIR.glob("*.json"):
+        try:
+            st = path.stat()
+            entries.append((st.st_mtime, st.st_size, path))
+        except OSError:
+            pass
+    entries.sort()
+
+    target = int(MAP_CACHE_MAX_BYTES * MAP_CACHE_EVICT_TO_FRACTION)
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            path.unlink()
+            total -= size
+            _stats["evictions"] += 1
+        except OSError as e:
+            print(f"[WARNING] map_result_cache: could not evict {path.name}: {e}")
+    _total_bytes = total
+    print(f"[PURGE]   map_result_cache: evicted down to {total / (1024 * 1024):.1f} MB")
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def get_map_result(key: str) -> Optional[str]:
+    """Return the cached MAP output for key, or None.  Counts a hit or a miss."""
+    if not MAP_CACHE_ENABLED:
+        return None
+    path = _entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # LRU bump
+    except FileNotFoundError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"[WARNING] map_result_cache: unreadable entry {path.name}: {e} — ignoring")
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    with _lock:
+        _stats["hits"] += 1
+        _stats["saved_llm_seconds"] += float(entry.get("llm_seconds") or 0.0)
+    return entry.get("result")
+
+
+def put_map_result(key: str, result: str, model_key: str, prompt_version: str, llm_seconds: float) -> None:
+    """Atomically store a MAP output, then evict old entries if over the size bound."""
+    global _total_bytes
+    if not MAP_CACHE_ENABLED:
+        return
+    MAP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        _ensure_total_bytes()  # scan before writing so the new entry isn't counted twice
+    final = _entry_path(key)
+    # Unique tmp name: several MAP workers may store different keys at once
+    tmp = MAP_CACHE_DIR / f"{key}.{uuid.uuid4().hex[:8]}.tmp"
+    entry = {
+        "result": result,
+        "model_key": model_key,
+        "prompt_version": prompt_version,
+        "llm_seconds": round(llm_seconds, 3),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        size = tmp.stat().st_size
+        replaced_size = final.stat().st_size if final.exists() else 0
+        os.replace(tmp, final)
+    except Exception as e:
+        print(f"[ERROR]   map_result_cache: failed to write {final.name}: {e}")
+        try:
+            tmp.unlink(missing_ok=True)
+        except Exception:
+            pass
+        return
+
+    with _lock:
+        _total_bytes = _ensure_total_bytes() + size - replaced_size
+        _stats["stores"] += 1
+        _evict_if_needed()
+
+
+def get_map_cache_stats() -> dict:
+    """Return hit/miss counters and size for this process."""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            "enabled": MAP_CACHE_ENABLED,
+            **_stats,
+            "saved_llm_seconds": round(_stats["saved_llm_seconds"], 2),
+            "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else None,
+            "size_bytes": _ensure_total_bytes(),
+            "max_bytes": MAP_CACHE_MAX_BYTES,
+        }
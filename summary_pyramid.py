@@ -0,0 +1,140 @@
+"""
+Multi-resolution summary pyramid for a condensed document.
+
+The condenser's output (checkpoint ``final_output``, the REDUCE sections
+joined in order) is the "full" resolution.  One extra LLM call over it
+(condenser_service.build_summary_pyramid()) distils three coarser ones —
+medium, short and headline — which are cached in the checkpoint as
+``summary_pyramid``.  A summary-style chat request ("summarize it", "give me
+the gist", "one-line headline") is then answered from the cache instead of a
+chat generation over the whole conversation history.
+
+CONDENSER_SUMMARY_PYRAMID selects when the pyramid is built:
+  * "lazy"  (default) — on the first summary request for the document
+  * "eager" — in the background as soon as the document is loaded
+  * "off"   — never; summary requests go to the chat model like any question
+
+The pyramid records the hash of the final_output it was built from, so a
+re-condensed document (reset_for_content_update()) never serves a stale one.
+"""
+
+import hashlib
+import os
+import re
+from typing import Callable, Optional
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+SUMMARY_PYRAMID_MODE = os.getenv("CONDENSER_SUMMARY_PYRAMID", "lazy")  # "lazy" | "eager" | "off"
+PYRAMID_LEVELS = ("headline", "short", "medium", "full")
+# Target length of each generated level, in words ("full" is final_output itself)
+LEVEL_WORDS = {"headline": 15, "short": 60, "medium": 250}
+CHARS_PER_TOKEN = 4          # for trimming REDUCE sections to the source budget
+SUMMARY_REQUEST_MAX_WORDS = 12  # longer messages are real questions, not summary requests
+
+_LEVEL_TAGS = {
+    level: re.compile(rf"<{level}>(.*?)</{level}>", re.IGNORECASE | re.DOTALL) for level in LEVEL_WORDS
+}
+_SENTENCE_END = re.compile(r"[.!?…](?=\s|$)")
+
+# Summary requests: a summary verb, optionally a level hint, and nothing that
+# narrows the request to part of the document or asks for a different form.
+_SUMMARY_REQUEST = re.compile(
+    r"\b(summar(y|ies|ise|ize|ised|ized)|recap|tl;?dr|gist|overview|headline|nutshell"
+    r"|main points|key points|short version|long version|sum (it|this|that) up)\b",
+    re.IGNORECASE,
+)
+_NARROWING = re.compile(
+    r"\b(about|regarding|concerning|related|part|section|segment|chapter|only|just the|why|how|who|when"
+    r"|where|which|compare|versus|vs|translate|language|bullets?|list|table|poem|tweet|email|kid|child"
+    r"|english|spanish|french|german|italian|portuguese|russian|chinese|japanese|korean|arabic|hindi)\b",
+    re.IGNORECASE,
+)
+_LEVEL_HINTS = (
+    ("headline", re.compile(r"\b(headline|title|one[- ](sentence|line)|single sentence|nutshell)\b", re.IGNORECASE)),
+    ("full", re.compile(r"\b(full|whole|entire|complete|detailed|long|everything)\b", re.IGNORECASE)),
+    ("short", re.compile(r"\b(short|shorter|brief|briefly|quick|gist|tl;?dr|few sentences)\b", re.IGNORECASE)),
+)
+
+
+def source_hash(final_output: str) -> str:
+    """Hash identifying the final_output a pyramid was built from."""
+    return hashlib.sha256(final_output.encode("utf-8")).hexdigest()[:16]
+
+
+def pyramid_is_current(checkpoint: dict) -> bool:
+    """True when the checkpoint holds a pyramid built from its current final_output."""
+    pyramid = checkpoint.get("summary_pyramid")
+    final_output = checkpoint.get("final_output")
+    return bool(pyramid and final_output and pyramid.get("source_hash") == source_hash(final_output))
+
+
+def cached_summary(checkpoint: dict, level: str) -> Optional[str]:
+    """The document summary at ``level``, or None when it is not cached."""
+    if level == "full":
+        return checkpoint.get("final_output") or None
+    if not pyramid_is_current(checkpoint):
+        return None
+    return checkpoint["summary_pyramid"].get(level) or None
+
+
+def summary_request_level(message: str) -> Optional[str]:
+    """Pyramid level a chat message asks for, or None when it is not a plain summary request.
+
+    Only short requests for the whole document qualify ("summarize it",
+    "give me a one-line headline", "full recap please"); anything narrowing the
+    request or asking for another form goes to the chat model.  Defaults to
+    "medium" when no length is hinted.
+    """
+    if not message or len(message.split()) > SUMMARY_REQUEST_MAX_WORDS:
+        return None
+    if not _SUMMARY_REQUEST.search(message) or _NARROWING.search(message):
+        return None
+    for level, hint in _LEVEL_HINTS:
+        if hint.search(message):
+            return level
+    return "medium"
+
+
+def _trim_to_sentence(text: str, max_chars: int) -> str:
+    """Leading sentences of ``text`` within ``max_chars`` (at least the first sentence)."""
+    if len(text) <= max_chars:
+        return text
+    cut = 0
+    for match in _SENTENCE_END.finditer(text):
+        if match.end() > max_chars and cut:
+            break
+        cut = match.end()
+    return text[:cut or max_chars].strip()
+
+
+def pyramid_source(final_output: str, limit_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Text the pyramid is distilled from, within ``limit_tokens``.
+
+    final_output when it fits; otherwise each REDUCE section (the blank-line
+    separated blocks it is joined from) keeps its opening sentences in
+    proportion to its length, so every part of the document is still
+    represented.
+    """
+    if count_tokens(final_output) <= limit_tokens:
+        return final_output
+    sections = [section.strip() for section in final_output.split("\n\n") if section.strip()]
+    total_chars = sum(len(section) for section in sections) or 1
+    budget_chars = limit_tokens * CHARS_PER_TOKEN
+    return "\n\n".join(
+        _trim_to_sentence(section, max(1, budget_chars * len(section) // total_chars)) for section in sections
+    )
+
+
+def parse_pyramid(script: str) -> Optional[dict[str, str]]:
+    """Levels from a pyramid response's <final_script> text, or None if any is missing."""
+    levels = {}
+    for level, tag in _LEVEL_TAGS.items():
+        match = tag.search(script)
+        text = " ".join(match.group(1).split()) if match else ""
+        if not text:
+            return None
+        levels[level] = text
+    return levels
@@ -192,10 +192,6 @@ DATA TO SYNTHESIZE:
     "reduce_with_context_prompt": """# ROLE: Lead Narrative Architect (Context-Aware)
 # TASK: Continue synthesizing transcript segments into a flowing broadcast script, maintaining continuity.
 
-# PREVIOUS SECTION CONTEXT
-The narrative so far:
-"{previous_context}"
-
 # CORE OBJECTIVES
 1. SEAMLESS CONTINUATION: Begin naturally using transitions (e.g., "Building on this," "Meanwhile," "This leads to").
 2. LOCK NARRATIVE ANCHORS: Retain 100% of proper nouns and technical details.
@@ -222,8 +218,118 @@ The narrative so far:
 - No meta-text
 - Start with a transition
 
+# PREVIOUS SECTION CONTEXT
+The narrative so far:
+"{previous_context}"
+
 CURRENT BATCH TO SYNTHESIZE:
 "{combined_map_results}"
 
+<final_script>""",
+
+    "single_pass_prompt": """# ROLE: Lead Narrative Architect
+# TASK: Condense a complete short source (article or transcript) into a single, high-fidelity broadcast script in one pass.
+
+# CORE OBJECTIVES
+1. SIZE RETENTION (30%+): Do not over-summarize. If the source is dense with facts, keep them all.
+2. LOCK NARRATIVE ANCHORS: You MUST retain 100% of proper nouns: Names, Dates, Locations, Model Names, Technical Specs, specific numbers.
+3. AUTOMATIC TYPO REPAIR: Detect and fix ASR errors using context.
+4. NARRATIVE SYNERGY: Convert dialogue and fragments into one flowing third-person narrative. NO LISTS allowed.
+5. ANTI-HALLUCINATION: Output only what is present in the text.
+
+# TTS PROSODY LAYER (KOKORO-SAFE)
+- Use commas for natural short pauses.
+- Use ellipses (...) for longer pauses or transitions.
+- Use em dashes (—) to emphasize key ideas.
+- Avoid any XML, SSML, or special tags.
+- Align pauses with meaning, not just punctuation.
+
+# TTS & FORMATTING
+- Clean plain text only.
+- PACING: Max 25 words per sentence, but vary rhythm naturally.
+- Use oral transitions (e.g., "Moving on," "Crucially," "This leads to").
+- Avoid repetitive sentence structures.
+
+# OUTPUT PROTOCOL
+- SINGLE VERSION ONLY
+- ONLY final script inside <final_script> tags
+- No meta-text
+
+SOURCE TO CONDENSE:
+"{content_text}"
+
+<final_script>""",
+
+    "batch_single_pass_prompt": """# ROLE: Lead Narrative Architect
+# TASK: Condense SEVERAL independent short sources (news articles) into one separate, high-fidelity broadcast script per source, in one pass.
+
+# CORE OBJECTIVES
+1. ONE SCRIPT PER SOURCE: Each source is unrelated to the others. Never merge, compare or cross-reference them.
+2. SIZE RETENTION (30%+): Do not over-summarize. If a source is dense with facts, keep them all.
+3. LOCK NARRATIVE ANCHORS: You MUST retain 100% of proper nouns: Names, Dates, Locations, Model Names, Technical Specs, specific numbers.
+4. NARRATIVE SYNERGY: Convert each source into one flowing third-person narrative. NO LISTS allowed.
+5. ANTI-HALLUCINATION: Output only what is present in each source.
+
+# TTS PROSODY LAYER (KOKORO-SAFE)
+- Use commas for natural short pauses.
+- Use ellipses (...) for longer pauses or transitions.
+- Use em dashes (—) to emphasize key ideas.
+- Inside each script, avoid any XML, SSML, or special tags.
+
+# TTS & FORMATTING
+- Clean plain text only.
+- PACING: Max 25 words per sentence, but vary rhythm naturally.
+- Avoid repetitive sentence structures.
+
+# OUTPUT PROTOCOL
+- ONE <final_script> block holding every script
+- Inside it, each script wrapped in <article id="N"></article> with the same id as its source, in source order
+- Write a script for EVERY source
+- No meta-text
+
+SOURCES TO CONDENSE:
+{articles_text}
+
+<final_script>""",
+
+    # Appended to the original rendered prompt, so the whole original request is
+    # a cacheable prefix of the continuation request.
+    "continuation_prompt": """{original_prompt}
+
+# CONTINUATION: YOUR PREVIOUS ANSWER WAS CUT OFF
+Your previous answer stopped before the end of the script. The script written so far is below.
+1. DO NOT REPEAT: Never rewrite or summarize the script so far.
+2. PICK UP EXACTLY: Start with the sentence that follows its last sentence and cover only the remaining material.
+3. SAME RULES: Keep following every rule above (voice, prosody, fidelity, no lists).
+
+# OUTPUT PROTOCOL
+- ONLY the remaining script inside <final_script> tags
+- No meta-text
+
+SCRIPT SO FAR:
+"{partial_script}"
+
+<final_script>""",
+
+    "summary_pyramid_prompt": """# ROLE: Lead Narrative Architect
+# TASK: Distil a finished broadcast script into three shorter versions of itself, from longest to shortest.
+
+# CORE OBJECTIVES
+1. MEDIUM (about {medium_words} words): The whole story in the script's own order, keeping the most important names, numbers and outcomes. If the script is already shorter, repeat it unchanged.
+2. SHORT (about {short_words} words): Two or three sentences with the main point and its most important consequence.
+3. HEADLINE (at most {headline_words} words): One sentence stating what happened.
+4. ANTI-HALLUCINATION: Every version uses only what is present in the script.
+
+# TTS & FORMATTING
+- Clean plain text only, one flowing third-person narrative per version. NO LISTS allowed.
+- PACING: Max 25 words per sentence.
+
+# OUTPUT PROTOCOL
+- ONE <final_script> block holding <medium></medium>, then <short></short>, then <headline></headline>
+- No meta-text
+
+SCRIPT TO DISTIL:
+{script}
+
 <final_script>"""
 }
\ No newline at end of file
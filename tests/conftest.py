@@ -0,0 +1,4 @@
+import os
+
+# llm_models builds its Groq client at import time; tests never call it
+os.environ.setdefault("GROQ_API_KEY", "test")
@@ -0,0 +1,68 @@
+"""Scripted stand-in for a LangChain chat model, for tests that drive llm_calls / condenser_service."""
+
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+_ids = itertools.count()
+
+
+class ProviderError(Exception):
+    """Provider-style exception carrying an HTTP status, like openai.APIStatusError."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeChatModel:
+    """Answers each call with the next scripted response.
+
+    A response is a string (streamed in a few chunks) or an exception
+    instance (raised when the call starts).  The last response repeats once
+    the script runs out.  ``delay`` seconds pass before the first chunk and
+    between chunks; ``closed`` counts streams closed by the caller.
+    """
+
+    def __init__(self, *responses, delay: float = 0.0, chunks: int = 4):
+        self.responses = list(responses)
+        self.delay = delay
+        self.chunks = chunks
+        self.calls = 0
+        self.closed = 0
+        self.max_tokens = None
+        # Own server per instance, so each model gets its own concurrency limiter
+        self.openai_api_base = f"fake://{next(_ids)}"
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            response = self.responses[min(self.calls, len(self.responses) - 1)]
+            self.calls += 1
+        if isinstance(response, BaseException):
+            raise response
+        return response
+
+    def invoke(self, messages):
+        text = self._next()
+        time.sleep(self.delay)
+        return SimpleNamespace(content=text, response_metadata={}, usage_metadata=None)
+
+    def stream(self, messages, **kwargs):
+        text = self._next()
+        size = max(1, len(text) // self.chunks)
+        try:
+            for start in range(0, len(text), size):
+                time.sleep(self.delay)
+                yield SimpleNamespace(content=text[start:start + size], usage_metadata=None)
+            yield SimpleNamespace(
+                content="", usage_metadata={"input_tokens": 100, "output_tokens": len(text) // 4},
+            )
+        finally:
+            self.closed += 1
+
+
+def script(text: str) -> str:
+    """A well-formed model response around ``text``."""
+    return f"<think>notes</think><final_script>{text}</final_script>"
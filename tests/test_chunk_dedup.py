@@ -0,0 +1,42 @@
+from chunk_dedup import dedupe_chunks
+from utils import count_tokens
+
+SPONSOR = "This video is sponsored by NordVPN, the fastest VPN on the planet. "
+BODY = "The lagoon holds back the water until the tide turns and then releases it through turbines. "
+
+
+def _dedupe(*chunks):
+    return dedupe_chunks(list(chunks), 10_000, count_tokens, merge=False)
+
+
+def test_exact_repeat_is_dropped():
+    chunks, stats = _dedupe(SPONSOR + BODY, "Later on. " + SPONSOR)
+
+    assert chunks == [(SPONSOR + BODY).strip(), "Later on."]
+    assert stats["spans_dropped"] == 1
+    assert stats["near_duplicates_dropped"] == 0
+    assert stats["tokens_saved"] > 0
+
+
+def test_reworded_repeat_is_a_near_duplicate():
+    reworded = "This video's sponsored by Nord VPN, the fastest VPN on the planet."
+    chunks, stats = _dedupe(SPONSOR + BODY, reworded)
+
+    assert chunks == [(SPONSOR + BODY).strip()]
+    assert stats["near_duplicates_dropped"] == 1
+
+
+def test_same_template_with_different_facts_is_kept():
+    first = "The turbine produced four megawatts during the spring tide last year."
+    second = "The turbine produced six megawatts during the neap tide this year."
+    chunks, stats = _dedupe(first, second)
+
+    assert chunks == [first, second]
+    assert stats["spans_dropped"] == 0
+
+
+def test_short_sentences_are_never_dropped():
+    chunks, stats = _dedupe("Thanks for watching. " + BODY, "Thanks for watching.")
+
+    assert chunks[-1] == "Thanks for watching."
+    assert stats["spans_dropped"] == 0
@@ -0,0 +1,118 @@
+import threading
+
+from llm_models import AdaptiveConcurrencyLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def _limiter(initial=2, max_limit=8, enabled=True):
+    clock = FakeClock()
+    return AdaptiveConcurrencyLimiter("fake", initial, max_limit, enabled, clock=clock), clock
+
+
+def _round(limiter, clock, calls, seconds=1.0, tokens=100):
+    """``calls`` concurrent calls that each take ``seconds`` and produce ``tokens``."""
+    slots = [limiter.acquire() for _ in range(calls)]
+    clock.advance(seconds)
+    for slot in slots:
+        slot.record(completion_tokens=tokens)
+        limiter.release(slot)
+
+
+def test_slow_start_adds_one_per_saturated_round_up_to_the_max():
+    limiter, clock = _limiter(initial=2, max_limit=4)
+
+    _round(limiter, clock, 1)  # below the limit: no evidence more would fit
+    assert limiter.limit == 2
+    _round(limiter, clock, 2)
+    assert limiter.limit == 3
+    _round(limiter, clock, 3)
+    assert limiter.limit == 4
+    _round(limiter, clock, 4)
+    assert limiter.limit == 4
+    assert limiter.stats()["slow_start"] is True
+
+
+def test_error_halves_the_limit_and_ends_slow_start():
+    limiter, clock = _limiter(initial=4)
+
+    slot = limiter.acquire()
+    clock.advance(1.0)
+    limiter.release(slot, error=True)
+
+    assert limiter.limit == 2
+    assert limiter.stats()["slow_start"] is False
+    # Past slow start the limit grows by 1/limit per saturated call
+    _round(limiter, clock, 2)
+    assert limiter.limit == 2.5
+
+
+def test_latency_spike_halves_the_limit():
+    limiter, clock = _limiter(initial=4)
+    for _ in range(3):
+        _round(limiter, clock, 1, seconds=1.0)
+    assert limiter.stats()["baseline_s_per_token"] is not None
+
+    _round(limiter, clock, 1, seconds=2.5)  # 2.5x the baseline per token
+
+    assert limiter.limit == 2
+    assert limiter.stats()["spikes"] == 1
+
+
+def test_slower_but_larger_call_is_not_a_spike():
+    limiter, clock = _limiter(initial=4)
+    for _ in range(3):
+        _round(limiter, clock, 1, seconds=1.0, tokens=100)
+
+    _round(limiter, clock, 1, seconds=3.0, tokens=400)
+
+    assert limiter.limit == 4
+    assert limiter.stats()["spikes"] == 0
+
+
+def test_only_calls_started_after_the_last_cut_cut_again():
+    limiter, clock = _limiter(initial=4)
+    first, second = limiter.acquire(), limiter.acquire()
+    clock.advance(1.0)
+
+    limiter.release(first, error=True)
+    assert limiter.limit == 2
+    clock.advance(1.0)
+    limiter.release(second, error=True)  # ran alongside the call that cut: no second cut
+    assert limiter.limit == 2
+
+    third = limiter.acquire()
+    clock.advance(1.0)
+    limiter.release(third, error=True)
+    assert limiter.limit == 1
+    assert limiter.stats()["decreases"] == 2
+
+
+def test_disabled_limiter_enforces_a_fixed_limit():
+    limiter, clock = _limiter(initial=2, enabled=False)
+    for _ in range(3):
+        _round(limiter, clock, 2)
+    slot = limiter.acquire()
+    limiter.release(slot, error=True)
+    _round(limiter, clock, 1, seconds=10.0)
+
+    assert limiter.limit == 2
+    stats = limiter.stats()
+    assert stats["increases"] == stats["decreases"] == 0
+    assert stats["calls"] == 8
+
+    held = [limiter.acquire(), limiter.acquire()]
+    cancel = threading.Event()
+    cancel.set()
+    assert limiter.acquire(cancel) is None  # a third call has to wait
+    for slot in held:
+        limiter.release(slot)
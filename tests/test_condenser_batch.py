@@ -0,0 +1,60 @@
+import pytest
+
+import condenser_service
+from condensation_cache import create_checkpoint
+from fake_llm import FakeChatModel, script
+from llm_models import reset_limiters
+
+SOURCES = ["Tidal lagoon approved in Swansea.", "Wave farm opens off Cornwall.", "Grid storage tender launched."]
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(condenser_service, "RETRY_BACKOFF_S", 0.0)
+    reset_limiters()
+
+
+def _articles(*numbered):
+    return "".join(f'<article id="{n}">Script {text}.</article>' for n, text in numbered)
+
+
+def test_split_assigns_each_block_to_its_source():
+    scripts = condenser_service._split_batch_scripts(_articles((2, "two"), (1, "one"), (3, "three")), 3)
+    assert scripts == ["Script one.", "Script two.", "Script three."]
+
+
+def test_split_leaves_missing_and_empty_blocks_to_single_condensation():
+    scripts = condenser_service._split_batch_scripts(_articles((1, "one")) + '<article id="3">  </article>', 3)
+    assert scripts == ["Script one.", None, None]
+
+
+@pytest.mark.parametrize("numbered", [
+    [(0, "one"), (1, "two"), (2, "three")],  # counted from 0: every script would shift by one
+    [(1, "one"), (1, "two"), (3, "three")],  # repeated id
+    [(1, "one"), (2, "two"), (4, "three")],  # id past the last source
+])
+def test_split_distrusts_misnumbered_responses(numbered):
+    assert condenser_service._split_batch_scripts(_articles(*numbered), 3) == [None, None, None]
+
+
+def test_misnumbered_batch_writes_no_checkpoint():
+    model = FakeChatModel(script(_articles((0, "one"), (1, "two"), (2, "three"))))
+    checkpoints = [create_checkpoint(f"https://example.com/{n}", "news", "fake_model") for n in range(3)]
+
+    results = condenser_service.condense_batch(SOURCES, model, "fake_model", checkpoints=checkpoints)
+
+    assert results == [None, None, None]
+    assert all(checkpoint.get("final_output") is None for _, checkpoint in checkpoints)
+
+
+def test_batch_stores_each_script_in_its_own_checkpoint():
+    model = FakeChatModel(script(_articles((1, "one"), (2, "two"), (3, "three"))))
+    checkpoints = [create_checkpoint(f"https://example.com/{n}", "news", "fake_model") for n in range(3)]
+
+    condenser_service.condense_batch(SOURCES, model, "fake_model", checkpoints=checkpoints)
+
+    assert [checkpoint["final_output"] for _, checkpoint in checkpoints] == [
+        "Script one.", "Script two.", "Script three."
+    ]
+    assert all(checkpoint["reduce_stats"]["strategy"] == "batch_single_pass" for _, checkpoint in checkpoints)
@@ -0,0 +1,70 @@
+import pytest
+
+import condenser_service
+from condensation_cache import create_checkpoint
+from fake_llm import FakeChatModel, script
+from llm_models import reset_limiters
+from utils import count_tokens
+
+MAP_OUTPUT = "Tidal power output rose again. " * 13  # ~100 tokens
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(condenser_service, "RETRY_BACKOFF_S", 0.0)
+    monkeypatch.setattr(condenser_service, "REDUCE_STRATEGY", "tree")
+    reset_limiters()
+
+
+def _map_reduce_checkpoint(chunk_count: int):
+    key, checkpoint = create_checkpoint("https://example.com/tides", "news", "fake_model")
+    checkpoint["single_pass"] = False
+    checkpoint["map_chunks"] = [f"Chunk {n} about tidal power." for n in range(chunk_count)]
+    return key, checkpoint
+
+
+def test_tree_node_over_the_token_limit_is_split(monkeypatch):
+    # Two MAP outputs fit the limit, three do not
+    limit = 2 * (count_tokens(MAP_OUTPUT.strip()) + condenser_service.REDUCE_SEPARATOR_TOKENS)
+    monkeypatch.setattr(condenser_service, "reduce_batch_token_limit", lambda model_key: limit)
+    model = FakeChatModel(script(MAP_OUTPUT))
+    key, checkpoint = _map_reduce_checkpoint(4)
+
+    condenser_service.condense_content("unused", model, key, checkpoint, "fake_model")
+
+    nodes = checkpoint["reduce_tree_nodes"]
+    # Node 0 (MAP outputs 1-3) is reduced in two parts; node 1 (output 4) fits
+    assert {"L0:0.0", "L0:0.1", "L0:0", "L0:1"} <= set(nodes)
+    assert nodes["L0:0"] == f"{nodes['L0:0.0']}\n\n{nodes['L0:0.1']}"
+    assert checkpoint["reduce_stats"]["split_nodes"] == ["L0:0"]
+    assert checkpoint["reduce_stats"]["node_token_limit"] == limit
+
+
+def test_tree_nodes_within_the_limit_are_not_split():
+    model = FakeChatModel(script(MAP_OUTPUT))
+    key, checkpoint = _map_reduce_checkpoint(4)
+
+    condenser_service.condense_content("unused", model, key, checkpoint, "fake_model")
+
+    assert set(checkpoint["reduce_tree_nodes"]) == {"L0:0", "L0:1"}
+    assert checkpoint["reduce_stats"]["split_nodes"] == []
+
+
+def test_chained_batch_totals_are_marked_until_the_plan_is_final(monkeypatch):
+    monkeypatch.setattr(condenser_service, "REDUCE_STRATEGY", "chained")
+    # One MAP output per batch: the plan is only complete at the last batch
+    limit = count_tokens(MAP_OUTPUT.strip()) + condenser_service.REDUCE_SEPARATOR_TOKENS
+    monkeypatch.setattr(condenser_service, "reduce_batch_token_limit", lambda model_key: limit)
+    model = FakeChatModel(script(MAP_OUTPUT))
+    key, checkpoint = _map_reduce_checkpoint(4)
+    events = []
+
+    condenser_service.condense_content(
+        "unused", model, key, checkpoint, "fake_model",
+        on_progress=lambda event, payload: events.append(payload) if event == "reduce_batch" else None,
+    )
+
+    assert [event["index"] for event in events] == [0, 1, 2, 3]
+    assert [event["total_estimated"] for event in events] == [True, True, True, False]
+    assert events[-1]["total"] == 4
@@ -0,0 +1,72 @@
+import pytest
+
+import condenser_service
+from condensation_cache import MAX_RETRIES_PER_STEP, create_checkpoint
+from fake_llm import FakeChatModel, ProviderError, script
+from llm_models import reset_limiters
+
+ARTICLE = "A short article about tidal power. " * 20
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # checkpoints and the MAP store go to condensation_cache/
+    monkeypatch.setattr(condenser_service, "RETRY_BACKOFF_S", 0.0)
+    reset_limiters()
+
+
+def _checkpoint():
+    return create_checkpoint("https://example.com/tides", "news", "fake_model")
+
+
+def _condense(model, key, checkpoint):
+    return condenser_service.condense_content(ARTICLE, model, key, checkpoint, "fake_model")
+
+
+def test_step_attempts_leave_budget_for_a_resubmit():
+    assert condenser_service.STEP_ATTEMPTS < MAX_RETRIES_PER_STEP
+    model = FakeChatModel("no tags at all")
+    key, checkpoint = _checkpoint()
+
+    with pytest.raises(ValueError, match="thinking tokens"):
+        _condense(model, key, checkpoint)
+    assert model.calls == condenser_service.STEP_ATTEMPTS
+    assert checkpoint["single_pass_retries"] == condenser_service.STEP_ATTEMPTS
+
+    # A resubmit spends what is left of the persisted budget...
+    with pytest.raises(ValueError):
+        _condense(model, key, checkpoint)
+    assert model.calls == MAX_RETRIES_PER_STEP
+    assert checkpoint["single_pass_retries"] == MAX_RETRIES_PER_STEP
+
+    # ...and the next one fails without calling the model
+    with pytest.raises(ValueError, match="exceeded max retries"):
+        _condense(model, key, checkpoint)
+    assert model.calls == MAX_RETRIES_PER_STEP
+
+
+def test_transient_failure_is_retried_in_process():
+    model = FakeChatModel(RuntimeError("connection reset"), script("Tides turn turbines."))
+    key, checkpoint = _checkpoint()
+
+    assert _condense(model, key, checkpoint) == "Tides turn turbines."
+    assert model.calls == 2
+    assert checkpoint["single_pass_retries"] == 1
+
+
+def test_permanent_provider_error_is_not_retried():
+    model = FakeChatModel(ProviderError(400), script("never reached"))
+    key, checkpoint = _checkpoint()
+
+    with pytest.raises(ValueError, match="HTTP 400"):
+        _condense(model, key, checkpoint)
+    assert model.calls == 1
+    assert checkpoint["single_pass_retries"] == 1
+
+
+def test_run_with_retries_counts_attempts_without_a_budget():
+    outcomes = iter([(None, "no script"), ("done", "")])
+    assert condenser_service._run_with_retries(lambda: next(outcomes), "step") == "done"
+
+    with pytest.raises(ValueError, match="still failing"):
+        condenser_service._run_with_retries(lambda: (None, "still failing"), "step")
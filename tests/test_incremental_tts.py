@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+# kokoro_tts needs torch; skip where the TTS stack is not installed
+incremental_tts = pytest.importorskip("incremental_tts")
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def _tts():
+    return incremental_tts.IncrementalTTS(lambda text: np.zeros(240, dtype=np.float32), "key", {})
+
+
+def test_estimated_total_is_not_kept():
+    tts = _tts()
+    tts.on_progress("reduce_batch", {"index": 0, "total": 2, "total_estimated": True, "text": "One."})
+    assert tts._total is None
+
+    tts.on_progress("reduce_batch", {"index": 1, "total": 3, "total_estimated": True, "text": "Two."})
+    tts.on_progress("reduce_batch", {"index": 2, "total": 3, "total_estimated": False, "text": "Three."})
+
+    assert tts.finish("One.\n\nTwo.\n\nThree.") is not None
+
+
+def test_finish_falls_back_without_a_final_total():
+    tts = _tts()
+    tts.on_progress("reduce_batch", {"index": 0, "total": 1, "total_estimated": True, "text": "One."})
+
+    assert tts.finish("One.") is None
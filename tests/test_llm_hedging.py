@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from condensation_cache import compute_cache_key
+from fake_llm import FakeChatModel, ProviderError, script
+from llm_calls import call_llm_hedged
+
+
+def _hedged(primary, secondary, hedge_after_s, on_loser=None):
+    return call_llm_hedged(
+        primary, secondary, hedge_after_s, "system", "user", stage="map", label="MAP chunk 1/1", on_loser=on_loser,
+    )
+
+
+class _Losers:
+    """on_loser callback that lets a test wait for the loser to be reported."""
+
+    def __init__(self):
+        self.reported = []
+        self.event = threading.Event()
+
+    def __call__(self, role, stats):
+        self.reported.append((role, stats))
+        self.event.set()
+
+
+def test_fast_primary_wins_without_a_hedge():
+    primary = FakeChatModel(script("From the primary."))
+    secondary = FakeChatModel(script("From the hedge."))
+
+    text, result, stats = _hedged(primary, secondary, hedge_after_s=5.0)
+
+    assert result == "From the primary."
+    assert stats["hedge_winner"] == "primary"
+    assert stats["hedged"] is False
+    assert stats["label"] == "MAP chunk 1/1"
+    assert secondary.calls == 0
+
+
+def test_slow_primary_is_cancelled_when_the_hedge_wins():
+    primary = FakeChatModel(script("From the primary, slowly."), delay=0.3)
+    secondary = FakeChatModel(script("From the hedge."))
+    losers = _Losers()
+
+    text, result, stats = _hedged(primary, secondary, hedge_after_s=0.05, on_loser=losers)
+
+    assert result == "From the hedge."
+    assert stats["hedge_winner"] == "hedge"
+    assert stats["hedge_reason"] == "slow"
+    # The primary stops at its next chunk and its tokens are reported
+    assert losers.event.wait(5.0)
+    [(role, loser)] = losers.reported
+    assert role == "primary"
+    assert loser["cancelled"] is True
+    assert loser["prompt_tokens"] > 0
+    assert primary.closed == 1
+
+
+def test_failing_primary_fires_the_hedge_immediately():
+    primary = FakeChatModel(ProviderError(503))
+    secondary = FakeChatModel(script("From the hedge."))
+
+    started = time.perf_counter()
+    text, result, stats = _hedged(primary, secondary, hedge_after_s=30.0)
+
+    assert time.perf_counter() - started < 5.0
+    assert result == "From the hedge."
+    assert stats["hedge_winner"] == "hedge"
+    assert stats["hedge_reason"] == "primary_failed"
+
+
+def test_primary_without_a_script_is_reported_as_the_loser():
+    primary = FakeChatModel("An answer without tags.")
+    secondary = FakeChatModel(script("From the hedge."))
+    losers = _Losers()
+
+    text, result, stats = _hedged(primary, secondary, hedge_after_s=30.0, on_loser=losers)
+
+    assert result == "From the hedge."
+    assert losers.event.wait(5.0)
+    [(role, loser)] = losers.reported
+    assert role == "primary"
+    assert loser["cancelled"] is False
+    assert loser["prompt_tokens"] == 100
+
+
+def test_first_finished_response_is_the_fallback_without_a_script():
+    primary = FakeChatModel("Primary without tags.")
+    secondary = FakeChatModel(ProviderError(500))
+
+    text, result, stats = _hedged(primary, secondary, hedge_after_s=30.0)
+
+    assert result is None
+    assert text == "Primary without tags."
+    assert stats["hedge_winner"] == "primary"
+    assert stats["hedged"] is True
+
+
+def test_primary_error_propagates_when_both_fail():
+    primary = FakeChatModel(ProviderError(500))
+    secondary = FakeChatModel(ProviderError(502))
+
+    with pytest.raises(ProviderError) as excinfo:
+        _hedged(primary, secondary, hedge_after_s=30.0)
+    assert excinfo.value.status_code == 500
+
+
+def test_hedge_model_is_not_part_of_the_cache_key():
+    url = "https://example.com/tides"
+    plain = compute_cache_key(url, "news", "local", stage_models={"map": "local", "map_hedge": None})
+    hedged = compute_cache_key(url, "news", "local", stage_models={"map": "local", "map_hedge": "groq_llm"})
+    routed = compute_cache_key(url, "news", "local", stage_models={"map": "groq_llm", "map_hedge": None})
+
+    assert hedged == plain
+    assert routed != plain
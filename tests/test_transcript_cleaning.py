@@ -0,0 +1,28 @@
+from transcript_cleaning import clean_transcript
+
+
+def _clean(text: str) -> str:
+    return clean_transcript(text, lambda t: (len(t) + 3) // 4)[0]
+
+
+def test_legitimate_repeats_survive():
+    text = (
+        "I think that that is true. He had had enough. It is very very hot. "
+        "New York New York is a song. Bye bye now"
+    )
+    assert _clean(text) == text
+
+
+def test_stutters_and_tripled_words_collapse():
+    assert _clean("the the cat sat. I I think it works works works.") == "the cat sat. I think it works."
+
+
+def test_rolling_caption_line_keeps_first_copy():
+    assert _clean("So today we're So today we're going to talk") == "So today we're going to talk"
+
+
+def test_cues_and_fillers_removed():
+    cleaned, stats = clean_transcript("[Music] um so uh we start (laughs) now ♪", lambda t: len(t))
+    assert cleaned == "so we start now"
+    assert stats["cues_removed"] == 2
+    assert stats["fillers_removed"] == 2
@@ -0,0 +1,72 @@
+import llm_calls
+from fake_llm import FakeChatModel
+from llm_calls import call_llm
+from utils import FinalScriptExtractor, remove_thinking_tokens
+
+TWO_BLOCKS = (
+    "<think>Draft: <final_script>not this</final_script></think>\n"
+    "<final_script>\nFirst script.\n</final_script>\n"
+    "Let me restate it.\n"
+    "<final_script>Second script.</final_script>"
+)
+
+# A model that drafts, then revises in a second block
+DRAFT_THEN_REVISION = (
+    "<think>plan</think>\n"
+    "<final_script>Draft script.</final_script>\n"
+    "Wait, the draft misses the date. Revised:\n"
+    "<final_script>Revised script.</final_script>"
+)
+
+
+def _stream(text: str, chunk_size: int) -> FinalScriptExtractor:
+    extractor = FinalScriptExtractor()
+    for i in range(0, len(text), chunk_size):
+        extractor.feed(text[i:i + chunk_size])
+    return extractor
+
+
+def test_two_blocks_use_the_first_outside_think():
+    script, found = remove_thinking_tokens(TWO_BLOCKS)
+    assert found
+    assert script == "First script."
+
+
+def test_streamed_and_full_text_extraction_agree():
+    script, _ = remove_thinking_tokens(TWO_BLOCKS)
+    for chunk_size in (1, 3, 7, len(TWO_BLOCKS)):
+        extractor = _stream(TWO_BLOCKS, chunk_size)
+        assert extractor.complete
+        assert extractor.text == script
+
+
+def test_draft_then_revision_keeps_the_draft_on_both_paths():
+    script, found = remove_thinking_tokens(DRAFT_THEN_REVISION)
+    assert found
+    assert script == "Draft script."
+    for chunk_size in (1, 5, len(DRAFT_THEN_REVISION)):
+        assert _stream(DRAFT_THEN_REVISION, chunk_size).text == "Draft script."
+
+
+def test_streamed_call_stops_before_the_revision(monkeypatch):
+    # Why the first block wins: early stop closes the stream at the first
+    # </final_script>, so a streamed call never receives the revised block
+    monkeypatch.setattr(llm_calls, "STREAM_CALLS", True)
+    monkeypatch.setattr(llm_calls, "EARLY_STOP", True)
+    model = FakeChatModel(DRAFT_THEN_REVISION, chunks=len(DRAFT_THEN_REVISION))
+    text, script, stats = call_llm(model, "system", "user", stage="chat")
+    assert stats["stopped_early"]
+    assert "Revised" not in text
+    assert script == remove_thinking_tokens(DRAFT_THEN_REVISION)[0]
+
+
+def test_unclosed_think_falls_back_to_first_block():
+    script, found = remove_thinking_tokens(
+        "<think>reasoning <final_script>A</final_script> more <final_script>B</final_script>"
+    )
+    assert found
+    assert script == "A"
+
+
+def test_missing_tags_return_text():
+    assert remove_thinking_tokens("  plain answer  ") == ("plain answer", False)
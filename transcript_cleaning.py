@@ -0,0 +1,155 @@
+"""
+Transcript pre-cleaning ahead of split_content().
+
+get_youtube_transcript() joins raw caption snippets and Whisper output has
+the same habits, so a transcript carries text that is pure cost for the
+condenser: non-speech cues ("[Music]", "[Applause]", "(laughs)", ♪), filler
+words ("um", "uh"), stutters ("the the") and the duplicated caption lines of
+rolling auto-captions ("so today we're so today we're going to").  Every
+removed token is a token no MAP (or single-pass) call has to prefill.  The
+stage runs on YouTube content before the single-pass decision when
+CONDENSER_TRANSCRIPT_CLEANING is on (the default).
+
+Method:
+  * Cues and fillers are removed with regexes.
+  * Repeats are found on the word sequence: words are mapped to integer ids
+    (lowercased, punctuation stripped) and, for every span length k from
+    MAX_REPEAT_WORDS down to 1, ``ids[:-k] == ids[k:]`` marks the words equal
+    to the word k positions later.  A run of r >= k such marks is a span
+    repeated back to back; the (r // k) * k words after its first copy are
+    dropped, so the first copy (and its capitalisation) is kept.  The
+    comparison, run detection and removal are NumPy array operations, so a
+    pass costs O(words) whatever the number of repeats.
+  * Speech repeats short spans on purpose ("that that", "very very",
+    "New York New York"), so spans shorter than MIN_LINE_REPEAT_WORDS are only
+    collapsed from three copies on — except a doubled STUTTER_WORDS word
+    ("the the", "I I"), which is never meant.
+"""
+
+import os
+import re
+import time
+from typing import Callable
+
+import numpy as np
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+TRANSCRIPT_CLEANING = os.getenv("CONDENSER_TRANSCRIPT_CLEANING", "1") != "0"
+MAX_REPEAT_WORDS = 12   # longest back-to-back repeat looked for (one rolling caption line)
+MIN_LINE_REPEAT_WORDS = 3  # shorter spans need three copies to count as a repeat
+# Words whose doubling is a stutter rather than speech ("had had", "that that" are speech)
+STUTTER_WORDS = frozenset({"i", "i'm", "it's", "the", "a", "an", "and", "but", "so", "we", "my"})
+
+# Bracketed caption cues; captions use brackets only for non-speech, "[ __ ]" is a bleeped word
+_BRACKET_CUE = re.compile(r"\[[^\[\]\n]{0,40}\]")
+# Parenthesised cues as Whisper writes them
+_PAREN_CUE = re.compile(
+    r"\((?:music|applause|laughter|laughs|laughing|inaudible|cheering|cheers|silence|crosstalk|"
+    r"sighs|coughs|foreign|upbeat music|dramatic music)[^()\n]{0,20}\)",
+    re.IGNORECASE,
+)
+_MUSIC_NOTES = re.compile(r"[♪♫]+")
+_SPEAKER_CHANGE = re.compile(r"(?:^|\s)>>+(?=\s)")
+_FILLER = re.compile(r"\b(?:u+m+|u+h+|uhm+|e+r+m+|hm+|mm+-?hmm+)\b[,.]?", re.IGNORECASE)
+_WHITESPACE = re.compile(r"[ \t]+")
+_SPACE_BEFORE_PUNCT = re.compile(r" +([,.!?;:])")
+_NON_WORD = re.compile(r"[^\w']+")
+_TRAILING_PUNCT = re.compile(r"[,.!?;:]+$")
+
+
+def _remove_repeats(words: list[str]) -> tuple[list[str], int]:
+    """Collapse back-to-back repeated spans of up to MAX_REPEAT_WORDS words to their first copy.
+
+    Returns (words, words_removed).
+    """
+    if len(words) < 2:
+        return words, 0
+    vocabulary: dict[str, int] = {}
+    ids = np.fromiter(
+        (vocabulary.setdefault(_NON_WORD.sub("", word.lower()) or word, len(vocabulary)) for word in words),
+        dtype=np.int64, count=len(words),
+    )
+    keep_words = np.asarray(words, dtype=object)
+    removed = 0
+    for k in range(min(MAX_REPEAT_WORDS, len(ids) // 2), 0, -1):
+        same = ids[:-k] == ids[k:]
+        if not same.any():
+            continue
+        # Runs of equal-to-k-later marks: starts / ends from the edges of the padded mask
+        edges = np.diff(np.concatenate(([0], same.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        lengths = np.flatnonzero(edges == -1) - starts
+        extra_copies = lengths // k
+        if k >= MIN_LINE_REPEAT_WORDS:
+            collapse = extra_copies >= 1
+        else:
+            collapse = extra_copies >= 2
+            if k == 1:
+                stutter_ids = [vocabulary[word] for word in STUTTER_WORDS if word in vocabulary]
+                collapse |= (extra_copies == 1) & np.isin(ids[starts], stutter_ids)
+        starts, drop_counts = starts[collapse] + k, extra_copies[collapse] * k
+        if not len(starts):
+            continue
+        # The kept copy ends the sentence if the dropped copies did ("works works." -> "works.")
+        for last_kept, last_dropped in zip(starts - 1, starts + drop_counts - 1):
+            ending = _TRAILING_PUNCT.search(keep_words[last_dropped])
+            if ending:
+                keep_words[last_kept] = _TRAILING_PUNCT.sub("", keep_words[last_kept]) + ending.group()
+        # Mark [start, start + drop) after each run's first copy with a difference array
+        delta = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.add.at(delta, starts, 1)
+        np.add.at(delta, starts + drop_counts, -1)
+        keep = np.cumsum(delta[:-1]) == 0
+        removed += int(len(ids) - keep.sum())
+        ids, keep_words = ids[keep], keep_words[keep]
+    return keep_words.tolist(), removed
+
+
+def clean_transcript(text: str, count_tokens: Callable[[str], int]) -> tuple[str, dict]:
+    """Strip caption cues, fillers, stutters and duplicated caption lines from ``text``.
+
+    Paragraph breaks are kept; each paragraph is cleaned on its own.
+
+    Returns:
+        (cleaned_text, stats) — stats holds chars / tokens before and after,
+        ``tokens_saved``, the number of cues, fillers and repeated words
+        removed, and ``elapsed_s``.
+    """
+    started = time.perf_counter()
+    cues = 0
+    fillers = 0
+    repeated = 0
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph, n = _BRACKET_CUE.subn(" ", paragraph)
+        cues += n
+        paragraph, n = _PAREN_CUE.subn(" ", paragraph)
+        cues += n
+        paragraph = _MUSIC_NOTES.sub(" ", paragraph)
+        paragraph = _SPEAKER_CHANGE.sub(" ", paragraph)
+        paragraph, n = _FILLER.subn(" ", paragraph)
+        fillers += n
+        words, n = _remove_repeats(paragraph.split())
+        repeated += n
+        paragraph = _SPACE_BEFORE_PUNCT.sub(r"\1", _WHITESPACE.sub(" ", " ".join(words))).strip()
+        if paragraph:
+            paragraphs.append(paragraph)
+    cleaned = "\n\n".join(paragraphs)
+
+    tokens_before = count_tokens(text)
+    tokens_after = count_tokens(cleaned)
+    stats = {
+        "chars_before": len(text),
+        "chars_after": len(cleaned),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "cues_removed": cues,
+        "fillers_removed": fillers,
+        "repeated_words_removed": repeated,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+    return cleaned, stats
@@ -5,13 +5,55 @@ from pathlib import Path
 from typing import List, Optional
 
 
+_TOKEN_ENCODING = "cl100k_base"
+_OPEN_TAG = '<final_script>'
+_CLOSE_TAG = '</final_script>'
+_THINK_OPEN_TAG = '<think>'
+_THINK_CLOSE_TAG = '</think>'
+_PREVIEW_CHARS = 500  # head / tail of a tagless response shown in the failure log
+_encoder = None
+_encoder_unavailable = False
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text using tiktoken's cl100k_base encoding.
+
+    cl100k_base is not any local model's exact tokenizer, but it tracks Qwen /
+    Gemma / Mistral BPE counts closely enough for budgeting.  If tiktoken or its
+    encoding file is unavailable (e.g. offline first run), falls back to the
+    usual ~4 chars per token estimate so callers never fail on counting.
+    """
+    global _encoder, _encoder_unavailable
+    if not text:
+        return 0
+    if _encoder is None and not _encoder_unavailable:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(_TOKEN_ENCODING)
+        except Exception as e:
+            _encoder_unavailable = True
+            print(f"[WARNING] count_tokens: tiktoken unavailable ({e}); estimating 4 chars per token")
+    if _encoder is not None:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
 def remove_thinking_tokens(text: str) -> tuple[str, bool]:
     """
     Extract final script from LLM response by finding content within <final_script> tags.
     
     The LLM returns the final cleaned output wrapped in <final_script></final_script> tags.
-    This function extracts only the content between the LAST opening and LAST closing tag,
-    discarding all reasoning, thinking tokens, and other artifacts.
+    This function extracts the content of the FIRST complete <final_script> block outside
+    <think>, discarding all reasoning, thinking tokens, and other artifacts.  It applies the
+    same rule as FinalScriptExtractor, so streamed and non-streamed responses (/streamChat
+    and /chat, streamed and invoked condenser calls) yield the same script.  If a <think>
+    block is never closed, the first complete <final_script> block anywhere is used.
+
+    The first block wins even when the model revises a draft in a later block:
+    every prompt asks for a single block, and streamed calls stop at the first
+    </final_script> (llm_calls.EARLY_STOP), so the streaming path never sees a
+    revision.  Taking the last block here would make /chat and /streamChat
+    disagree on exactly those responses.
 
     Args:
         text: Raw LLM response text containing <final_script> tags
@@ -26,27 +68,137 @@ def remove_thinking_tokens(text: str) -> tuple[str, bool]:
     print(f"[DEBUG] remove_thinking_tokens: Processing {len(text)} characters")
     original_length = len(text)
 
-    # Find the last occurrence of opening and closing tags
-    opening_tag = '<final_script>'
-    closing_tag = '</final_script>'
-    
-    last_open_index = text.lower().rfind(opening_tag.lower())
-    last_close_index = text.lower().rfind(closing_tag.lower())
-    
-    if last_open_index != -1 and last_close_index != -1 and last_close_index > last_open_index:
-        # Extract content between last opening tag and last closing tag
-        start_pos = last_open_index + len(opening_tag)
-        final_content = text[start_pos:last_close_index].strip()
-        
-        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Found <final_script> tags, extracting content from last occurrence")
+    extractor = FinalScriptExtractor()
+    extractor.feed(text)
+    final_content = extractor.text if extractor.complete else None
+    if final_content is None:
+        # Unclosed <think>: fall back to the first complete block anywhere (lowercase once)
+        lower_text = text.lower()
+        open_index = lower_text.find(_OPEN_TAG)
+        close_index = lower_text.find(_CLOSE_TAG, open_index + len(_OPEN_TAG)) if open_index != -1 else -1
+        if close_index != -1:
+            final_content = text[open_index + len(_OPEN_TAG):close_index].strip()
+
+    if final_content is not None:
+        print(f"[INFO] [{datetime.now().strftime('%H:%M:%S')}] Found <final_script> tags, extracting content from first occurrence")
         print(f"[CLEANUP] Extracted {len(final_content)} chars from final_script tag (removed {original_length - len(final_content)} chars)")
         return final_content, True
     else:
         print("[WARNING] No valid <final_script> tags found, thinking tokens not properly removed")
-        print(f"[DEBUG] Original text content:\n{text}")
+        preview = text if len(text) <= 2 * _PREVIEW_CHARS else f"{text[:_PREVIEW_CHARS]}\n[... {len(text) - 2 * _PREVIEW_CHARS} chars omitted ...]\n{text[-_PREVIEW_CHARS:]}"
+        print(f"[DEBUG] Original text content ({len(text)} chars):\n{preview}")
         return text.strip(), False
 
 
+def _partial_tag_length(text: str, tags: tuple[str, ...]) -> int:
+    """Length of the longest suffix of ``text`` that could be the start of one of ``tags``."""
+    longest = 0
+    for tag in tags:
+        for size in range(min(len(tag) - 1, len(text)), longest, -1):
+            if text[-size:].lower() == tag[:size]:
+                longest = size
+                break
+    return longest
+
+
+class FinalScriptExtractor:
+    """Incremental <final_script> extractor for streamed LLM output.
+
+    A small state machine fed chunk by chunk: text inside <think>…</think> and
+    anything outside the tags is skipped, and the content of the first
+    <final_script> block outside <think> is returned by feed() as it arrives.
+    Tags are matched case-insensitively and may be split across chunks; only a
+    tag-sized tail is held back, so memory beyond the extracted text is O(1).
+    ``complete`` turns True at </final_script> — the rest of the generation can
+    be cancelled.
+    """
+
+    _OUTSIDE, _IN_THINK, _IN_SCRIPT = range(3)
+    _OUTSIDE_TAGS = re.compile(f"({re.escape(_OPEN_TAG)})|{re.escape(_THINK_OPEN_TAG)}", re.IGNORECASE)
+    _THINK_END = re.compile(re.escape(_THINK_CLOSE_TAG), re.IGNORECASE)
+    _SCRIPT_END = re.compile(re.escape(_CLOSE_TAG), re.IGNORECASE)
+
+    def __init__(self):
+        self._state = self._OUTSIDE
+        self._pending = ""
+        self._parts: list[str] = []
+        self.started = False
+        self.complete = False
+
+    @property
+    def text(self) -> str:
+        """Extracted script so far, stripped like remove_thinking_tokens() output."""
+        return "".join(self._parts).strip()
+
+    def _hold_back(self, buffer: str, tags: tuple[str, ...]) -> str:
+        """Keep a possible partial tag at the end of ``buffer`` for the next chunk; return the rest."""
+        keep = _partial_tag_length(buffer, tags)
+        self._pending = buffer[len(buffer) - keep:] if keep else ""
+        return buffer[:len(buffer) - keep]
+
+    def feed(self, chunk: str) -> str:
+        """Consume one chunk; return the newly available script text (may be empty)."""
+        if self.complete or not chunk:
+            return ""
+        buffer = self._pending + chunk
+        self._pending = ""
+        emitted = ""
+        while buffer:
+            if self._state == self._OUTSIDE:
+                match = self._OUTSIDE_TAGS.search(buffer)
+                if match is None:
+                    self._hold_back(buffer, (_OPEN_TAG, _THINK_OPEN_TAG))
+                    break
+                if match.group(1):
+                    self._state = self._IN_SCRIPT
+                    self.started = True
+                else:
+                    self._state = self._IN_THINK
+                buffer = buffer[match.end():]
+            elif self._state == self._IN_THINK:
+                match = self._THINK_END.search(buffer)
+                if match is None:
+                    self._hold_back(buffer, (_THINK_CLOSE_TAG,))
+                    break
+                self._state = self._OUTSIDE
+                buffer = buffer[match.end():]
+            else:
+                match = self._SCRIPT_END.search(buffer)
+                if match is None:
+                    emitted += self._hold_back(buffer, (_CLOSE_TAG,))
+                    break
+                emitted += buffer[:match.start()]
+                self.complete = True
+                break
+        if emitted and not self._parts:
+            emitted = emitted.lstrip()
+        if emitted:
+            self._parts.append(emitted)
+        return emitted
+
+
+_SENTENCE_END = re.compile(r"[.!?…][\"'”’)]*(?=\s)")
+
+
+def truncated_script(text: str) -> Optional[str]:
+    """Script text of a response cut off inside its <final_script> block, else None.
+
+    Returns None when the block is complete (remove_thinking_tokens() handles
+    it), never opened, or the generation stopped inside <think>.  A trailing
+    partial sentence is dropped so a continuation can start cleanly on the
+    next sentence; if the text has no sentence boundary it is returned whole.
+    """
+    extractor = FinalScriptExtractor()
+    extractor.feed(text or "")
+    if not extractor.started or extractor.complete:
+        return None
+    script = extractor.text
+    boundaries = list(_SENTENCE_END.finditer(script + " "))
+    if boundaries:
+        script = script[:boundaries[-1].end()]
+    return script.strip() or None
+
+
 def create_backup_file(url: str, content: str, audio_file_path: str, category: str = 'tech') -> str:
     """
     Create a backup file for content and audio when Telegram sending fails.